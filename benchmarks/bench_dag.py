@@ -0,0 +1,59 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from models.parsing_data_models import LogEntry, LogChain
+from utilz.graph_generator import GraphGenerator
+
+"""Benchmark DAG construction for increasing log sizes.
+
+Usage: python benchmarks/bench_dag.py [--sizes 1000 10000 100000] [--dense-limit 2000]
+"""
+
+def make_log_chain(size: int, seed: int = 0) -> LogChain:
+    rng = random.Random(seed)
+    start = datetime(2024, 3, 20, 10, 0, 0)
+    entries = []
+    for i in range(size):
+        # Slightly shuffled, bursty timestamps, as produced by several writers
+        ts = start + timedelta(milliseconds=i * 5 + rng.randint(-20, 20))
+        entries.append(LogEntry(
+            timestamp=ts.isoformat(timespec="milliseconds"),
+            message=f"request {i} handled in {rng.randint(1, 500)}ms",
+            request_id=f"req-{rng.randint(0, size // 20)}",
+            level=rng.choice(["INFO", "INFO", "INFO", "WARNING", "ERROR"]),
+            component=rng.choice(["app", "db", "auth", "cache"]),
+        ))
+    return LogChain(log_chain=entries)
+
+def run(size: int, mode: str) -> dict:
+    log_chain = make_log_chain(size)
+    started = time.perf_counter()
+    dag = GraphGenerator(log_chain, mode=mode).generate_dag()
+    elapsed = time.perf_counter() - started
+    edges = sum(len(node.children) for node in dag.nodes)
+    doc_bytes = len(dag.model_dump_json())
+    return {"size": size, "mode": mode, "seconds": elapsed, "edges": edges, "doc_mb": doc_bytes / 1e6}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GraphGenerator DAG construction")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--dense-limit", type=int, default=2_000,
+                        help="largest size to run in the O(n^2) dense compatibility mode")
+    args = parser.parse_args()
+
+    print(f"{'nodes':>8} {'mode':>10} {'seconds':>10} {'edges':>12} {'doc MB':>8}")
+    for size in args.sizes:
+        for mode in ("correlated", "chain", "dense"):
+            if mode == "dense" and size > args.dense_limit:
+                print(f"{size:>8} {mode:>10} {'skipped':>10}")
+                continue
+            result = run(size, mode)
+            print(f"{result['size']:>8} {result['mode']:>10} {result['seconds']:>10.3f} "
+                  f"{result['edges']:>12} {result['doc_mb']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
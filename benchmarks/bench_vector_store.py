@@ -0,0 +1,101 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
+import tempfile
+import argparse
+import numpy as np
+import chromadb
+from core.vector_store import LocalVectorStore
+
+"""Benchmark the local vector store (exact and IVF) against Chroma on synthetic embeddings.
+
+Usage: python benchmarks/bench_vector_store.py [--sizes 10000 100000] [--dim 768] [--queries 200]
+                                               [--chroma-host localhost --chroma-port 8000]
+
+Without --chroma-host, Chroma runs in-process (EphemeralClient), which excludes HTTP overhead and
+therefore understates the cost of the server deployment.
+"""
+
+def make_corpus(size: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    # Clustered vectors resemble real embeddings better than uniform noise
+    centers = rng.normal(size=(max(1, size // 200), dim))
+    vectors = centers[rng.integers(0, len(centers), size=size)] + rng.normal(scale=0.3, size=(size, dim))
+    return vectors.astype(np.float32)
+
+def time_queries(query_fn, queries: np.ndarray, k: int) -> tuple:
+    latencies = []
+    ids = []
+    for query in queries:
+        started = time.perf_counter()
+        ids.append(query_fn(query, k))
+        latencies.append(time.perf_counter() - started)
+    return np.percentile(latencies, 50) * 1000, np.percentile(latencies, 95) * 1000, ids
+
+def recall(found: list, exact: list) -> float:
+    return float(np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, exact)]))
+
+def run(size: int, dim: int, n_queries: int, k: int, chroma_client) -> list:
+    corpus = make_corpus(size, dim)
+    ids = [str(i) for i in range(size)]
+    queries = corpus[np.random.default_rng(1).choice(size, n_queries, replace=False)] + 0.05
+    rows = []
+
+    exact = None
+    for backend, threshold in (("local-exact", size + 1), ("local-ivf", 1)):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = LocalVectorStore(tmp_dir, ivf_threshold=threshold)
+            started = time.perf_counter()
+            for start in range(0, size, 5000):
+                store.upsert(ids=ids[start:start + 5000], embeddings=corpus[start:start + 5000])
+            # Include the IVF build in ingest time
+            store.query(query_embeddings=queries[:1], n_results=k, include=[])
+            ingest = time.perf_counter() - started
+            p50, p95, found = time_queries(
+                lambda q, n: store.query(query_embeddings=[q], n_results=n, include=[])["ids"][0], queries, k)
+            exact = exact or found
+            rows.append((size, backend, ingest, p50, p95, recall(found, exact)))
+            store.close()
+
+    if chroma_client is not None:
+        name = f"bench_{size}"
+        try:
+            chroma_client.delete_collection(name)
+        except Exception:
+            pass
+        collection = chroma_client.create_collection(name, metadata={"hnsw:space": "cosine"}, embedding_function=None)
+        started = time.perf_counter()
+        batch = 5000
+        for start in range(0, size, batch):
+            collection.add(ids=ids[start:start + batch], embeddings=corpus[start:start + batch])
+        ingest = time.perf_counter() - started
+        p50, p95, found = time_queries(
+            lambda q, n: collection.query(query_embeddings=[q.tolist()], n_results=n, include=[])["ids"][0], queries, k)
+        rows.append((size, "chroma", ingest, p50, p95, recall(found, exact)))
+        chroma_client.delete_collection(name)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vector store backends")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--chroma-host", default=None)
+    parser.add_argument("--chroma-port", type=int, default=8000)
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args()
+
+    chroma_client = None
+    if not args.skip_chroma:
+        chroma_client = chromadb.HttpClient(host=args.chroma_host, port=args.chroma_port) \
+            if args.chroma_host else chromadb.EphemeralClient()
+
+    print(f"{'vectors':>8} {'backend':>12} {'ingest s':>9} {'p50 ms':>8} {'p95 ms':>8} {'recall@k':>9}")
+    for size in args.sizes:
+        for row in run(size, args.dim, args.queries, args.k, chroma_client):
+            print(f"{row[0]:>8} {row[1]:>12} {row[2]:>9.2f} {row[3]:>8.2f} {row[4]:>8.2f} {row[5]:>9.3f}")
+
+if __name__ == "__main__":
+    main()
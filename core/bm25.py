@@ -0,0 +1,117 @@
+import re
+import math
+import threading
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+"""Inverted-index BM25 retrieval and reciprocal-rank fusion with vector search results"""
+
+# Identifier-like tokens stay whole (ERR_CONN_REFUSED, java.lang.NullPointerException, E1234, 10.0.0.1)
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+(?:[.\-:/][A-Za-z0-9_]+)*")
+SUBTOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased compound tokens plus their parts, so 'db.ConnectionError' also matches 'ConnectionError'"""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group(0)
+        tokens.append(token)
+        parts = SUBTOKEN_PATTERN.findall(token)
+        if len(parts) > 1 or (parts and parts[0] != token):
+            tokens.extend(parts)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: score(d) = sum over lists of 1 / (k + rank of d)"""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """In-memory Okapi BM25 over chunk texts, keyed by chunk id"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.doc_lengths: Dict[str, int] = {}
+        self.documents: Dict[str, Tuple[str, Optional[dict]]] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str], metadatas: Optional[Sequence[Optional[dict]]] = None) -> None:
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+        with self._lock:
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                if doc_id in self.doc_lengths:
+                    self._remove(doc_id)
+                counts = Counter(tokenize(text))
+                for term, count in counts.items():
+                    self.postings[term][doc_id] = count
+                length = sum(counts.values())
+                self.doc_lengths[doc_id] = length
+                self._total_length += length
+                self.documents[doc_id] = (text, metadata)
+
+    def remove(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for doc_id in ids:
+                if doc_id in self.doc_lengths:
+                    self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        text, _ = self.documents.pop(doc_id)
+        for term in set(tokenize(text)):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+        self._total_length -= self.doc_lengths.pop(doc_id)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        with self._lock:
+            n_docs = len(self.doc_lengths)
+            if not n_docs:
+                return []
+            avg_length = self._total_length / n_docs
+            scores: Dict[str, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+_lock = threading.Lock()
+_indexes: Dict[str, BM25Index] = {}
+
+
+def get_index(key: str, loader: Optional[Callable[[BM25Index], None]] = None) -> BM25Index:
+    """Process-wide index per collection; loader fills a new index from the vector store on first use"""
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            return index
+        index = BM25Index()
+        if loader is not None:
+            loader(index)
+        _indexes[key] = index
+        return index
+
+
+def clear() -> None:
+    with _lock:
+        _indexes.clear()
@@ -0,0 +1,92 @@
+import threading
+import chromadb
+from typing import Dict, Optional, Tuple
+from chromadb.utils.embedding_functions import OllamaEmbeddingFunction
+from core.embedding_cache import CachedEmbeddingFunction
+
+"""Process-wide registry of Chroma HTTP clients and collection handles"""
+
+CHROMA_HOST = "localhost"
+CHROMA_PORT = 8000
+KEEPALIVE_SECS = 60.0
+MAX_KEEPALIVE_CONNECTIONS = 16
+
+_lock = threading.RLock()
+_clients: Dict[Tuple[str, int], object] = {}
+_validated: set = set()
+# (client id, collection name, embedding function id) -> (client, embedding function, collection);
+# the stored client and function keep the ids in the key from being reused
+_collections: Dict[Tuple[int, str, int], tuple] = {}
+_embedding_functions: Dict[tuple, tuple] = {}
+
+
+def get_client(host: str = CHROMA_HOST, port: int = CHROMA_PORT, validate: bool = False):
+    """Shared HttpClient for host:port; its httpx session keeps connections alive between requests"""
+    key = (host, port)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = chromadb.HttpClient(
+                host=host,
+                port=port,
+                settings=chromadb.Settings(
+                    persist_directory="/chroma/data",
+                    is_persistent=True,
+                    chroma_http_keepalive_secs=KEEPALIVE_SECS,
+                    chroma_http_max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                )
+            )
+            _clients[key] = client
+        if validate and key not in _validated:
+            # One heartbeat per client per process instead of one per handler
+            client.heartbeat()
+            _validated.add(key)
+        return client
+
+
+def get_embedding_function(model_name: str, url: str, cache=None):
+    """Shared Ollama embedding function, wrapped with the embedding cache when one is given"""
+    key = (model_name, url, id(cache))
+    with _lock:
+        cached = _embedding_functions.get(key)
+        if cached is None:
+            ef = OllamaEmbeddingFunction(model_name=model_name, url=url)
+            if cache is not None:
+                ef = CachedEmbeddingFunction(ef, cache)
+            cached = _embedding_functions[key] = (cache, ef)
+        return cached[1]
+
+
+def get_collection(client, name: str, embedding_function=None):
+    """Cached collection handle; only the first lookup per process talks to the server"""
+    key = (id(client), name, id(embedding_function))
+    with _lock:
+        cached = _collections.get(key)
+        if cached is not None:
+            return cached[2]
+    collection = client.get_or_create_collection(name=name, embedding_function=embedding_function)
+    with _lock:
+        _collections[key] = (client, embedding_function, collection)
+    return collection
+
+
+def invalidate(client=None, name: Optional[str] = None) -> None:
+    """Forget cached collections (all, one client's, or one name) so the next lookup re-resolves them"""
+    with _lock:
+        for key in list(_collections):
+            client_id, collection_name, _ = key
+            if (client is None or client_id == id(client)) and (name is None or collection_name == name):
+                del _collections[key]
+        if client is not None:
+            for client_key, cached_client in list(_clients.items()):
+                if cached_client is client:
+                    _validated.discard(client_key)
+
+
+def clear() -> None:
+    """Drop every cached client and collection"""
+    with _lock:
+        _clients.clear()
+        _validated.clear()
+        _collections.clear()
+        _embedding_functions.clear()
@@ -0,0 +1,88 @@
+from typing import Dict, List, Optional, Sequence
+from core.tokenizer import estimate_tokens, CHARS_PER_TOKEN
+from core.templates import infer_level, mask_variables
+
+"""Shrink a causal chain to a token budget before it is placed in an LLM prompt"""
+
+SEVERITY_RANK = {
+    "FATAL": 5, "CRITICAL": 5, "EMERGENCY": 5, "ALERT": 5,
+    "ERROR": 4, "ERR": 4, "SEVERE": 4,
+    "WARNING": 3, "WARN": 3,
+    "NOTICE": 2, "INFO": 2,
+    "DEBUG": 1, "TRACE": 1, "FINE": 1,
+}
+OMITTED_NOTE = "... {count} lower-priority log entries omitted"
+
+
+def severity_of(message: str, level: Optional[str] = None) -> int:
+    """Numeric severity from the log level, or from keywords in the message when the level is unknown"""
+    if level:
+        rank = SEVERITY_RANK.get(level.strip().upper())
+        if rank is not None:
+            return rank
+    # Same keywords the rule parser uses to fill in missing levels
+    return SEVERITY_RANK[infer_level(message)]
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    width = max(1, max_tokens * CHARS_PER_TOKEN - 3)
+    while width > 1 and estimate_tokens(text[:width] + "...") > max_tokens:
+        width //= 2
+    return text[:width] + "..."
+
+
+def compress_context(messages: Sequence[str], levels: Optional[Sequence[str]] = None,
+                     token_budget: int = 1024) -> List[str]:
+    """Deduplicate messages by template, rank by severity and distance from the root cause, and pack to the budget.
+
+    The chain starts at the root cause, so position doubles as proximity. Messages sharing a template are
+    kept once at their first position with an "(xN)" count. Selected lines are returned in chain order;
+    a chain that already fits with no repeats comes back unchanged.
+    """
+    if token_budget <= 0:
+        raise ValueError("token_budget must be positive")
+    messages = [str(message) for message in messages]
+    if not messages:
+        return []
+    levels = list(levels) if levels else []
+
+    groups: Dict[str, dict] = {}
+    for position, message in enumerate(messages):
+        template = mask_variables(" ".join(message.split()))
+        level = levels[position] if position < len(levels) else None
+        group = groups.get(template)
+        if group is None:
+            groups[template] = {"position": position, "message": message, "count": 1,
+                                "severity": severity_of(message, level)}
+        else:
+            group["count"] += 1
+            group["severity"] = max(group["severity"], severity_of(message, level))
+
+    for group in groups.values():
+        group["line"] = group["message"] if group["count"] == 1 else f"{group['message']} (x{group['count']})"
+        group["tokens"] = estimate_tokens(group["line"]) + 1
+
+    # The root cause is always kept; the rest by severity, then closeness to the root cause
+    ranked = sorted(groups.values(), key=lambda group: (group["position"] != 0, -group["severity"], group["position"]))
+    # Leave room for the omission note when not everything fits
+    note_tokens = estimate_tokens(OMITTED_NOTE.format(count=len(groups))) + 1
+    limit = token_budget
+    if sum(group["tokens"] for group in ranked) > token_budget and token_budget > 2 * note_tokens:
+        limit -= note_tokens
+    selected, used = [], 0
+    for group in ranked:
+        if used + group["tokens"] <= limit:
+            selected.append(group)
+            used += group["tokens"]
+        elif not selected:
+            group["line"] = _truncate(group["line"], max(1, limit - 1))
+            selected.append(group)
+            used = limit
+
+    lines = [group["line"] for group in sorted(selected, key=lambda group: group["position"])]
+    omitted = len(groups) - len(selected)
+    if omitted:
+        note = OMITTED_NOTE.format(count=omitted)
+        if used + estimate_tokens(note) + 1 <= token_budget:
+            lines.append(note)
+    return lines
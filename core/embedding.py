@@ -1,17 +1,63 @@
 import mirascope
 import ollama
-from typing import List
+import numpy as np
+from typing import List, Optional, Sequence, Tuple, Union
 from chromadb.utils.embedding_functions import OllamaEmbeddingFunction
+from core.embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+from core.embedding_scheduler import EmbeddingScheduler
+from core.tokenizer import estimate_tokens, split_by_tokens
+
+EmbeddingMatrix = Union[np.ndarray, Sequence[Sequence[float]]]
+
+def normalize_embeddings(embeddings: EmbeddingMatrix, dtype=np.float32) -> np.ndarray:
+    """Return a 2-D matrix of unit-length rows; zero rows stay zero"""
+    matrix = np.atleast_2d(np.asarray(embeddings, dtype=dtype))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+def cosine_similarity_matrix(embeddings_a: EmbeddingMatrix, embeddings_b: EmbeddingMatrix,
+                             normalized: bool = False, dtype=np.float32) -> np.ndarray:
+    """Many-to-many cosine similarity as one matrix product; pass normalized=True for pre-normalized inputs"""
+    if normalized:
+        a = np.atleast_2d(np.asarray(embeddings_a, dtype=dtype))
+        b = np.atleast_2d(np.asarray(embeddings_b, dtype=dtype))
+    else:
+        a = normalize_embeddings(embeddings_a, dtype)
+        b = normalize_embeddings(embeddings_b, dtype)
+    return a @ b.T
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, selected in O(n) with argpartition"""
+    scores = np.asarray(scores)
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
 
 # import needed embedding logic
 # use bert or any other embedding models via ollama or mirascope
 
 class EmbeddingCreator:
-    def __init__(self):
+    def __init__(self, cache: Optional[EmbeddingCache] = None, batch_size: int = 32,
+                 max_in_flight: int = 4, target_latency: float = 2.0,
+                 query_chunk_tokens: int = 512, query_token_budget: int = 2048):
         self.ef = OllamaEmbeddingFunction(
             url="http://localhost:11435/api/embeddings",
             model_name="nomic-embed-text"
         )
+        self.cache = cache
+        if cache is not None:
+            self.ef = CachedEmbeddingFunction(self.ef, cache)
+        self.scheduler = EmbeddingScheduler(
+            lambda batch: self.ef(batch),
+            batch_size=batch_size,
+            max_in_flight=max_in_flight,
+            target_latency=target_latency
+        )
+        # Long query contexts are embedded in chunks of query_chunk_tokens, at most query_token_budget in total
+        self.query_chunk_tokens = query_chunk_tokens
+        self.query_token_budget = query_token_budget
     
     def show_model(self, model_name: str):
         # this will show the model
@@ -31,16 +77,86 @@ class EmbeddingCreator:
             raise ValueError("Text list contains empty or non-string values")
         
         try:
-            return self.ef(texts)
+            return self.scheduler.embed(texts)
         except Exception as e:
             # Add error logging
             print(f"Embedding generation failed: {str(e)}")
             raise
     
+    def embed_query(self, query: str, context: str = "") -> np.ndarray:
+        """Embed a search query plus its context under the token budget, mean-pooling chunked contexts"""
+        return self.embed_queries([query], [context])[0]
+
+    def embed_queries(self, queries: List[str], contexts: Optional[List[str]] = None) -> List[np.ndarray]:
+        """embed_query for several queries: duplicates are embedded once and all chunks go in one call"""
+        if contexts is None:
+            contexts = [""] * len(queries)
+        elif len(contexts) != len(queries):
+            raise ValueError("Expected one context per query")
+        pairs = list(dict.fromkeys(zip(queries, contexts)))
+        plans = [self._query_chunks(query, context) for query, context in pairs]
+        texts = [chunk for plan in plans for chunk in plan]
+        if not texts:
+            return []
+        embeddings = np.asarray(self.ef(texts), dtype=np.float32)
+
+        pooled_by_pair, start = {}, 0
+        for pair, plan in zip(pairs, plans):
+            rows = embeddings[start:start + len(plan)]
+            start += len(plan)
+            pooled_by_pair[pair] = rows[0] if len(rows) == 1 else self._pool(rows)
+        return [pooled_by_pair[pair] for pair in zip(queries, contexts)]
+
+    def _query_chunks(self, query: str, context: str) -> List[str]:
+        text = f"{query}\nContext: {context}"
+        if estimate_tokens(text) <= self.query_chunk_tokens:
+            # Same input Chroma would embed for query_texts, so results match the text query path
+            return [text]
+
+        # Every chunk repeats the query so pooling does not dilute it; the context is kept from the start,
+        # where ContextBuilder puts the root cause, and cut once the budget is spent
+        chunk_budget = max(1, self.query_chunk_tokens - estimate_tokens(query) - 4)
+        chunks, spent = [], 0
+        for piece in split_by_tokens(context, chunk_budget):
+            chunk = f"{query}\nContext: {piece}"
+            spent += estimate_tokens(chunk)
+            if chunks and spent > self.query_token_budget:
+                break
+            chunks.append(chunk)
+        return chunks or [text]
+
+    @staticmethod
+    def _pool(embeddings: np.ndarray) -> np.ndarray:
+        pooled = embeddings.mean(axis=0)
+        norm = np.linalg.norm(pooled)
+        if norm > 0:
+            # Keep the typical magnitude of a single embedding, since collections may rank by L2 distance
+            pooled *= np.linalg.norm(embeddings, axis=1).mean() / norm
+        return pooled
+
     def get_similarity(self, embedding1: List[float], embedding2: List[float]) -> float:
         """Calculate cosine similarity between two embeddings"""
-        dot_product = sum(a*b for a, b in zip(embedding1, embedding2))
-        norm_a = sum(a**2 for a in embedding1) ** 0.5
-        norm_b = sum(b**2 for b in embedding2) ** 0.5
-        return dot_product / (norm_a * norm_b)
+        a = np.asarray(embedding1, dtype=np.float64)
+        b = np.asarray(embedding2, dtype=np.float64)
+        if a.size == 0 or b.size == 0 or not np.any(a) or not np.any(b):
+            raise ZeroDivisionError("Cosine similarity is undefined for empty or zero vectors")
+        return float(cosine_similarity_matrix(a, b, dtype=np.float64)[0, 0])
+    
+    def get_similarities(self, query: List[float], embeddings: EmbeddingMatrix, normalized: bool = False) -> np.ndarray:
+        """Cosine similarity of one embedding against every row of a matrix"""
+        return cosine_similarity_matrix(query, embeddings, normalized=normalized)[0]
+    
+    def get_similarity_matrix(self, embeddings_a: EmbeddingMatrix, embeddings_b: EmbeddingMatrix = None,
+                              normalized: bool = False) -> np.ndarray:
+        """Pairwise cosine similarities; compares a matrix with itself when embeddings_b is omitted"""
+        if embeddings_b is None:
+            a = np.atleast_2d(np.asarray(embeddings_a, dtype=np.float32)) if normalized else normalize_embeddings(embeddings_a)
+            return a @ a.T
+        return cosine_similarity_matrix(embeddings_a, embeddings_b, normalized=normalized)
+    
+    def top_k_similar(self, query: List[float], embeddings: EmbeddingMatrix, k: int = 5,
+                      normalized: bool = False) -> List[Tuple[int, float]]:
+        """(row index, similarity) of the k rows most similar to the query, best first"""
+        scores = self.get_similarities(query, embeddings, normalized=normalized)
+        return [(int(idx), float(scores[idx])) for idx in top_k_indices(scores, k)]
     
\ No newline at end of file
@@ -0,0 +1,225 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import Dict, List, Optional
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+"""Persistent embedding cache shared by the ingest and query paths"""
+
+class EmbeddingCache:
+    """Memory-mapped float32 matrix plus a SQLite sha256(text) -> row index, one store per embedding model"""
+
+    def __init__(self, directory: str, model_name: str, max_rows: int = 200_000, initial_rows: int = 1024):
+        if max_rows <= 0:
+            raise ValueError("max_rows must be positive")
+        try:
+            self.model_name = model_name
+            self.directory = os.path.join(directory, re.sub(r"[^\w.\-]", "_", model_name))
+            os.makedirs(self.directory, exist_ok=True)
+            self.max_rows = max_rows
+            self.initial_rows = min(initial_rows, max_rows)
+            self.hits = 0
+            self.misses = 0
+            self._lock = threading.RLock()
+            self._conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_access ON embeddings(last_access)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER)")
+            self._conn.commit()
+
+            meta = dict(self._conn.execute("SELECT name, value FROM cache_meta").fetchall())
+            self.dim: Optional[int] = meta.get("dim")
+            self._capacity = meta.get("capacity", 0)
+            self._rows_used = meta.get("rows_used", 0)
+            used = {row for (row,) in self._conn.execute("SELECT row FROM embeddings")}
+            self._free_rows = [row for row in range(self._rows_used) if row not in used]
+            self._size = len(used)
+            self._matrix: Optional[np.memmap] = None
+            if self.dim:
+                self._open_matrix()
+        except Exception as e:
+            raise RuntimeError(f"Failed to open embedding cache: {str(e)}")
+
+    @staticmethod
+    def text_key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @property
+    def _matrix_path(self) -> str:
+        return os.path.join(self.directory, "vectors.f32")
+
+    def _open_matrix(self) -> None:
+        self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode="r+", shape=(self._capacity, self.dim))
+
+    def _grow(self, rows_needed: int) -> None:
+        """Extend the backing file (sparse on most filesystems) and remap it"""
+        capacity = max(self._capacity, self.initial_rows)
+        while capacity < rows_needed:
+            capacity *= 2
+        capacity = min(capacity, self.max_rows)
+        if capacity == self._capacity:
+            return
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self._matrix_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._capacity = capacity
+        self._open_matrix()
+        self._save_meta()
+
+    def _save_meta(self) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO cache_meta (name, value) VALUES (?, ?)",
+            [("dim", self.dim), ("capacity", self._capacity), ("rows_used", self._rows_used)]
+        )
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Cached embeddings aligned with texts; None where the text has not been embedded yet"""
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        if not texts:
+            return results
+        keys = [self.text_key(text) for text in texts]
+        with self._lock:
+            if self._matrix is None:
+                self.misses += len(texts)
+                return results
+            rows: Dict[str, int] = {}
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows.update(self._conn.execute(
+                    f"SELECT key, row FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall())
+            for pos, key in enumerate(keys):
+                row = rows.get(key)
+                if row is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    results[pos] = np.array(self._matrix[row])
+            if rows:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                       [(now, key) for key in rows])
+                self._conn.commit()
+        return results
+
+    def put_many(self, texts: List[str], embeddings: Embeddings) -> None:
+        if not texts:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError("Expected one embedding per text")
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match cache dimension {self.dim}")
+
+            pending = {}
+            for text, vector in zip(texts, vectors):
+                pending[self.text_key(text)] = vector
+            existing = set()
+            keys = list(pending)
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(key for (key,) in self._conn.execute(
+                    f"SELECT key FROM embeddings WHERE key IN ({placeholders})", batch
+                ))
+            new_items = [(key, vector) for key, vector in pending.items() if key not in existing][-self.max_rows:]
+            if not new_items:
+                return
+
+            overflow = self._size + len(new_items) - self.max_rows
+            if overflow > 0:
+                # Evict least recently used rows, plus 10% headroom so eviction is not per insert
+                self._evict(overflow + self.max_rows // 10)
+
+            rows_needed = self._rows_used + max(0, len(new_items) - len(self._free_rows))
+            if rows_needed > self._capacity or self._matrix is None:
+                self._grow(rows_needed)
+
+            now = time.time()
+            records = []
+            for key, vector in new_items:
+                if self._free_rows:
+                    row = self._free_rows.pop()
+                else:
+                    row = self._rows_used
+                    self._rows_used += 1
+                self._matrix[row] = vector
+                records.append((key, row, now))
+            self._matrix.flush()
+            self._conn.executemany("INSERT INTO embeddings (key, row, last_access) VALUES (?, ?, ?)", records)
+            self._size += len(records)
+            self._save_meta()
+            self._conn.commit()
+
+    def _evict(self, count: int) -> None:
+        victims = self._conn.execute(
+            "SELECT key, row FROM embeddings ORDER BY last_access ASC LIMIT ?", (count,)
+        ).fetchall()
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in victims])
+        self._free_rows.extend(row for _, row in victims)
+        self._size -= len(victims)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": self._size,
+            "max_rows": self.max_rows,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+                self._matrix = None
+            self._conn.close()
+
+
+class CachedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Chroma embedding function that serves repeated texts from an EmbeddingCache"""
+
+    def __init__(self, embedding_function: EmbeddingFunction, cache: EmbeddingCache) -> None:
+        self.embedding_function = embedding_function
+        self.cache = cache
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        results = self.cache.get_many(texts)
+        missing = [pos for pos, vector in enumerate(results) if vector is None]
+        if missing:
+            # Embed each distinct missing text once, even if it repeats within the batch
+            unique_texts = list(dict.fromkeys(texts[pos] for pos in missing))
+            fresh = [np.asarray(vector, dtype=np.float32) for vector in self.embedding_function(unique_texts)]
+            self.cache.put_many(unique_texts, fresh)
+            by_text = dict(zip(unique_texts, fresh))
+            for pos in missing:
+                results[pos] = by_text[texts[pos]]
+        return results
+
+    def embed_query(self, input: Documents) -> Embeddings:
+        return self.__call__(input)
+
+    @staticmethod
+    def name() -> str:
+        return "cached"
@@ -0,0 +1,85 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, List, Sequence
+
+"""Micro-batched, bounded-concurrency embedding requests with latency-adaptive batch size"""
+
+class EmbeddingScheduler:
+    """Split texts into micro-batches, embed up to max_in_flight batches at once and keep input order"""
+
+    def __init__(self, embed_fn: Callable[[List[str]], Sequence], batch_size: int = 32,
+                 min_batch_size: int = 1, max_batch_size: int = 256, max_in_flight: int = 4,
+                 target_latency: float = 2.0, max_retries: int = 2, retry_backoff: float = 0.5):
+        if not 1 <= min_batch_size <= batch_size <= max_batch_size:
+            raise ValueError("Expected 1 <= min_batch_size <= batch_size <= max_batch_size")
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.embed_fn = embed_fn
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_in_flight = max_in_flight
+        # Seconds one batch should take; batches grow while faster and shrink while slower
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.batches = 0
+        self.retried_items = 0
+        self._lock = threading.Lock()
+
+    def embed(self, texts: List[str]) -> list:
+        """Embed every text; results are aligned with the input order"""
+        results = [None] * len(texts)
+        next_pos = 0
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            pending = {}
+            while next_pos < len(texts) or pending:
+                # Keep max_in_flight batches outstanding, each sized by the latest latency estimate
+                while next_pos < len(texts) and len(pending) < self.max_in_flight:
+                    end = min(next_pos + self.batch_size, len(texts))
+                    future = executor.submit(self._embed_batch, texts[next_pos:end])
+                    pending[future] = next_pos
+                    next_pos = end
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start = pending.pop(future)
+                    embeddings = future.result()
+                    results[start:start + len(embeddings)] = embeddings
+        return results
+
+    def _embed_batch(self, batch: List[str]) -> list:
+        started = time.perf_counter()
+        try:
+            embeddings = list(self.embed_fn(batch))
+            if len(embeddings) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(embeddings)}")
+        except Exception as e:
+            self._adapt(None)
+            print(f"Embedding batch of {len(batch)} texts failed, retrying individually: {str(e)}")
+            with self._lock:
+                self.retried_items += len(batch)
+            return [self._with_retry(text) for text in batch]
+        self._adapt(time.perf_counter() - started)
+        return embeddings
+
+    def _adapt(self, latency) -> None:
+        """Double the batch size while batches finish under half the target, halve it when over or failing"""
+        with self._lock:
+            self.batches += 1
+            if latency is None or latency > self.target_latency:
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            elif latency < self.target_latency / 2:
+                self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+
+    def _with_retry(self, text: str):
+        """Embed a single text, retrying with exponential backoff"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embed_fn([text])[0]
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise RuntimeError(f"Failed to embed text after {attempt + 1} attempts: {str(e)}")
+                delay = self.retry_backoff * (2 ** attempt)
+                print(f"Retrying embedding in {delay:.1f}s after error: {str(e)}")
+                time.sleep(delay)
@@ -0,0 +1,240 @@
+import os
+import re
+import queue
+import itertools
+import threading
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from core.database_handlers import content_digest
+
+"""Pipelined documentation ingest: per-file chunking in a process pool, then embedding and vector-store writes"""
+
+HEADING_PATTERN = re.compile(r"^#{1,6}[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+
+# Marks the end of a stage's input on the pipeline queues
+_DONE = object()
+
+# Below this many characters in total, chunking in-process beats starting spawned workers
+PARALLEL_MIN_CHARS = 1_000_000
+
+
+def chunk_document(source: str, text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[dict]:
+    """Split one document into chunks tagged with source file, character offset and nearest heading"""
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        add_start_index=True,
+    )
+    headings = [(match.start(), match.group(1).strip()) for match in HEADING_PATTERN.finditer(text)]
+    chunks = []
+    heading_pos = 0
+    heading = ""
+    for doc in splitter.create_documents([text]):
+        offset = doc.metadata.get("start_index", -1)
+        # Offsets increase monotonically, so the heading scan resumes where the previous chunk stopped
+        while heading_pos < len(headings) and headings[heading_pos][0] <= offset:
+            heading = headings[heading_pos][1]
+            heading_pos += 1
+        chunks.append({
+            "id": content_digest(doc.page_content),
+            "text": doc.page_content,
+            "metadata": {"source": source, "offset": offset, "heading": heading},
+        })
+    return chunks
+
+
+def _chunk_job(job: Tuple[str, str, int, int]) -> Tuple[str, List[dict]]:
+    source, text, chunk_size, chunk_overlap = job
+    return source, chunk_document(source, text, chunk_size, chunk_overlap)
+
+
+class DocumentIngestor:
+    """Chunk, embed and store documents, skipping anything already ingested"""
+
+    def __init__(self, embedder, vector_db, mongo_db=None, workers: Optional[int] = None,
+                 embed_batch_size: int = 64, queue_size: int = 4, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 parallel_min_chars: int = PARALLEL_MIN_CHARS):
+        self.embedder = embedder
+        self.vector_db = vector_db
+        self.mongo_db = mongo_db
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.embed_batch_size = embed_batch_size
+        # Batches allowed to wait between stages; a slow stage stalls the ones before it
+        self.queue_size = queue_size
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.parallel_min_chars = parallel_min_chars
+        # Worker pool, started on the first corpus large enough to need it and reused afterwards
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def ingest(self, documents: List[str], sources: Optional[List[str]] = None) -> Dict[str, int]:
+        if not documents:
+            raise ValueError("Received empty documents list")
+        if sources is None:
+            sources = [f"doc-{content_digest(doc)[:12]}" for doc in documents]
+        elif len(sources) != len(documents):
+            raise ValueError("Expected one source per document")
+
+        manifests = self._load_manifests(sources)
+        stats = {"documents": len(documents), "unchanged_documents": 0, "chunks": 0, "embedded": 0, "deleted": 0}
+        jobs = []
+        digests = {}
+        for source, document in zip(sources, documents):
+            doc_digest = content_digest(document)
+            manifest = (manifests or {}).get(source)
+            if manifest and manifest.get("doc_digest") == doc_digest:
+                # Unchanged document: nothing to split or embed
+                stats["chunks"] += len(manifest["chunk_ids"])
+                stats["unchanged_documents"] += 1
+                continue
+            digests[source] = doc_digest
+            jobs.append((source, document, self.chunk_size, self.chunk_overlap))
+
+        removed = set()
+        updated_manifests = []
+        embed_queue = queue.Queue(maxsize=self.queue_size)
+        write_queue = queue.Queue(maxsize=self.queue_size)
+        errors = []
+        stages = [
+            threading.Thread(target=self._embed_stage, args=(embed_queue, write_queue, errors), daemon=True),
+            threading.Thread(target=self._write_stage, args=(write_queue, stats, errors), daemon=True),
+        ]
+
+        chunked = self._chunk_all(jobs)
+        for stage in stages:
+            stage.start()
+        try:
+            seen = set()
+            batch = []
+            for source, chunks in chunked:
+                if errors:
+                    break
+                manifest = (manifests or {}).get(source)
+                previous = set(manifest["chunk_ids"]) if manifest else set()
+                chunk_ids = list(dict.fromkeys(chunk["id"] for chunk in chunks))
+                stats["chunks"] += len(chunks)
+                removed |= previous - set(chunk_ids)
+                updated_manifests.append((source, digests[source], chunk_ids))
+                for chunk in chunks:
+                    if chunk["id"] in previous or chunk["id"] in seen:
+                        continue
+                    seen.add(chunk["id"])
+                    batch.append(chunk)
+                    if len(batch) >= self.embed_batch_size:
+                        embed_queue.put(batch)
+                        batch = []
+            if batch and not errors:
+                embed_queue.put(batch)
+        finally:
+            embed_queue.put(_DONE)
+            for stage in stages:
+                stage.join()
+        if errors:
+            raise errors[0]
+
+        # Validate chunks before embedding
+        if not stats["chunks"]:
+            raise ValueError("No text chunks created after splitting")
+
+        if manifests is not None:
+            for manifest in updated_manifests:
+                self.mongo_db.save_doc_manifest(*manifest)
+            if removed:
+                # A chunk is only dropped once no document manifest lists it any more
+                orphaned = removed - self.mongo_db.referenced_chunk_ids(removed)
+                self.vector_db.delete_documents(orphaned)
+                stats["deleted"] = len(orphaned)
+
+        print(f"Stored documentation: {stats}")
+        return stats
+
+    def _load_manifests(self, sources: List[str]) -> Optional[dict]:
+        if self.mongo_db is None:
+            return None
+        try:
+            return self.mongo_db.get_doc_manifests(sources)
+        except Exception as e:
+            # Without manifests every chunk is diffed against the vector store only
+            print(f"Document manifests unavailable, skipping incremental diff: {str(e)}")
+            return None
+
+    def close(self) -> None:
+        """Shut down the chunking worker pool, if one was started"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                # Spawned, not forked: forking a multithreaded process can deadlock the child
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _chunk_all(self, jobs: list) -> Iterator[Tuple[str, List[dict]]]:
+        """Chunk documents in input order, in the worker pool only for corpora of parallel_min_chars or more"""
+        if self.workers <= 1 or len(jobs) <= 1 or sum(len(job[1]) for job in jobs) < self.parallel_min_chars:
+            return map(_chunk_job, jobs)
+
+        def drain():
+            executor = self._pool()
+            pending = collections.deque()
+            remaining = iter(jobs)
+            try:
+                # At most two jobs per worker are pending, so a large corpus is never held in memory at once
+                for job in itertools.islice(remaining, self.workers * 2):
+                    pending.append(executor.submit(_chunk_job, job))
+                while pending:
+                    result = pending.popleft().result()
+                    for job in itertools.islice(remaining, 1):
+                        pending.append(executor.submit(_chunk_job, job))
+                    yield result
+            finally:
+                for future in pending:
+                    future.cancel()
+        return drain()
+
+    def _embed_stage(self, inbox: queue.Queue, outbox: queue.Queue, errors: list) -> None:
+        try:
+            while (batch := inbox.get()) is not _DONE:
+                if errors:
+                    continue
+                # Chunks shared with documents ingested earlier are already stored
+                stored = self.vector_db.existing_ids(chunk["id"] for chunk in batch)
+                batch = [chunk for chunk in batch if chunk["id"] not in stored]
+                if not batch:
+                    continue
+                embeddings = self.embedder.create_batch_embeddings([chunk["text"] for chunk in batch])
+                if len(embeddings) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} embeddings, got {len(embeddings)}")
+                outbox.put((batch, embeddings))
+        except Exception as e:
+            errors.append(e)
+            # Keep consuming so the producer never blocks on a full queue
+            while inbox.get() is not _DONE:
+                pass
+        finally:
+            outbox.put(_DONE)
+
+    def _write_stage(self, inbox: queue.Queue, stats: dict, errors: list) -> None:
+        while (item := inbox.get()) is not _DONE:
+            if errors:
+                continue
+            batch, embeddings = item
+            try:
+                self.vector_db.add_documents(
+                    documents=[chunk["text"] for chunk in batch],
+                    embeddings=embeddings,
+                    metadatas=[chunk["metadata"] for chunk in batch],
+                    ids=[chunk["id"] for chunk in batch]
+                )
+                stats["embedded"] += len(batch)
+            except Exception as e:
+                errors.append(e)
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict
+from models.context_data_models import Context
+from models.graph_data_models import DAG
+from models.rag_response_data_models import IncidentAnalysis
+from core.rag import RAG_Engine
+
+"""Concurrent incident analysis: summary, documentation retrieval and persistence run side by side"""
+
+class IncidentOrchestrator:
+    """Runs the independent stages of incident analysis concurrently around a RAG_Engine.
+
+    Retrieval uses the DAG's root cause, so it does not wait for the summary; the solution waits only for
+    retrieval. Blocking calls run in worker threads via asyncio.to_thread.
+    """
+
+    def __init__(self, rag: RAG_Engine, mongo_db=None):
+        self.rag = rag
+        self.mongo_db = mongo_db if mongo_db is not None else rag.mongo_db
+
+    async def analyze(self, dag: DAG, context: Context, summary: bool = True, solution: bool = True,
+                      persist: bool = True) -> IncidentAnalysis:
+        """Analyze one incident; disable stages the caller runs itself (e.g. a streamed summary)"""
+        timings: Dict[str, float] = {}
+        analysis = IncidentAnalysis(root_cause=context.root_cause or "")
+        started = time.perf_counter()
+
+        async def timed(stage: str, fn: Callable, *args, **kwargs):
+            stage_started = time.perf_counter()
+            try:
+                return await asyncio.to_thread(fn, *args, **kwargs)
+            finally:
+                timings[stage] = time.perf_counter() - stage_started
+
+        async def summarize():
+            analysis.summary = await timed("summary", self.rag.generate_summary, context.causal_chain, context.levels)
+
+        async def retrieve_and_solve():
+            analysis.documents = await timed(
+                "retrieval", self.rag.retrieve_documentation, context.causal_chain, analysis.root_cause)
+            analysis.sources = [doc.metadata.get("source", "Unknown") for doc in analysis.documents]
+            if solution:
+                analysis.solution = await timed(
+                    "solution", self.rag.generate_solution, context.causal_chain, analysis.root_cause,
+                    results=analysis.documents)
+
+        async def save():
+            await timed("persistence", self._persist, dag, context)
+
+        stages = {"retrieval": retrieve_and_solve()}
+        if summary:
+            stages["summary"] = summarize()
+        if persist:
+            stages["persistence"] = save()
+        # Every stage runs to completion, so one failure does not discard the results of the others
+        outcomes = await asyncio.gather(*stages.values(), return_exceptions=True)
+        timings["total"] = time.perf_counter() - started
+        analysis.timings = timings
+        failures = {stage: outcome for stage, outcome in zip(stages, outcomes) if isinstance(outcome, BaseException)}
+        persist_failure = failures.pop("persistence", None)
+        if persist_failure is not None:
+            # The analysis is still usable; report the failed write beside it
+            print(f"Failed to persist incident: {str(persist_failure)}")
+            analysis.persist_error = str(persist_failure)
+        if failures:
+            raise RuntimeError(f"Failed to analyze incident: {str(next(iter(failures.values())))}")
+        return analysis
+
+    def analyze_sync(self, dag: DAG, context: Context, **stages) -> IncidentAnalysis:
+        """analyze() for callers without an event loop"""
+        return asyncio.run(self.analyze(dag, context, **stages))
+
+    def start(self, dag: DAG, context: Context, **stages) -> Future:
+        """Run analyze() on a background thread and return its Future, leaving the caller's thread free"""
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="incident")
+        try:
+            return executor.submit(self.analyze_sync, dag, context, **stages)
+        finally:
+            # The worker exits once the analysis is done
+            executor.shutdown(wait=False)
+
+    def _persist(self, dag: DAG, context: Context) -> None:
+        self.mongo_db.save_dag(dag.model_dump())
+        self.mongo_db.save_context(context.model_dump())
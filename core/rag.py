@@ -1,36 +1,172 @@
-from typing import List, Dict
+from typing import Iterator, List, Dict, Optional, Tuple
 from mirascope.core import openai
 from mirascope.core.openai import OpenAICallParams
 from openai import OpenAI
 from models.rag_response_data_models import SummaryResponse, SolutionQuery
+from pydantic import ValidationError
 from .embedding import EmbeddingCreator
+from .embedding_cache import EmbeddingCache
 from core.database_handlers import VectorDatabaseHandler, MongoDBHandler
+from core.ingest import DocumentIngestor
+from core.context_compression import compress_context
+from core.response_cache import ResponseCache
+from core.summary_stream import SummaryStream
+from core.solution_stream import SolutionStream
 import ollama
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 
+# Hybrid retrieval ranks exact-token matches well enough that three chunks cover the answer,
+# which keeps the solution prompt short
+SOLUTION_TOP_K = 3
+
+# Token budgets for the log context inside prompts; llama3.2:3b runs with a 2048-token window by default,
+# and the solution prompt also carries the retrieved documentation
+SUMMARY_CONTEXT_TOKENS = 1024
+SOLUTION_CONTEXT_TOKENS = 768
+
+SUMMARY_PROMPT = """Summarize this log context and identify root cause:
+{context}
+
+The first line is the earliest event of the causal chain. Respond with a JSON object with exactly these fields:
+- summary: list of short summary points, one string per point
+- root_cause_expln: one or two sentences explaining the root cause
+- severity: one of "Critical", "High", "Medium", "Low"
+"""
+# Extra generations allowed when the JSON summary fails validation
+SUMMARY_MAX_RETRIES = 1
+
 class RAG_Engine:
-    def __init__(self):
-        self.embedder = EmbeddingCreator()
-        self.vector_db = VectorDatabaseHandler()
+    def __init__(self, embedding_cache: Optional[EmbeddingCache] = None, response_cache: Optional[ResponseCache] = None):
+        self.embedder = EmbeddingCreator(cache=embedding_cache)
+        self.vector_db = VectorDatabaseHandler(cache=embedding_cache)
         self.mongo_db = MongoDBHandler()
         self.ollama_client = ollama.Client(host="http://localhost:11435")
+        self.response_cache = response_cache
+        # Created on first store_documentation so its chunking pool is reused across uploads
+        self.ingestor: Optional[DocumentIngestor] = None
+    
+    def generate_summary(self, context: List[str], levels: Optional[List[str]] = None) -> SummaryResponse:
+        """Generate summary using LLM from the causal chain compressed to SUMMARY_CONTEXT_TOKENS"""
+        prompt = self._summary_prompt(context, levels)
+        key, cached = self._cached_summary(prompt)
+        if cached is not None:
+            return cached
+        return self._structured_summary(prompt, key, retries=SUMMARY_MAX_RETRIES)
+    
+    def stream_summary(self, context: List[str], levels: Optional[List[str]] = None) -> SummaryStream:
+        """Stream summary points as the LLM produces them; the stream's `summary` is set once iteration ends.
+
+        Closing the stream cancels the generation.
+        """
+        prompt = self._summary_prompt(context, levels)
+        key, cached = self._cached_summary(prompt)
+        if cached is not None:
+            return SummaryStream.from_summary(cached)
+        return SummaryStream(
+            self._stream(prompt, temperature=0.2, format="json"),
+            lambda raw: self._structured_summary(prompt, key, retries=SUMMARY_MAX_RETRIES, raw=raw)
+        )
     
-    def generate_summary(self, context: List[str]) -> SummaryResponse:
-        """Generate summary using LLM"""
+    def _structured_summary(self, prompt: str, key: Optional[str], retries: int, raw: Optional[str] = None) -> SummaryResponse:
+        """Validate JSON output into a SummaryResponse, generating again only when validation fails.
+
+        raw is output already generated (e.g. streamed). Output that never validates falls back to
+        summary_from_text and is not cached.
+        """
+        if raw is None:
+            raw = self._generate_summary_json(prompt)
+        for attempt in range(retries + 1):
+            try:
+                summary = SummaryResponse.model_validate_json(raw)
+            except ValidationError as e:
+                print(f"Summary validation failed (attempt {attempt + 1}): {str(e)}")
+                if attempt < retries:
+                    raw = self._generate_summary_json(prompt)
+                continue
+            self._cache_response("summary", key, summary.model_dump())
+            return summary
+        return self.summary_from_text(raw)
+    
+    def _generate_summary_json(self, prompt: str) -> str:
         response = self.ollama_client.generate(
             model="llama3.2:3b",
-            prompt=f"Summarize this log context and identify root cause:\n{'\n'.join(context)}",
+            prompt=prompt,
+            format="json",
             options={"temperature": 0.2}
         )
+        return response['response']
+    
+    def _cached_summary(self, prompt: str) -> Tuple[Optional[str], Optional[SummaryResponse]]:
+        if self.response_cache is None:
+            return None, None
+        key = ResponseCache.prompt_key("summary", "llama3.2:3b", prompt)
+        payload = self.response_cache.get(key)
+        return key, SummaryResponse(**payload) if payload is not None else None
+    
+    def _cached_solution(self, root_cause: str, prompt_context: str) -> Tuple[Optional[str], Optional[dict], Optional[list]]:
+        """Exact hit on root cause and compressed context, else the nearest cached solution for a similar root cause.
+
+        The key leaves out retrieved documentation, so a hit also skips the documentation search.
+        Returns the key, the cached payload (or None) and the root-cause embedding for storing a new entry.
+        """
+        if self.response_cache is None:
+            return None, None, None
+        key = ResponseCache.prompt_key("solution", "llama3.2:3b", f"{root_cause}\0{prompt_context}")
+        payload = self.response_cache.get(key)
+        if payload is not None:
+            return key, dict(payload, additional_info={"cache": "exact"}), None
+        if self.response_cache.similarity_threshold is None:
+            return key, None, None
+        try:
+            embedding = self.embedder.create_embedding(root_cause)
+        except Exception as e:
+            print(f"Root cause embedding failed, skipping semantic cache: {str(e)}")
+            return key, None, None
+        payload = self.response_cache.find_similar("solution", embedding)
+        if payload is not None:
+            similarity = payload.pop("similarity")
+            payload["additional_info"] = {"cache": "semantic", "similarity": similarity}
+        return key, payload, embedding
+    
+    def _cache_response(self, kind: str, key: Optional[str], payload: dict, embedding: Optional[list] = None) -> None:
+        if self.response_cache is not None and key is not None:
+            self.response_cache.put(kind, key, payload, embedding)
+    
+    @staticmethod
+    def summary_from_text(text: str) -> SummaryResponse:
+        """Build a SummaryResponse from free-text output, used when the JSON summary never validates"""
         return SummaryResponse(
-            summary=response['response'].split("\n"),
+            summary=text.split("\n"),
             root_cause_expln="Identified via log analysis",
             severity="High"
         )
     
-    def generate_solution(self, context: str, root_cause: str) -> SolutionQuery:
-        """Generate solution using RAG with automatic query"""
+    @staticmethod
+    def _summary_prompt(context: List[str], levels: Optional[List[str]] = None) -> str:
+        compressed = compress_context(context, levels, token_budget=SUMMARY_CONTEXT_TOKENS)
+        return SUMMARY_PROMPT.format(context="\n".join(compressed))
+    
+    def _stream(self, prompt: str, temperature: float, format: Optional[str] = None) -> Iterator[str]:
+        stream = self.ollama_client.generate(
+            model="llama3.2:3b",
+            prompt=prompt,
+            format=format,
+            options={"temperature": temperature},
+            stream=True
+        )
+        try:
+            for chunk in stream:
+                token = chunk.get('response') if chunk else None
+                if token:
+                    yield token
+        finally:
+            # Closing the ollama stream closes the HTTP response, which stops generation server-side
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+    
+    def generate_solution(self, context: str, root_cause: str, results: Optional[list] = None) -> SolutionQuery:
+        """Generate solution using RAG with automatic query; pass results to reuse documents already retrieved"""
         print("\n=== Starting Solution Generation ===")
         automated_query = f"Provide resolution steps for: {root_cause}"
         #print(f"Debug - Query: {automated_query}")
@@ -46,22 +182,25 @@ class RAG_Engine:
             else:
                 context_str = context
             
+            # One compressed copy serves both the search and the prompt
+            prompt_context = self._compress_solution_context(context_str)
+            
             #print(f"Debug - Context type after conversion: {type(context_str)}")
             #print(f"Debug - Context preview: {context_str[:100]}...")
             
-            # Search documentation using context embeddings
-            try:
-                print("\n=== Starting Vector Search ===")
-                results = self.vector_db.search(
-                    query=automated_query,
+            key, cached, root_embedding = self._cached_solution(root_cause, prompt_context)
+            if cached is not None:
+                return SolutionQuery(
                     context=context_str,
-                    top_k=5
+                    query=automated_query,
+                    response=cached["response"],
+                    sources=cached["sources"],
+                    additional_info=cached["additional_info"]
                 )
-                #print(f"Debug - Search results: {results}")
-                
-            except Exception as e:
-                print(f"Vector search error: {str(e)}")
-                results = [Document(text="Error searching documentation", metadata={"source": "error"})]
+            
+            # Search documentation using context embeddings
+            if results is None:
+                results = self._search(automated_query, prompt_context)
             
             # Format context for prompt - Using doc.text since that's what our Document objects have
             doc_context = "\n".join([doc.text for doc in results])
@@ -72,34 +211,7 @@ class RAG_Engine:
                 # Format response with sources
                 llm_response = self.ollama_client.generate(
                     model="llama3.2:3b",
-                    prompt=f"""Based on the following information, provide a structured solution:
-
-Root Cause:
-{root_cause}
-
-Context:
-{context_str}
-
-Available Documentation:
-{doc_context}
-
-Please provide a detailed solution in the following format:
-
-Problem Analysis:
-- Briefly describe the identified issue
-- Key observations from the context
-
-Recommended Steps:
-1. First step with explanation
-2. Second step with explanation
-3. Additional steps as needed
-
-Additional Recommendations:
-- Important considerations
-- Preventive measures
-- Monitoring suggestions
-
-Please be specific and actionable in your recommendations.""",
+                    prompt=self._solution_prompt(root_cause, prompt_context, doc_context),
                     options={"temperature": 0.1}
                 )
                 print(f"Debug - LLM response: {llm_response}")
@@ -121,12 +233,14 @@ Please be specific and actionable in your recommendations.""",
                     sources=[doc.metadata.get("source", "Unknown") for doc in results]
                 )
             
-            return SolutionQuery(
+            solution = SolutionQuery(
                 context=context_str,
                 query=automated_query,
                 response=llm_response['response'],
                 sources=[doc.metadata.get("source", "Unknown") for doc in results]
             )
+            self._cache_response("solution", key, {"response": solution.response, "sources": solution.sources}, root_embedding)
+            return solution
             
         except Exception as e:
             print(f"Error in generate_solution: {str(e)}")
@@ -138,40 +252,131 @@ Please be specific and actionable in your recommendations.""",
                 sources=[]
             )
     
-    def store_documentation(self, documents: List[str]) -> None:
-        """Store documentation in ChromaDB"""
-        #print("\n=== Storing Documentation ===")
-        
-        # Add validation for empty documents
-        if not documents:
-            raise ValueError("Received empty documents list")
-        
-        # Add chunk size validation
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            add_start_index=True,
-        )
-        
-        #print(f"Original documents: {len(documents)} chunks")
-        chunks = text_splitter.split_text("\n\n".join(documents))
-        #print(f"Split into {len(chunks)} chunks")
-        
-        # Validate chunks before embedding
-        if not chunks:
-            raise ValueError("No text chunks created after splitting")
-        
-        #print("Creating embeddings...")
-        embeddings = self.embedder.create_batch_embeddings(chunks)
-        #print(f"Created {len(embeddings)} embeddings")
-        
-        #print("Storing in vector database...")
-        self.vector_db.add_documents(
-            documents=chunks,
-            embeddings=embeddings
+    def retrieve_documentation(self, context, root_cause: str) -> list:
+        """Documents generate_solution would retrieve for an incident, for use with stream_solution"""
+        prompt_context = self._compress_solution_context(self._context_to_str(context))
+        return self._search(f"Provide resolution steps for: {root_cause}", prompt_context)
+    
+    def stream_solution(self, context, root_cause: str, results: Optional[list] = None) -> SolutionStream:
+        """Stream solution tokens as the LLM produces them; pass results from retrieve_documentation to skip the search.
+
+        The stream's sources are those of the cached answer on a cache hit, else of the documents used.
+        """
+        prompt_context = self._compress_solution_context(self._context_to_str(context))
+        key, cached, root_embedding = self._cached_solution(root_cause, prompt_context)
+        if cached is not None:
+            return SolutionStream(iter((cached["response"],)), sources=cached["sources"],
+                                  additional_info=cached["additional_info"])
+        if results is None:
+            results = self._search(f"Provide resolution steps for: {root_cause}", prompt_context)
+        doc_context = "\n".join([doc.text for doc in results])
+        sources = [doc.metadata.get("source", "Unknown") for doc in results]
+
+        def cache(response: str) -> None:
+            self._cache_response("solution", key, {"response": response, "sources": sources}, root_embedding)
+
+        return SolutionStream(
+            self._stream(self._solution_prompt(root_cause, prompt_context, doc_context), temperature=0.1),
+            sources=sources,
+            on_complete=cache
         )
-        
-        # Verify storage
-        collection = self.vector_db.get_collection()
-        #print(f"Collection now contains {collection.count()} documents")
\ No newline at end of file
+    
+    def _search(self, query: str, prompt_context: str) -> list:
+        try:
+            print("\n=== Starting Vector Search ===")
+            return self.vector_db.search(
+                query=query,
+                context=prompt_context,
+                top_k=SOLUTION_TOP_K,
+                query_embedding=self._embed_query(query, prompt_context)
+            )
+        except Exception as e:
+            print(f"Vector search error: {str(e)}")
+            return [Document(text="Error searching documentation", metadata={"source": "error"})]
+    
+    @staticmethod
+    def _solution_prompt(root_cause: str, context: str, doc_context: str) -> str:
+        return f"""Based on the following information, provide a structured solution:
+
+Root Cause:
+{root_cause}
+
+Context:
+{context}
+
+Available Documentation:
+{doc_context}
+
+Please provide a detailed solution in the following format:
+
+Problem Analysis:
+- Briefly describe the identified issue
+- Key observations from the context
+
+Recommended Steps:
+1. First step with explanation
+2. Second step with explanation
+3. Additional steps as needed
+
+Additional Recommendations:
+- Important considerations
+- Preventive measures
+- Monitoring suggestions
+
+Please be specific and actionable in your recommendations."""
+    
+    @staticmethod
+    def _context_to_str(context) -> str:
+        if isinstance(context, str):
+            return context
+        if isinstance(context, (list, tuple)):
+            return "\n".join(map(str, context))
+        return str(context)
+    
+    @staticmethod
+    def _compress_solution_context(context: str) -> str:
+        return "\n".join(compress_context(context.split("\n"), token_budget=SOLUTION_CONTEXT_TOKENS))
+
+    def _embed_query(self, query: str, context: str):
+        """Bounded, cached query embedding; None lets the vector store embed the text itself"""
+        try:
+            return self.embedder.embed_query(query, context)
+        except Exception as e:
+            print(f"Query embedding failed, falling back to text query: {str(e)}")
+            return None
+
+    def generate_solutions(self, incidents: List[Tuple[str, str]]) -> List[SolutionQuery]:
+        """Generate solutions for (context, root_cause) pairs with a single batched documentation search"""
+        if not incidents:
+            return []
+        contexts = [context if isinstance(context, str) else
+                    "\n".join(map(str, context)) if isinstance(context, (list, tuple)) else str(context)
+                    for context, _ in incidents]
+        compressed = [self._compress_solution_context(context) for context in contexts]
+        queries = [f"Provide resolution steps for: {root_cause}" for _, root_cause in incidents]
+        try:
+            try:
+                # Unique query texts, all chunks in one embedding call
+                embeddings = self.embedder.embed_queries(queries, compressed)
+            except Exception as e:
+                print(f"Query embedding failed, falling back to text queries: {str(e)}")
+                embeddings = None
+            batch_results = self.vector_db.search_many(
+                queries=queries,
+                contexts=compressed,
+                top_k=SOLUTION_TOP_K,
+                query_embeddings=embeddings
+            )
+        except Exception as e:
+            print(f"Vector search error: {str(e)}")
+            batch_results = [None] * len(incidents)
+        return [
+            self.generate_solution(context, root_cause, results=results)
+            for (context, root_cause), results in zip(incidents, batch_results)
+        ]
+
+    def store_documentation(self, documents: List[str], sources: Optional[List[str]] = None) -> Dict[str, int]:
+        """Store documentation in ChromaDB, embedding only chunks that are new since the last ingest"""
+        if self.ingestor is None:
+            self.ingestor = DocumentIngestor(self.embedder, self.vector_db, self.mongo_db)
+        return self.ingestor.ingest(documents, sources)
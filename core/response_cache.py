@@ -0,0 +1,173 @@
+import hashlib
+import threading
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+"""Mongo-backed cache of LLM responses, keyed by prompt hash with an optional embedding-similarity tier"""
+
+def create_response_cache(mongo_db, **kwargs) -> Optional["ResponseCache"]:
+    """ResponseCache, or None with a warning when MongoDB is unavailable; the cache is only an optimization"""
+    try:
+        return ResponseCache(mongo_db, **kwargs)
+    except RuntimeError as e:
+        print(f"Warning: response cache disabled: {str(e)}")
+        return None
+
+
+class ResponseCache:
+    """Exact prompt-hash lookups plus nearest-neighbour reuse of responses for similar root causes.
+
+    Entries expire after ttl_seconds and the least recently used ones are evicted beyond max_entries.
+    Entries put() with an embedding can be matched by find_similar(); similarity_threshold=None
+    turns the semantic tier off.
+    """
+
+    def __init__(self, mongo_db, ttl_seconds: int = 7 * 24 * 3600, max_entries: int = 5000,
+                 similarity_threshold: Optional[float] = 0.95):
+        if ttl_seconds <= 0 or max_entries <= 0:
+            raise ValueError("ttl_seconds and max_entries must be positive")
+        self.mongo_db = mongo_db
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.lookups = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self._lock = threading.Lock()
+        # Normalized embeddings of semantic entries, per kind, loaded from Mongo on first use
+        self._vectors: Dict[str, tuple] = {}
+        try:
+            self.mongo_db.ensure_response_cache_indexes()
+        except Exception as e:
+            raise RuntimeError(f"Failed to initialize response cache: {str(e)}")
+
+    @staticmethod
+    def prompt_key(kind: str, model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{kind}\0{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        """Cached payload for an exact prompt key, or None"""
+        try:
+            entry = self.mongo_db.get_cached_response(key)
+        except Exception as e:
+            print(f"Response cache lookup failed: {str(e)}")
+            entry = None
+        with self._lock:
+            self.lookups += 1
+            if entry is None:
+                return None
+            self.exact_hits += 1
+        return entry["payload"]
+
+    def find_similar(self, kind: str, embedding: Sequence[float]) -> Optional[dict]:
+        """Payload of the most similar semantic entry of this kind, if within similarity_threshold.
+
+        Meant as the fallback after get() misses; its hits count towards the same lookup.
+        """
+        if self.similarity_threshold is None:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        match = None
+        if norm:
+            keys, matrix = self._load_vectors(kind)
+            if keys and matrix.shape[1] == query.shape[0]:
+                scores = matrix @ (query / norm)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    match = keys[best], float(scores[best])
+        entry = None
+        if match is not None:
+            try:
+                entry = self.mongo_db.get_cached_response(match[0])
+            except Exception as e:
+                print(f"Response cache lookup failed: {str(e)}")
+            if entry is None:
+                # Expired or evicted since the vectors were loaded
+                self._drop_vector(kind, match[0])
+        if entry is None:
+            return None
+        with self._lock:
+            self.semantic_hits += 1
+        return dict(entry["payload"], similarity=match[1])
+
+    def put(self, kind: str, key: str, payload: dict, embedding: Optional[Sequence[float]] = None) -> None:
+        now = datetime.now(timezone.utc)
+        entry = {
+            "key": key,
+            "kind": kind,
+            "payload": payload,
+            "created_at": now,
+            "last_access": now,
+            "expires_at": now + self.ttl,
+        }
+        if embedding is not None:
+            entry["embedding"] = [float(value) for value in embedding]
+        try:
+            self.mongo_db.save_cached_response(entry)
+            evicted = self.mongo_db.evict_cached_responses(self.max_entries)
+        except Exception as e:
+            print(f"Response cache write failed: {str(e)}")
+            return
+        with self._lock:
+            if evicted:
+                # Evicted keys are not reported back; reload the vectors on next use
+                self._vectors.clear()
+            elif embedding is not None and kind in self._vectors:
+                self._add_vector(kind, key, entry["embedding"])
+
+    def _load_vectors(self, kind: str) -> tuple:
+        with self._lock:
+            cached = self._vectors.get(kind)
+        if cached is not None:
+            return cached
+        keys, rows = [], []
+        try:
+            for entry in self.mongo_db.cached_response_embeddings(kind):
+                keys.append(entry["key"])
+                rows.append(entry["embedding"])
+        except Exception as e:
+            print(f"Response cache lookup failed: {str(e)}")
+            return [], None
+        matrix = self._normalize(rows) if rows else None
+        with self._lock:
+            self._vectors[kind] = (keys, matrix)
+        return keys, matrix
+
+    @staticmethod
+    def _normalize(rows: List[Sequence[float]]) -> np.ndarray:
+        matrix = np.asarray(rows, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _add_vector(self, kind: str, key: str, embedding: List[float]) -> None:
+        keys, matrix = self._vectors[kind]
+        row = self._normalize([embedding])
+        keep = [i for i, existing in enumerate(keys) if existing != key]
+        if matrix is None or not keep or matrix.shape[1] != row.shape[1]:
+            # A different dimension means a different embedding model; older vectors cannot be compared
+            self._vectors[kind] = ([key], row)
+            return
+        self._vectors[kind] = ([keys[i] for i in keep] + [key], np.vstack([matrix[keep], row]))
+
+    def _drop_vector(self, kind: str, key: str) -> None:
+        with self._lock:
+            cached = self._vectors.get(kind)
+            if cached is None or key not in cached[0]:
+                return
+            keys, matrix = cached
+            keep = [i for i, existing in enumerate(keys) if existing != key]
+            self._vectors[kind] = ([keys[i] for i in keep], matrix[keep] if keep else None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                "lookups": self.lookups,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.lookups - hits,
+                "hit_rate": hits / self.lookups if self.lookups else 0.0,
+            }
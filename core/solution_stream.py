@@ -0,0 +1,39 @@
+from typing import Callable, Iterator, List, Optional
+
+"""Streamed solution text with its failure reported beside the text instead of inside it"""
+
+class SolutionStream:
+    """Iterable of solution tokens for display; `response` holds the text streamed so far.
+
+    `sources` are the documents the answer was generated from, which for a cached answer are the cached
+    sources rather than those of a fresh search. A generation failure ends iteration and is reported in `error`, so solution text that mentions
+    errors is never mistaken for one. close() cancels the underlying generation.
+    """
+
+    def __init__(self, tokens: Iterator[str], sources: Optional[List[str]] = None,
+                 on_complete: Optional[Callable[[str], None]] = None, additional_info: Optional[dict] = None):
+        self._tokens = tokens
+        self._on_complete = on_complete
+        self.sources = list(sources or [])
+        self.additional_info = additional_info
+        self.response = ""
+        self.error: Optional[str] = None
+
+    def __iter__(self) -> Iterator[str]:
+        chunks: List[str] = []
+        try:
+            for token in self._tokens:
+                chunks.append(token)
+                yield token
+        except Exception as e:
+            print(f"LLM generation error: {str(e)}")
+            self.error = f"Unable to generate solution from LLM: {str(e)}"
+        finally:
+            self.response = "".join(chunks)
+        if self.error is None and self._on_complete is not None:
+            self._on_complete(self.response)
+
+    def close(self) -> None:
+        close = getattr(self._tokens, "close", None)
+        if close is not None:
+            close()
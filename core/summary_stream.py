@@ -0,0 +1,126 @@
+import json
+from typing import Callable, Iterator, Optional
+from models.rag_response_data_models import SummaryResponse
+
+"""Incremental rendering of a streamed JSON summary"""
+
+class SummaryPointExtractor:
+    """Decodes the strings of the "summary" array out of a JSON document fed in arbitrary chunks.
+
+    feed() returns the newly decoded text as markdown bullets, so points appear while they are generated.
+    """
+
+    KEY = '"summary"'
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.state = "key"  # key -> colon -> between <-> string -> done
+        self._escape = ""
+
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        out = []
+        while self.position < len(self.buffer) and self.state != "done":
+            if self.state == "key":
+                found = self.buffer.find(self.KEY, self.position)
+                if found < 0:
+                    # Keep enough of the tail to match a key split across chunks
+                    self.position = max(self.position, len(self.buffer) - len(self.KEY))
+                    break
+                self.position = found + len(self.KEY)
+                self.state = "colon"
+                continue
+            char = self.buffer[self.position]
+            if self.state == "colon":
+                if char == "[":
+                    self.state = "between"
+                elif char not in ": \t\r\n":
+                    # "summary" was a value, not the key of the array
+                    self.state = "key"
+                    continue
+            elif self.state == "between":
+                if char == '"':
+                    self.state = "string"
+                    out.append("- ")
+                elif char == "]":
+                    self.state = "done"
+            elif self.state == "string":
+                if self._escape:
+                    self._escape += char
+                    if self._escape[1] != "u" or len(self._escape) == 6:
+                        out.append(self._decode_escape(self._escape))
+                        self._escape = ""
+                elif char == "\\":
+                    self._escape = char
+                elif char == '"':
+                    self.state = "between"
+                    out.append("\n")
+                else:
+                    out.append(char)
+            self.position += 1
+        return "".join(out)
+
+    @staticmethod
+    def _decode_escape(escape: str) -> str:
+        try:
+            return json.loads(f'"{escape}"')
+        except ValueError:
+            return ""
+
+
+class SummaryStream:
+    """Iterable of summary text for display; `summary` holds the validated SummaryResponse once iteration ends.
+
+    resolve is called with the full JSON text when the stream completes and returns the SummaryResponse
+    (retrying generation if the JSON does not validate). When it retried, the text already displayed
+    (`streamed`) no longer matches `markdown`, the rendering of the validated summary; redraw it then.
+    `summary` stays None if iteration is cut short. close() cancels the underlying generation.
+    """
+
+    def __init__(self, tokens: Iterator[str], resolve: Callable[[str], SummaryResponse]):
+        self._tokens = tokens
+        self._resolve = resolve
+        self.raw = ""
+        self.streamed = ""
+        self.summary: Optional[SummaryResponse] = None
+
+    @classmethod
+    def from_summary(cls, summary: SummaryResponse) -> "SummaryStream":
+        stream = cls(iter(()), lambda raw: summary)
+        stream.raw = summary.model_dump_json()
+        stream.summary = summary
+        return stream
+
+    @property
+    def markdown(self) -> str:
+        """The validated summary's points as markdown bullets; empty until iteration completes"""
+        if self.summary is None:
+            return ""
+        return "".join(f"- {point}\n" for point in self.summary.summary)
+
+    def __iter__(self) -> Iterator[str]:
+        if self.summary is not None:
+            self.streamed = self.markdown
+            yield self.streamed
+            return
+        extractor = SummaryPointExtractor()
+        chunks, shown = [], []
+        for token in self._tokens:
+            chunks.append(token)
+            text = extractor.feed(token)
+            if text:
+                shown.append(text)
+                self.streamed = "".join(shown)
+                yield text
+        self.raw = "".join(chunks)
+        self.summary = self._resolve(self.raw)
+        if extractor.state == "key":
+            # No summary array was streamed; show the points of the resolved summary instead
+            self.streamed = self.markdown
+            yield self.streamed
+
+    def close(self) -> None:
+        close = getattr(self._tokens, "close", None)
+        if close is not None:
+            close()
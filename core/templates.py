@@ -0,0 +1,38 @@
+import re
+
+"""Masking of variable log tokens and keyword severity inference, shared by log parsing and context compression"""
+
+WILDCARD = "<*>"
+
+# Variable parts masked before clustering. None of the patterns can match whitespace,
+# so masking never changes the token count and masked tokens stay aligned with raw ones.
+VARIABLE_PATTERNS = [
+    re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"),
+    re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b"),
+    re.compile(r"\b0x[0-9a-fA-F]+\b"),
+    re.compile(r"\b[0-9a-fA-F]{16,}\b"),
+    re.compile(r"[-+]?\d+(?:[.,:\-/]\d+)*"),
+]
+
+
+def mask_variables(text: str) -> str:
+    """Replace ids, addresses and numbers with the wildcard token"""
+    for pattern in VARIABLE_PATTERNS:
+        text = pattern.sub(WILDCARD, text)
+    return text
+
+# Keywords that reveal the level of a message logged without one, most severe first
+LEVEL_KEYWORDS = (
+    ("CRITICAL", ("fatal", "panic", "critical")),
+    ("ERROR", ("error", "exception", "fail", "traceback", "refused", "denied")),
+    ("WARNING", ("warn", "retry", "timeout", "timed out", "deprecated")),
+)
+
+
+def infer_level(message: str) -> str:
+    """Level implied by keywords in the message, INFO when none match"""
+    lowered = message.lower()
+    for level, keywords in LEVEL_KEYWORDS:
+        if any(keyword in lowered for keyword in keywords):
+            return level
+    return "INFO"
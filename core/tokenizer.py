@@ -0,0 +1,42 @@
+import re
+from typing import List
+
+"""Dependency-free token estimates for budgeting embedding and prompt inputs"""
+
+# Words, numbers and individual punctuation marks; BPE tokenizers split long words further
+PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Upper-leaning token estimate: the larger of the word/punctuation count and len/4"""
+    if not text:
+        return 0
+    return max(len(PIECE_PATTERN.findall(text)), -(-len(text) // CHARS_PER_TOKEN))
+
+
+def split_by_tokens(text: str, max_tokens: int) -> List[str]:
+    """Split text into pieces of at most max_tokens (estimated), preferring line boundaries"""
+    if max_tokens <= 0:
+        raise ValueError("max_tokens must be positive")
+    chunks, current, current_tokens = [], [], 0
+    for line in text.splitlines():
+        line_tokens = estimate_tokens(line)
+        if line_tokens > max_tokens:
+            # A single oversized line is cut by characters
+            if current:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            width = max_tokens * CHARS_PER_TOKEN
+            pieces = [line[start:start + width] for start in range(0, len(line), width)]
+            chunks.extend(piece for piece in pieces[:-1])
+            current, current_tokens = [pieces[-1]], estimate_tokens(pieces[-1])
+            continue
+        if current and current_tokens + line_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
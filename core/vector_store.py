@@ -0,0 +1,324 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence
+from core.embedding import normalize_embeddings, top_k_indices
+
+"""Vector store backends: the Chroma server or an in-process memory-mapped index"""
+
+VECTOR_BACKENDS = ("chroma", "local")
+DEFAULT_LOCAL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "vector_store")
+
+
+class VectorStore(ABC):
+    """Subset of the Chroma Collection API used by VectorDatabaseHandler; a Chroma collection satisfies it as is"""
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings=None, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[dict]] = None) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, ids: Optional[List[str]] = None, include: Sequence[str] = ("documents", "metadatas"),
+            limit: Optional[int] = None, offset: Optional[int] = None) -> dict:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    def query(self, query_embeddings=None, query_texts: Optional[List[str]] = None, n_results: int = 10,
+              include: Sequence[str] = ("documents", "metadatas", "distances")) -> dict:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+
+class LocalVectorStore(VectorStore):
+    """Normalized float32 rows in a memory-mapped file plus a SQLite sidecar for ids, documents and metadata.
+
+    Queries are exact brute-force cosine search until the store holds ivf_threshold vectors; larger stores
+    use an inverted-file (IVF) index that only scans the n_probe clusters closest to each query.
+    """
+
+    def __init__(self, directory: str, embedding_function=None, ivf_threshold: int = 20_000,
+                 n_probe: int = 8, initial_rows: int = 1024):
+        try:
+            os.makedirs(directory, exist_ok=True)
+            self.directory = directory
+            self.embedding_function = embedding_function
+            self.ivf_threshold = ivf_threshold
+            self.n_probe = n_probe
+            self.initial_rows = initial_rows
+            self._lock = threading.RLock()
+            self._conn = sqlite3.connect(os.path.join(directory, "metadata.sqlite"), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE, document TEXT, metadata TEXT)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS store_meta (name TEXT PRIMARY KEY, value INTEGER)")
+            self._conn.commit()
+
+            meta = dict(self._conn.execute("SELECT name, value FROM store_meta").fetchall())
+            self.dim: Optional[int] = meta.get("dim")
+            self._capacity = meta.get("capacity", 0)
+            self._rows_used = meta.get("rows_used", 0)
+            self._row_ids: List[Optional[str]] = [None] * self._rows_used
+            self._id_rows: Dict[str, int] = {}
+            for chunk_id, row in self._conn.execute("SELECT id, row FROM chunks"):
+                self._row_ids[row] = chunk_id
+                self._id_rows[chunk_id] = row
+            self._free_rows = [row for row, chunk_id in enumerate(self._row_ids) if chunk_id is None]
+            self._live = np.zeros(self._capacity, dtype=bool)
+            self._live[list(self._id_rows.values())] = True
+            self._matrix: Optional[np.memmap] = None
+            if self.dim:
+                self._open_matrix()
+            # IVF state, rebuilt lazily once the store outgrows the last build
+            self._centroids: Optional[np.ndarray] = None
+            self._assignments: Optional[np.ndarray] = None
+            self._indexed_size = 0
+        except Exception as e:
+            raise RuntimeError(f"Failed to open local vector store: {str(e)}")
+
+    @property
+    def _matrix_path(self) -> str:
+        return os.path.join(self.directory, "vectors.f32")
+
+    def _open_matrix(self) -> None:
+        self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode="r+", shape=(self._capacity, self.dim))
+
+    def _grow(self, rows_needed: int) -> None:
+        capacity = max(self._capacity, self.initial_rows)
+        while capacity < rows_needed:
+            capacity *= 2
+        if capacity == self._capacity and self._matrix is not None:
+            return
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self._matrix_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._capacity = capacity
+        self._open_matrix()
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self._live)] = self._live
+        self._live = live
+
+    def _save_meta(self) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO store_meta (name, value) VALUES (?, ?)",
+            [("dim", self.dim), ("capacity", self._capacity), ("rows_used", self._rows_used)]
+        )
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        if self.embedding_function is None:
+            raise ValueError("Local vector store needs embeddings or an embedding function")
+        return np.asarray(self.embedding_function(texts), dtype=np.float32)
+
+    def upsert(self, ids: List[str], embeddings=None, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[dict]] = None) -> None:
+        if not ids:
+            return
+        vectors = self._embed(documents) if embeddings is None else np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("Expected one embedding per id")
+        vectors = normalize_embeddings(vectors)
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}")
+            new_count = sum(1 for chunk_id in set(ids) if chunk_id not in self._id_rows)
+            rows_needed = self._rows_used + max(0, new_count - len(self._free_rows))
+            if rows_needed > self._capacity or self._matrix is None:
+                self._grow(rows_needed)
+
+            records = []
+            rows = []
+            for chunk_id, vector, document, metadata in zip(ids, vectors, documents, metadatas):
+                row = self._id_rows.get(chunk_id)
+                if row is None:
+                    if self._free_rows:
+                        row = self._free_rows.pop()
+                    else:
+                        row = self._rows_used
+                        self._rows_used += 1
+                        self._row_ids.append(None)
+                    self._id_rows[chunk_id] = row
+                    self._row_ids[row] = chunk_id
+                self._matrix[row] = vector
+                rows.append(row)
+                records.append((chunk_id, row, document, json.dumps(metadata) if metadata else None))
+            self._live[rows] = True
+            # Vectors added after the IVF build join their nearest existing cluster
+            self._assign_rows(np.array(rows))
+            self._matrix.flush()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, row, document, metadata) VALUES (?, ?, ?, ?)", records
+            )
+            self._save_meta()
+            self._conn.commit()
+
+    def get(self, ids: Optional[List[str]] = None, include: Sequence[str] = ("documents", "metadatas"),
+            limit: Optional[int] = None, offset: Optional[int] = None) -> dict:
+        with self._lock:
+            if ids is None:
+                ids = [chunk_id for chunk_id in self._row_ids if chunk_id is not None]
+            start = offset or 0
+            ids = ids[start:start + limit] if limit is not None else ids[start:]
+            found = [chunk_id for chunk_id in ids if chunk_id in self._id_rows]
+            result = {"ids": found}
+            if "documents" in include or "metadatas" in include:
+                records = self._fetch(found)
+                if "documents" in include:
+                    result["documents"] = [records[chunk_id][0] for chunk_id in found]
+                if "metadatas" in include:
+                    result["metadatas"] = [records[chunk_id][1] for chunk_id in found]
+            return result
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            removed = []
+            for chunk_id in ids:
+                row = self._id_rows.pop(chunk_id, None)
+                if row is not None:
+                    self._row_ids[row] = None
+                    self._live[row] = False
+                    self._free_rows.append(row)
+                    if self._assignments is not None:
+                        self._assignments[row] = -1
+                    removed.append((chunk_id,))
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", removed)
+            self._conn.commit()
+
+    def count(self) -> int:
+        return len(self._id_rows)
+
+    def query(self, query_embeddings=None, query_texts: Optional[List[str]] = None, n_results: int = 10,
+              include: Sequence[str] = ("documents", "metadatas", "distances")) -> dict:
+        if query_embeddings is None:
+            query_embeddings = self._embed(query_texts)
+        queries = normalize_embeddings(query_embeddings)
+        with self._lock:
+            hits = self._search(queries, n_results)
+            result = {"ids": [[self._row_ids[row] for row, _ in query_hits] for query_hits in hits]}
+            if "distances" in include:
+                # Cosine distance, as in a Chroma collection configured with the cosine space
+                result["distances"] = [[1.0 - score for _, score in query_hits] for query_hits in hits]
+            if "documents" in include or "metadatas" in include:
+                records = self._fetch([chunk_id for query_ids in result["ids"] for chunk_id in query_ids])
+                if "documents" in include:
+                    result["documents"] = [[records[chunk_id][0] for chunk_id in query_ids] for query_ids in result["ids"]]
+                if "metadatas" in include:
+                    result["metadatas"] = [[records[chunk_id][1] for chunk_id in query_ids] for query_ids in result["ids"]]
+            return result
+
+    def _search(self, queries: np.ndarray, k: int) -> List[List[tuple]]:
+        """Top-k (row, cosine similarity) pairs for each query"""
+        if not self._id_rows:
+            return [[] for _ in queries]
+        if len(self._id_rows) >= self.ivf_threshold:
+            self._ensure_ivf()
+            hits = []
+            for query in queries:
+                probes = top_k_indices(self._centroids @ query, self.n_probe)
+                candidates = np.flatnonzero(np.isin(self._assignments[:self._rows_used], probes))
+                scores = self._matrix[candidates] @ query
+                hits.append([(int(candidates[pos]), float(scores[pos])) for pos in top_k_indices(scores, k)])
+            return hits
+
+        # Exact search: one matrix product over every stored row, with free rows masked out
+        scores = self._matrix[:self._rows_used] @ queries.T
+        scores[~self._live[:self._rows_used]] = -np.inf
+        hits = []
+        for column in scores.T:
+            best = [pos for pos in top_k_indices(column, k) if np.isfinite(column[pos])]
+            hits.append([(int(pos), float(column[pos])) for pos in best])
+        return hits
+
+    def _ensure_ivf(self) -> None:
+        """Build (or rebuild after 50% growth) k-means clusters over the stored vectors"""
+        size = len(self._id_rows)
+        if self._centroids is not None and size <= self._indexed_size * 1.5:
+            return
+        live = np.flatnonzero(self._live)
+        n_lists = max(1, min(1024, int(np.sqrt(size))))
+        rng = np.random.default_rng(0)
+        sample = self._matrix[np.sort(rng.choice(live, size=min(len(live), n_lists * 64), replace=False))]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(10):
+            # Spherical k-means: rows and centroids are unit length, so the dot product ranks clusters
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = normalize_embeddings(sums)
+        self._centroids = centroids
+        self._assignments = np.full(self._capacity, -1, dtype=np.int32)
+        for start in range(0, len(live), 8192):
+            self._assign_rows(live[start:start + 8192])
+        self._indexed_size = size
+
+    def _assign_rows(self, rows: np.ndarray) -> None:
+        if self._centroids is None or len(rows) == 0:
+            return
+        if len(self._assignments) < self._capacity:
+            grown = np.full(self._capacity, -1, dtype=np.int32)
+            grown[:len(self._assignments)] = self._assignments
+            self._assignments = grown
+        self._assignments[rows] = np.argmax(self._matrix[rows] @ self._centroids.T, axis=1)
+
+    def _fetch(self, ids: List[str]) -> Dict[str, tuple]:
+        records = {}
+        unique = list(dict.fromkeys(ids))
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for chunk_id, document, metadata in self._conn.execute(
+                f"SELECT id, document, metadata FROM chunks WHERE id IN ({placeholders})", batch
+            ):
+                records[chunk_id] = (document, json.loads(metadata) if metadata else None)
+        return records
+
+    def close(self) -> None:
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+                self._matrix = None
+            self._conn.close()
+
+
+_local_lock = threading.Lock()
+_local_stores: Dict[str, LocalVectorStore] = {}
+
+
+def get_local_store(directory: str, name: str, embedding_function=None) -> LocalVectorStore:
+    """Process-wide LocalVectorStore per directory and collection name"""
+    path = os.path.join(directory, re.sub(r"[^\w.\-]", "_", name))
+    with _local_lock:
+        store = _local_stores.get(path)
+        if store is None:
+            store = _local_stores[path] = LocalVectorStore(path, embedding_function=embedding_function)
+        elif embedding_function is not None:
+            store.embedding_function = embedding_function
+        return store
+
+
+def clear_local_stores() -> None:
+    with _local_lock:
+        for store in _local_stores.values():
+            store.close()
+        _local_stores.clear()
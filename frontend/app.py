@@ -3,12 +3,41 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import streamlit as st
 from utilz.log_parser import LogParser
+from utilz.parse_cache import ParseCache
 from utilz.graph_generator import GraphGenerator
 from utilz.context_builder import ContextBuilder
 from core.database_handlers import MongoDBHandler, VectorDatabaseHandler
 from core.rag import RAG_Engine
+from core.embedding_cache import EmbeddingCache
+from core.response_cache import ResponseCache
+from core.orchestrator import IncidentOrchestrator
 import tempfile
+from typing import Optional
 from models.context_data_models import Context
+import time
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cache")
+
+@st.cache_resource
+def get_parse_cache() -> ParseCache:
+    return ParseCache(os.path.join(CACHE_DIR, "parse_cache.sqlite"))
+
+@st.cache_resource
+def get_embedding_cache() -> EmbeddingCache:
+    return EmbeddingCache(os.path.join(CACHE_DIR, "embeddings"), model_name="nomic-embed-text")
+
+@st.cache_resource
+def load_response_cache() -> ResponseCache:
+    # Raises while MongoDB is down; failures are not cached, so a later run connects once it is back
+    return ResponseCache(MongoDBHandler())
+
+def get_response_cache() -> Optional[ResponseCache]:
+    # None (no caching) when MongoDB is down, so the cache can never take the page down
+    try:
+        return load_response_cache()
+    except RuntimeError as e:
+        print(f"Warning: response cache disabled: {str(e)}")
+        return None
 
 def main():
     st.title("Log Analysis & Incident Resolution System")
@@ -34,7 +63,7 @@ def main():
     
     # Initialize components
     mongo = MongoDBHandler()
-    rag = RAG_Engine()
+    rag = RAG_Engine(embedding_cache=get_embedding_cache(), response_cache=get_response_cache())
     
     # Modified file upload section
     with st.expander("Upload Log File"):
@@ -52,21 +81,37 @@ def main():
                     tmp.write(log_file.getvalue())
                     tmp_path = tmp.name
                 
-                parser = LogParser()
-                log_chain = parser.parse_log_from_file(tmp_path)
-                graph_gen = GraphGenerator(log_chain)
+                parser = LogParser(cache=get_parse_cache())
+                # DAG construction consumes entries while the file is still being parsed
+                graph_gen = GraphGenerator(parser.iter_log_file(tmp_path))
                 dag = graph_gen.generate_dag()
+                log_chain = dag.log_chain
                 
                 # Build context
                 context_builder = ContextBuilder()
                 context = context_builder.build_context(dag)
                 
+                # Documentation search and MongoDB writes run in the background while the summary streams
+                docs_hash = st.session_state.stored_docs['file_hash']
+                pending = IncidentOrchestrator(rag, mongo).start(dag, context, summary=False, solution=False)
+                
                 if log_chain:
-                    summary = rag.generate_summary(context.causal_chain)
                     st.subheader("Log Analysis Summary")
-                    for summary_point in summary.summary:
-                        if summary_point:
-                            st.write(f"• {summary_point}")
+                    # Render tokens as they arrive instead of waiting for the full summary
+                    summary_started = time.perf_counter()
+                    summary_stream = rag.stream_summary(context.causal_chain, context.levels)
+                    summary_placeholder = st.empty()
+                    with summary_placeholder.container():
+                        st.write_stream(summary_stream)
+                    summary = summary_stream.summary
+                    if summary is None:
+                        # Leave processed_log untouched so the next run processes the log again
+                        st.error("Summary generation was interrupted. Please try again.")
+                        st.stop()
+                    if summary_stream.streamed != summary_stream.markdown:
+                        # The streamed output failed validation and was regenerated; show what is stored
+                        summary_placeholder.markdown(summary_stream.markdown)
+                    summary_seconds = time.perf_counter() - summary_started
                     st.subheader("Root Cause")
                     st.write(summary.root_cause_expln)
                     st.subheader("Severity")
@@ -82,10 +127,16 @@ def main():
                     'root_cause': summary.root_cause_expln
                 }
                 
-                # Store in MongoDB (keep this outside session state)
-                mongo.save_dag(dag.model_dump())
-                mongo.save_context(context.model_dump())
-                st.success("Log processed and stored successfully!")
+                analysis = pending.result()
+                st.session_state.processed_log['documents'] = analysis.documents
+                # Documentation the prefetch searched; the search is redone when it changes
+                st.session_state.processed_log['docs_hash'] = docs_hash
+                timings = dict(analysis.timings, summary=summary_seconds)
+                st.caption(" · ".join(f"{stage} {seconds:.1f}s" for stage, seconds in timings.items()))
+                if analysis.persist_error:
+                    st.warning(f"Log processed, but saving it to MongoDB failed: {analysis.persist_error}")
+                else:
+                    st.success("Log processed and stored successfully!")
             else:
                 st.info("Using cached log analysis results")
                 
@@ -124,8 +175,8 @@ def main():
                     'docs': docs
                 }
                 
-                rag.store_documentation(docs)
-                st.success(f"Stored {len(docs)} documentation chunks")
+                stats = rag.store_documentation(docs, sources=[f.name for f in doc_files])
+                st.success(f"Stored {stats['chunks']} documentation chunks ({stats['embedded']} newly embedded)")
             else:
                 st.info("Using cached documentation")
             
@@ -137,38 +188,40 @@ def main():
     with st.expander("Automatic Incident Resolution"):
         if st.session_state.processed_log.get('summary') and st.session_state.processed_log.get('context'):
             try:
-                with st.spinner("Generating solution..."):
-                    # Ensure context is properly formatted before passing
-                    context_data = st.session_state.processed_log['context'].causal_chain
-                    if isinstance(context_data, (list, tuple)):
-                        context_str = "\n".join(context_data)
-                    else:
-                        context_str = str(context_data)
-                    
-                    solution = rag.generate_solution(
-                        context=context_str,
-                        root_cause=st.session_state.processed_log['summary'].root_cause_expln
-                    )
+                # Ensure context is properly formatted before passing
+                context_data = st.session_state.processed_log['context'].causal_chain
+                if isinstance(context_data, (list, tuple)):
+                    context_str = "\n".join(context_data)
+                else:
+                    context_str = str(context_data)
+                # Same root cause the documentation was prefetched for
+                root_cause = st.session_state.processed_log['context'].root_cause
                 
+                results = st.session_state.processed_log.get('documents')
+                docs_hash = st.session_state.stored_docs['file_hash']
+                if results is None or st.session_state.processed_log.get('docs_hash') != docs_hash:
+                    # Documentation uploaded after the log was processed must reach the solution
+                    with st.spinner("Searching documentation..."):
+                        results = rag.retrieve_documentation(context_str, root_cause)
+                    st.session_state.processed_log['documents'] = results
+                    st.session_state.processed_log['docs_hash'] = docs_hash
                 # Display the solution in a clean format
                 st.subheader("🔍 Root Cause Analysis")
                 st.info(st.session_state.processed_log['summary'].root_cause_expln)
                 
                 st.subheader("💡 Recommended Solution")
-                if solution and solution.response:
-                    if "Error:" in solution.response:
-                        st.error(solution.response)
-                    else:
-                        # Split the response into sections if they exist
-                        sections = solution.response.split('\n\n')
-                        for section in sections:
-                          
-                            st.markdown(section.strip())
-                
-                    if solution.sources and any(source != "unknown" for source in solution.sources):
+                # Tokens are rendered as they arrive; leaving the page stops the generation
+                solution_stream = rag.stream_solution(context_str, root_cause, results=results)
+                response = st.write_stream(solution_stream)
+                if solution_stream.error:
+                    st.error(solution_stream.error)
+                if response:
+                    # A cached answer lists the sources it was generated from, not the prefetched documents
+                    sources = solution_stream.sources
+                    if sources and any(source != "unknown" for source in sources):
                         st.subheader("📚 Reference Documents")
                         sources_shown = set()
-                        for source in solution.sources:
+                        for source in sources:
                             if source != "unknown" and source not in sources_shown:
                                 st.markdown(f"- {source}")
                                 sources_shown.add(source)
@@ -7,6 +7,7 @@ class Context(BaseModel):
     """Context information for the log chain"""
     root_cause: str = Field(description="Root cause of the issue")
     causal_chain: list[str] = Field(description="Causal chain of the issue")
+    levels: list[str] = Field(default=[], description="Log level of each causal chain entry")
     
 class Solution(BaseModel):
     response: str = Field(description="Generated solution response text")
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Iterator, Optional
 from .parsing_data_models import LogEntry,LogChain
 from uuid import uuid4
 
@@ -19,4 +19,82 @@ class DAG(BaseModel):
     root_id: str = Field(description="Unique identifier of the root node")
     root_cause: Optional[str] = Field(description="Root cause of the issue")
     leaf_ids: list[str] = Field(description="List of unique identifiers of the leaf nodes")
-    log_chain: LogChain = Field(description="Collection of log entries")
\ No newline at end of file
+    log_chain: LogChain = Field(description="Collection of log entries")
+
+    # Derived lookup structures, built on first use and never serialized; _indexed is cleared when edges change
+    _index: dict[str, int] = PrivateAttr(default_factory=dict)
+    _children: list[list[int]] = PrivateAttr(default_factory=list)
+    _parents: list[int] = PrivateAttr(default_factory=list)
+    _indexed: bool = PrivateAttr(default=False)
+
+    def build_index(self) -> None:
+        """(Re)build the id -> position index and the integer adjacency arrays"""
+        index = {}
+        for pos, node in enumerate(self.nodes):
+            index.setdefault(node.id, pos)
+        self._index = index
+        self._children = [[index[child] for child in node.children if child in index] for node in self.nodes]
+        self._parents = [index.get(node.parent_id, -1) if node.parent_id else -1 for node in self.nodes]
+        self._indexed = True
+
+    def _ensure_index(self) -> None:
+        if not self._indexed:
+            self.build_index()
+
+    def link(self, parent_id: str, child_id: str) -> None:
+        """Add an edge and invalidate the index; edges edited directly on nodes need an explicit build_index()"""
+        parent, child = self.get_node(parent_id), self.get_node(child_id)
+        if parent is None or child is None:
+            raise ValueError(f"Unknown node in edge {parent_id} -> {child_id}")
+        parent.children.append(child_id)
+        child.parent_id = parent_id
+        self._indexed = False
+
+    def node_index(self, node_id: str) -> Optional[int]:
+        """Position of a node in `nodes`, or None if the id is unknown"""
+        self._ensure_index()
+        return self._index.get(node_id)
+
+    def get_node(self, node_id: str) -> Optional[DAGNode]:
+        """O(1) node lookup by id"""
+        pos = self.node_index(node_id)
+        return self.nodes[pos] if pos is not None else None
+
+    @property
+    def children_indices(self) -> list[list[int]]:
+        """Children of every node as positions in `nodes`"""
+        self._ensure_index()
+        return self._children
+
+    @property
+    def parent_indices(self) -> list[int]:
+        """Parent of every node as a position in `nodes`, -1 for roots"""
+        self._ensure_index()
+        return self._parents
+
+    def iter_descendants(self, node_id: str) -> Iterator[DAGNode]:
+        """Pre-order depth-first walk from a node, visiting every reachable node exactly once"""
+        start = self.node_index(node_id)
+        if start is None:
+            return
+        children = self._children
+        visited = bytearray(len(self.nodes))
+        stack = [start]
+        while stack:
+            pos = stack.pop()
+            if visited[pos]:
+                continue
+            visited[pos] = 1
+            yield self.nodes[pos]
+            # Reversed so children are visited in their stored order
+            stack.extend(child for child in reversed(children[pos]) if not visited[child])
+
+    def iter_ancestors(self, node_id: str) -> Iterator[DAGNode]:
+        """Walk from a node up through its parents to the root, starting with the node itself"""
+        pos = self.node_index(node_id)
+        parents = self._parents
+        visited = set()
+        while pos is not None and pos != -1 and pos not in visited:
+            visited.add(pos)
+            yield self.nodes[pos]
+            pos = parents[pos]
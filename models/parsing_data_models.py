@@ -39,6 +39,7 @@ class LogEntry(BaseModel):
     group: str = Field("", description="Group of the log entry")
     trace_id: str = Field("", description="Distributed tracing ID")
     request_id: str = Field("", description="Request ID of the user generating the log")
+    timestamp_ns: Optional[int] = Field(None, description="Timestamp as UTC epoch nanoseconds, filled by timestamp normalization")
 
 class LogChain(BaseModel):
     """Collection of log entries"""
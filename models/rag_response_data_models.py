@@ -1,14 +1,25 @@
 from pydantic import BaseModel, Field
-from typing import  Optional, Dict, Any
+from typing import  Optional, Dict, Any, Literal
+
+Severity = Literal["Critical", "High", "Medium", "Low"]
 
 class SummaryResponse(BaseModel):
     summary: list[str] = Field(description="list of summary points extracted from logs")
     root_cause_expln: str = Field(description="Explanation of the identified root cause")
-    severity: str = Field(description="Severity level of the issue")
+    severity: Severity = Field(description="Severity level of the issue: Critical, High, Medium or Low")
 
 class SolutionQuery(BaseModel):
     context: str = Field(description="Context information for the query")
     query: str = Field(description="Generated or provided query text")
     response: str = Field(description="Solution response from the LLM")
     sources: list[str] = Field(default=[], description="List of documentation sources used")
-    additional_info: Optional[Dict[str, Any]] = Field(None, description="Additional metadata for the query")
\ No newline at end of file
+    additional_info: Optional[Dict[str, Any]] = Field(None, description="Additional metadata for the query")
+
+class IncidentAnalysis(BaseModel):
+    root_cause: str = Field(description="Root cause the documentation search and solution were based on")
+    summary: Optional[SummaryResponse] = Field(None, description="Summary of the causal chain")
+    solution: Optional[SolutionQuery] = Field(None, description="Generated solution")
+    documents: list[Any] = Field(default=[], exclude=True, description="Retrieved documentation chunks")
+    sources: list[str] = Field(default=[], description="Sources of the retrieved documentation")
+    timings: Dict[str, float] = Field(default={}, description="Seconds spent in each stage, plus the end-to-end total")
+    persist_error: Optional[str] = Field(None, description="Why saving the DAG and context to MongoDB failed, if it did")
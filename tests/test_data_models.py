@@ -100,6 +100,45 @@ def test_dag_without_root_cause():
         )
     assert dag.root_cause is None
 
+def test_dag_index_and_traversal():
+    entries = [LogEntry(timestamp="2023-01-01", message=f"m{i}", level="INFO") for i in range(4)]
+    # Diamond: 0 -> (1, 2) -> 3
+    nodes = [
+        DAGNode(id="a", parent_id=None, children=["b", "c"], log_entry=entries[0]),
+        DAGNode(id="b", parent_id="a", children=["d"], log_entry=entries[1]),
+        DAGNode(id="c", parent_id="a", children=["d"], log_entry=entries[2]),
+        DAGNode(id="d", parent_id="c", children=[], log_entry=entries[3]),
+    ]
+    dag = DAG(nodes=nodes, root_id="a", root_cause=None, leaf_ids=["d"], log_chain=LogChain(log_chain=entries))
+
+    assert dag.get_node("c") is nodes[2]
+    assert dag.get_node("missing") is None
+    assert dag.children_indices == [[1, 2], [3], [3], []]
+    assert dag.parent_indices == [-1, 0, 0, 2]
+    assert [node.id for node in dag.iter_descendants("a")] == ["a", "b", "d", "c"]
+    assert [node.id for node in dag.iter_ancestors("d")] == ["d", "c", "a"]
+    assert "_index" not in dag.model_dump()
+
+def test_dag_index_follows_edge_changes():
+    entries = [LogEntry(timestamp="2023-01-01", message=f"m{i}", level="INFO") for i in range(3)]
+    nodes = [
+        DAGNode(id="a", parent_id=None, children=["b"], log_entry=entries[0]),
+        DAGNode(id="b", parent_id="a", children=[], log_entry=entries[1]),
+        DAGNode(id="c", parent_id=None, children=[], log_entry=entries[2]),
+    ]
+    dag = DAG(nodes=nodes, root_id="a", root_cause=None, leaf_ids=["b", "c"], log_chain=LogChain(log_chain=entries))
+    assert [node.id for node in dag.iter_descendants("a")] == ["a", "b"]
+
+    dag.link("b", "c")
+    assert [node.id for node in dag.iter_descendants("a")] == ["a", "b", "c"]
+    assert dag.parent_indices == [-1, 0, 1]
+
+    nodes[0].children.remove("b")
+    dag.build_index()
+    assert [node.id for node in dag.iter_descendants("a")] == ["a"]
+    with pytest.raises(ValueError):
+        dag.link("a", "missing")
+
 # Context Tests
 def test_context_with_empty_causal_chain():
     context = Context(
@@ -117,6 +156,14 @@ def test_summary_response_with_empty_summary():
     )
     assert len(summary.summary) == 0
 
+def test_summary_response_rejects_unknown_severity():
+    with pytest.raises(ValueError):
+        SummaryResponse(
+            summary=["Disk full"],
+            root_cause_expln="Log volume filled /var",
+            severity="very bad"
+        )
+
 # SolutionQuery Tests
 def test_solution_query_with_additional_info():
     query = SolutionQuery(
@@ -1,11 +1,16 @@
 import pytest
 from unittest.mock import Mock, patch, MagicMock
-from core.database_handlers import VectorDatabaseHandler, MongoDBHandler, Document
+import numpy as np
+from core import chroma_registry, bm25
+from core.vector_store import LocalVectorStore, clear_local_stores
+from core.database_handlers import VectorDatabaseHandler, MongoDBHandler, Document, content_digest
 from pymongo.results import InsertOneResult
 from chromadb.api.models.Collection import Collection
 
 @pytest.fixture
 def vector_db():
+    chroma_registry.clear()
+    bm25.clear()
     with patch('chromadb.HttpClient') as mock_client:
         with patch('chromadb.utils.embedding_functions.OllamaEmbeddingFunction'):
             handler = VectorDatabaseHandler()
@@ -15,6 +20,8 @@ def vector_db():
             mock_collection = MagicMock(spec=Collection)
             client_instance.get_or_create_collection.return_value = mock_collection
             yield handler
+    chroma_registry.clear()
+    bm25.clear()
 
 @pytest.fixture
 def mongo_db():
@@ -37,6 +44,30 @@ class TestVectorDatabaseHandler:
         )
         assert collection == vector_db.client.get_or_create_collection.return_value
 
+    def test_client_and_collection_are_shared(self, vector_db):
+        second = VectorDatabaseHandler()
+        assert second.client is vector_db.client
+        assert second.ef is vector_db.ef
+        vector_db.client.heartbeat.assert_called_once()
+
+        collection = vector_db.get_collection()
+        collection.query.return_value = {"documents": [["doc"]], "metadatas": [[{"source": "a.md"}]]}
+        vector_db.search("query", "context")
+        second.search("query", "context")
+
+        # After the first lookup each search is a single query request
+        vector_db.client.get_or_create_collection.assert_called_once()
+        assert collection.query.call_count == 2
+        collection.count.assert_not_called()
+
+    def test_query_error_invalidates_collection(self, vector_db):
+        collection = vector_db.get_collection()
+        collection.query.side_effect = Exception("collection deleted")
+        vector_db.search("query", "context")
+
+        vector_db.get_collection()
+        assert vector_db.client.get_or_create_collection.call_count == 2
+
     def test_add_documents(self, vector_db):
         test_docs = ["doc1", "doc2"]
         test_embeddings = [[0.1, 0.2], [0.3, 0.4]]
@@ -44,12 +75,27 @@ class TestVectorDatabaseHandler:
         vector_db.add_documents(test_docs, test_embeddings)
         
         collection = vector_db.get_collection()
-        collection.add.assert_called_once_with(
+        collection.upsert.assert_called_once_with(
             documents=test_docs,
-            ids=[str(hash(doc)) for doc in test_docs],
+            ids=[content_digest(doc) for doc in test_docs],
             embeddings=test_embeddings
         )
 
+    def test_add_documents_ids_are_stable_and_deduplicated(self, vector_db):
+        vector_db.add_documents(["same", "other", "same"], [[0.1], [0.2], [0.1]],
+                                metadatas=[{"source": "a"}, {"source": "b"}, {"source": "c"}])
+
+        collection = vector_db.get_collection()
+        records = collection.upsert.call_args.kwargs
+        assert records["ids"] == [content_digest("same"), content_digest("other")]
+        assert records["metadatas"] == [{"source": "a"}, {"source": "b"}]
+        # Same id in every process, unlike the salted hash()
+        assert content_digest("same") == "0967115f2813a3541eaef77de9d9d577"
+
+    def test_delete_documents(self, vector_db):
+        vector_db.delete_documents(["id1", "id2"])
+        vector_db.get_collection().delete.assert_called_once_with(ids=["id1", "id2"])
+
     def test_query_collection(self, vector_db):
         test_query = ["test query"]
         vector_db.query_collection(test_query, n_results=5)
@@ -92,6 +138,145 @@ class TestVectorDatabaseHandler:
         assert len(results) == 1
         assert "Error executing query" in results[0].text
 
+    def test_search_with_query_embedding(self, vector_db):
+        collection = vector_db.get_collection()
+        collection.query.return_value = {"documents": [["doc"]], "metadatas": [[{"source": "a.md"}]]}
+
+        vector_db.search("query", "a very long context", top_k=1, query_embedding=[0.1, 0.2])
+
+        kwargs = collection.query.call_args.kwargs
+        assert kwargs["query_embeddings"] == [[0.1, 0.2]]
+        assert "query_texts" not in kwargs
+
+    def test_search_many_coalesces_queries(self, vector_db):
+        vector_db.ef = Mock(side_effect=lambda texts: [[float(len(text))] for text in texts])
+        collection = vector_db.get_collection()
+        collection.query.return_value = {
+            "documents": [["disk doc"], ["memory doc"]],
+            "metadatas": [[{"source": "disk.md"}], [{"source": "memory.md"}]]
+        }
+
+        results = vector_db.search_many(["disk full", "oom", "disk full"], top_k=3)
+
+        vector_db.ef.assert_called_once_with(["disk full\nContext: ", "oom\nContext: "])
+        collection.query.assert_called_once_with(
+            query_embeddings=[[19.0], [13.0]],
+            n_results=vector_db.candidates,
+            include=["documents", "metadatas"]
+        )
+        assert [[doc.metadata["source"] for doc in docs] for docs in results] == [["disk.md"], ["memory.md"], ["disk.md"]]
+        assert results[0] is not results[2]
+
+    def test_search_many_error_returns_error_documents(self, vector_db):
+        vector_db.ef = Mock(side_effect=Exception("embedding service down"))
+        results = vector_db.search_many(["a", "b"], contexts=["x", "y"])
+        assert len(results) == 2
+        assert all(docs[0].metadata["source"] == "error" for docs in results)
+
+class TestLocalVectorStore:
+    def test_upsert_query_delete(self, tmp_path):
+        store = LocalVectorStore(str(tmp_path), initial_rows=2)
+        store.upsert(ids=["a", "b", "c"], embeddings=[[1, 0, 0], [0, 1, 0], [0.9, 0.1, 0]],
+                     documents=["doc a", "doc b", "doc c"], metadatas=[{"source": "a.md"}, None, None])
+
+        results = store.query(query_embeddings=[[1, 0, 0], [0, 1, 0]], n_results=2)
+        assert results["ids"] == [["a", "c"], ["b", "c"]]
+        assert results["documents"][0] == ["doc a", "doc c"]
+        assert results["metadatas"][0][0] == {"source": "a.md"}
+        assert results["distances"][0][0] == pytest.approx(0.0, abs=1e-6)
+
+        store.delete(["a"])
+        store.upsert(ids=["c"], embeddings=[[0, 0, 1]], documents=["doc c v2"])
+        assert store.query(query_embeddings=[[1, 0, 0]], n_results=5)["ids"] == [["b", "c"]]
+        assert store.get(ids=["a", "b"], include=[]) == {"ids": ["b"]}
+        store.close()
+
+        reopened = LocalVectorStore(str(tmp_path))
+        assert reopened.count() == 2
+        assert reopened.get(ids=["c"])["documents"] == ["doc c v2"]
+        reopened.close()
+
+    def test_ivf_matches_exact_search(self, tmp_path):
+        rng = np.random.default_rng(1)
+        centers = rng.normal(size=(20, 16))
+        vectors = centers[rng.integers(0, 20, size=3000)] + rng.normal(scale=0.05, size=(3000, 16))
+        store = LocalVectorStore(str(tmp_path), ivf_threshold=1000, n_probe=8)
+        store.upsert(ids=[str(i) for i in range(3000)], embeddings=vectors)
+
+        queries = vectors[:50] + rng.normal(scale=0.01, size=(50, 16))
+        approximate = store.query(query_embeddings=queries, n_results=1, include=[])["ids"]
+        assert store._centroids is not None
+        assert sum(ids == [str(i)] for i, ids in enumerate(approximate)) >= 45
+        store.close()
+
+    def test_handler_local_backend(self, tmp_path):
+        with patch('chromadb.HttpClient') as mock_client:
+            handler = VectorDatabaseHandler(backend="local", local_path=str(tmp_path))
+            mock_client.assert_not_called()
+        handler.ef = Mock(side_effect=lambda texts: [[1.0, float("disk" in text)] for text in texts])
+
+        handler.add_documents(["disk full runbook", "login runbook"], [[1.0, 1.0], [1.0, 0.0]],
+                              metadatas=[{"source": "disk.md"}, {"source": "auth.md"}])
+        results = handler.search("disk", "context", top_k=1)
+        assert [doc.metadata["source"] for doc in results] == ["disk.md"]
+        assert handler.existing_ids([content_digest("login runbook"), "missing"]) == {content_digest("login runbook")}
+        clear_local_stores()
+
+class TestHybridSearch:
+    def test_tokenize_keeps_identifiers(self):
+        tokens = bm25.tokenize("Raised java.lang.NullPointerException with ERR_CONN_REFUSED (E1234)")
+        assert "java.lang.nullpointerexception" in tokens
+        assert "nullpointerexception" in tokens
+        assert "err_conn_refused" in tokens
+        assert "e1234" in tokens
+
+    def test_bm25_ranking_and_removal(self):
+        index = bm25.BM25Index()
+        index.add(["a", "b", "c"], ["disk full on node", "ERR_DISK_QUOTA exceeded on disk", "login failed"])
+        # The whole identifier ranks first; its parts still give partial credit
+        assert [doc_id for doc_id, _ in index.search("ERR_DISK_QUOTA")] == ["b", "a"]
+
+        index.remove(["b"])
+        assert [doc_id for doc_id, _ in index.search("ERR_DISK_QUOTA")] == ["a"]
+        assert "err_disk_quota" not in index.postings
+        assert len(index) == 2
+
+    def test_reciprocal_rank_fusion(self):
+        fused = bm25.reciprocal_rank_fusion([["x", "y", "z"], ["z", "x"]])
+        assert [doc_id for doc_id, _ in fused] == ["x", "z", "y"]
+
+    def test_exact_token_beats_vector_neighbour(self, tmp_path):
+        bm25.clear()
+        handler = VectorDatabaseHandler(backend="local", local_path=str(tmp_path))
+        # The embedding favours the generic guide for every query
+        handler.ef = Mock(side_effect=lambda texts: [[1.0, 0.0] for _ in texts])
+        handler.add_documents(
+            ["Networking guide: check DNS and routes", "ERR_CONN_REFUSED: restart the proxy sidecar"],
+            [[1.0, 0.0], [0.0, 1.0]],
+            metadatas=[{"source": "network.md"}, {"source": "proxy.md"}]
+        )
+
+        results = handler.search("Provide resolution steps for: ERR_CONN_REFUSED", "context", top_k=1)
+        assert [doc.metadata["source"] for doc in results] == ["proxy.md"]
+
+        handler.delete_documents([content_digest("ERR_CONN_REFUSED: restart the proxy sidecar")])
+        results = handler.search("ERR_CONN_REFUSED", "context", top_k=1)
+        assert [doc.metadata["source"] for doc in results] == ["network.md"]
+        clear_local_stores()
+        bm25.clear()
+
+    def test_index_rebuilt_from_store(self, tmp_path):
+        bm25.clear()
+        handler = VectorDatabaseHandler(backend="local", local_path=str(tmp_path))
+        handler.ef = Mock(side_effect=lambda texts: [[1.0, 0.0] for _ in texts])
+        handler.add_documents(["ERR_TIMEOUT in upstream"], [[0.0, 1.0]])
+        bm25.clear()
+
+        # A new process starts without an index; it is loaded from the store on first search
+        assert [doc_id for doc_id, _ in handler.lexical_index().search("err_timeout")] == [content_digest("ERR_TIMEOUT in upstream")]
+        clear_local_stores()
+        bm25.clear()
+
 class TestMongoDBHandler:
     def test_save_dag(self, mongo_db):
         mock_result = MagicMock(spec=InsertOneResult)
@@ -128,3 +313,29 @@ class TestMongoDBHandler:
         
         mongo_db.db["contexts"].insert_one.assert_called_once_with(test_context)
         assert result.inserted_id == "context_123"
+
+    def test_doc_manifests(self, mongo_db):
+        manifests = mongo_db.db["doc_manifests"]
+        manifests.find.return_value = [{"source": "runbook.md", "chunk_ids": ["a", "b"]}]
+
+        assert mongo_db.get_doc_manifests(["runbook.md"])["runbook.md"]["chunk_ids"] == ["a", "b"]
+        assert mongo_db.referenced_chunk_ids(["b", "c"]) == {"b"}
+
+        mongo_db.save_doc_manifest("runbook.md", "digest", ["a"])
+        query, document = manifests.replace_one.call_args.args
+        assert query == {"source": "runbook.md"}
+        assert document["chunk_ids"] == ["a"]
+        assert manifests.replace_one.call_args.kwargs == {"upsert": True}
+
+    def test_response_cache_eviction(self, mongo_db):
+        cache = mongo_db.db["response_cache"]
+        cache.estimated_document_count.return_value = 105
+        cache.find.return_value.sort.return_value.limit.return_value = [{"_id": i} for i in range(15)]
+        cache.delete_many.return_value.deleted_count = 15
+
+        assert mongo_db.evict_cached_responses(100) == 15
+        cache.find.return_value.sort.assert_called_once_with("last_access", 1)
+        cache.find.return_value.sort.return_value.limit.assert_called_once_with(15)
+
+        cache.estimated_document_count.return_value = 50
+        assert mongo_db.evict_cached_responses(100) == 0
@@ -1,7 +1,11 @@
 import unittest
+import tempfile
 from unittest.mock import patch, Mock
 import numpy as np
-from core.embedding import EmbeddingCreator
+from core.embedding import EmbeddingCreator, normalize_embeddings
+from core.embedding_cache import EmbeddingCache
+from core.embedding_scheduler import EmbeddingScheduler
+from core.tokenizer import estimate_tokens, split_by_tokens
 
 class TestEmbeddingCreator(unittest.TestCase):
     def setUp(self):
@@ -51,6 +55,26 @@ class TestEmbeddingCreator(unittest.TestCase):
         with self.assertRaises(ZeroDivisionError):
             self.embedder.get_similarity([], [])
     
+    def test_vectorized_similarities_match_scalar(self):
+        rng = np.random.default_rng(0)
+        query = rng.normal(size=16)
+        matrix = rng.normal(size=(50, 16))
+        scores = self.embedder.get_similarities(query, matrix)
+        self.assertEqual(scores.dtype, np.float32)
+        for row, score in zip(matrix, scores):
+            self.assertAlmostEqual(self.embedder.get_similarity(query, row), float(score), places=5)
+
+        pairwise = self.embedder.get_similarity_matrix(matrix)
+        self.assertEqual(pairwise.shape, (50, 50))
+        np.testing.assert_allclose(np.diag(pairwise), 1.0, atol=1e-5)
+
+    def test_top_k_similar(self):
+        matrix = normalize_embeddings([[1, 0], [0, 1], [1, 1], [-1, 0]])
+        result = self.embedder.top_k_similar([1, 0.1], matrix, k=2, normalized=True)
+        self.assertEqual([idx for idx, _ in result], [0, 2])
+        self.assertGreater(result[0][1], result[1][1])
+        self.assertEqual(len(self.embedder.top_k_similar([1, 0], matrix, k=10)), 4)
+
     @patch('core.embedding.OllamaEmbeddingFunction')
     def test_error_handling_in_embeddings(self, mock_embedding):
         # Create a mock instance that raises an exception
@@ -69,6 +93,152 @@ class TestEmbeddingCreator(unittest.TestCase):
             self.embedder.create_embedding(self.sample_text)
         self.assertTrue("API failure" in str(context.exception))
 
+    @patch('core.embedding.OllamaEmbeddingFunction')
+    def test_embedding_cache_skips_repeated_texts(self, mock_embedding):
+        mock_instance = Mock(side_effect=lambda texts: [np.array([len(t), 1.0], dtype=np.float32) for t in texts])
+        mock_embedding.return_value = mock_instance
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = EmbeddingCache(tmp_dir, model_name="nomic-embed-text")
+            embedder = EmbeddingCreator(cache=cache)
+
+            first = embedder.create_batch_embeddings(["alpha", "beta", "alpha"])
+            second = embedder.create_batch_embeddings(["beta", "gamma"])
+            self.assertEqual(mock_instance.call_args_list[0].args[0], ["alpha", "beta"])
+            self.assertEqual(mock_instance.call_args_list[1].args[0], ["gamma"])
+            np.testing.assert_array_equal(first[1], second[0])
+            self.assertEqual(cache.stats()["hits"], 1)
+            cache.close()
+
+            # Entries survive a restart
+            reopened = EmbeddingCache(tmp_dir, model_name="nomic-embed-text")
+            np.testing.assert_array_equal(reopened.get_many(["gamma"])[0], [5.0, 1.0])
+            reopened.close()
+
+    @patch('core.embedding.OllamaEmbeddingFunction')
+    def test_embed_query_short_context(self, mock_embedding):
+        mock_instance = Mock(return_value=[np.array([3.0, 4.0], dtype=np.float32)])
+        mock_embedding.return_value = mock_instance
+        embedder = EmbeddingCreator()
+
+        embedding = embedder.embed_query("disk full", "step 0")
+        mock_instance.assert_called_once_with(["disk full\nContext: step 0"])
+        np.testing.assert_array_equal(embedding, [3.0, 4.0])
+
+    @patch('core.embedding.OllamaEmbeddingFunction')
+    def test_embed_query_long_context_is_pooled_under_budget(self, mock_embedding):
+        mock_instance = Mock(side_effect=lambda texts: [np.array([1.0, float(i % 2)], dtype=np.float32)
+                                                        for i in range(len(texts))])
+        mock_embedding.return_value = mock_instance
+        embedder = EmbeddingCreator(query_chunk_tokens=64, query_token_budget=256)
+        context = "\n".join(f"step {i}: service call timed out after retry" for i in range(500))
+
+        embedding = embedder.embed_query("root cause", context)
+        chunks = mock_instance.call_args.args[0]
+        self.assertEqual(mock_instance.call_count, 1)
+        self.assertGreater(len(chunks), 1)
+        self.assertLessEqual(sum(estimate_tokens(chunk) for chunk in chunks), 256)
+        self.assertTrue(all(chunk.startswith("root cause\nContext: ") for chunk in chunks))
+        self.assertIn("step 0:", chunks[0])
+        self.assertEqual(embedding.shape, (2,))
+
+
+    @patch('core.embedding.OllamaEmbeddingFunction')
+    def test_embed_queries_single_call_deduplicated(self, mock_embedding):
+        mock_instance = Mock(side_effect=lambda texts: [np.array([float(i), 1.0], dtype=np.float32)
+                                                        for i in range(len(texts))])
+        mock_embedding.return_value = mock_instance
+        embedder = EmbeddingCreator(query_chunk_tokens=64, query_token_budget=256)
+        long_context = "\n".join(f"step {i}: service call timed out after retry" for i in range(500))
+
+        embeddings = embedder.embed_queries(["disk full", "oom", "disk full"], ["ctx", long_context, "ctx"])
+
+        self.assertEqual(mock_instance.call_count, 1)
+        texts = mock_instance.call_args.args[0]
+        self.assertEqual(texts.count("disk full\nContext: ctx"), 1)
+        self.assertEqual(len(embeddings), 3)
+        np.testing.assert_array_equal(embeddings[0], embeddings[2])
+        np.testing.assert_array_equal(embeddings[0], [0.0, 1.0])
+
+class TestTokenizer(unittest.TestCase):
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("disk full"), 3)
+        self.assertEqual(estimate_tokens("ERR_CONN_REFUSED at 10.0.0.1"), 9)
+
+    def test_split_by_tokens(self):
+        text = "\n".join(f"line {i}" for i in range(100)) + "\n" + "x" * 500
+        chunks = split_by_tokens(text, 20)
+        self.assertEqual("\n".join(chunks).replace("\n", ""), text.replace("\n", ""))
+        self.assertTrue(all(estimate_tokens(chunk) <= 20 for chunk in chunks))
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = EmbeddingCache(tmp_dir, model_name="test", max_rows=10, initial_rows=2)
+            cache.put_many([f"text {i}" for i in range(10)], np.eye(10, 4, dtype=np.float32))
+            cache.get_many(["text 0"])
+            cache.put_many(["text 10"], [[1.0, 1.0, 1.0, 1.0]])
+
+            # One overflow evicts the two least recently used rows (10% headroom); "text 0" was just read
+            self.assertEqual(len(cache), 9)
+            self.assertIsNotNone(cache.get_many(["text 0"])[0])
+            remaining = cache.get_many([f"text {i}" for i in range(1, 10)])
+            self.assertEqual(sum(vector is None for vector in remaining), 2)
+            np.testing.assert_array_equal(cache.get_many(["text 10"])[0], [1.0, 1.0, 1.0, 1.0])
+            cache.close()
+
+    def test_rejects_dimension_mismatch(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = EmbeddingCache(tmp_dir, model_name="test")
+            cache.put_many(["a"], [[1.0, 2.0]])
+            with self.assertRaises(ValueError):
+                cache.put_many(["b"], [[1.0, 2.0, 3.0]])
+            cache.close()
+
+
+class TestEmbeddingScheduler(unittest.TestCase):
+    def test_results_keep_input_order(self):
+        batches = []
+        def embed(batch):
+            batches.append(list(batch))
+            return [[float(text.split()[1])] for text in batch]
+
+        scheduler = EmbeddingScheduler(embed, batch_size=4, max_batch_size=4, max_in_flight=3)
+        texts = [f"text {i}" for i in range(25)]
+        self.assertEqual(scheduler.embed(texts), [[float(i)] for i in range(25)])
+        self.assertTrue(all(len(batch) <= 4 for batch in batches))
+        self.assertEqual(sorted(text for batch in batches for text in batch), sorted(texts))
+
+    def test_failed_batch_retried_per_item(self):
+        def embed(batch):
+            if len(batch) > 1 and "bad" in batch:
+                raise TimeoutError("request timed out")
+            return [[len(text)] for text in batch]
+
+        scheduler = EmbeddingScheduler(embed, batch_size=4, retry_backoff=0)
+        self.assertEqual(scheduler.embed(["a", "bad", "ccc", "dd", "e"]), [[1], [3], [3], [2], [1]])
+        self.assertEqual(scheduler.retried_items, 4)
+
+    def test_unrecoverable_item_raises(self):
+        def embed(batch):
+            raise ConnectionError("ollama unavailable")
+
+        scheduler = EmbeddingScheduler(embed, batch_size=2, max_retries=1, retry_backoff=0)
+        with self.assertRaises(RuntimeError):
+            scheduler.embed(["a", "b"])
+
+    def test_batch_size_adapts_to_latency(self):
+        scheduler = EmbeddingScheduler(lambda batch: [[0.0]] * len(batch), batch_size=8,
+                                       max_batch_size=64, max_in_flight=1, target_latency=1.0)
+        scheduler.embed(["x"] * 100)
+        self.assertEqual(scheduler.batch_size, 64)
+
+        scheduler._adapt(5.0)
+        self.assertEqual(scheduler.batch_size, 32)
+        scheduler._adapt(None)
+        self.assertEqual(scheduler.batch_size, 16)
+
 
 if __name__ == '__main__':
     unittest.main()
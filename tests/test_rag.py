@@ -1,10 +1,20 @@
 import pytest
 from unittest.mock import Mock, patch, MagicMock
-from core.rag import RAG_Engine
+from core.rag import RAG_Engine, SUMMARY_PROMPT
+from core.database_handlers import content_digest, Document as DBDocument
+from core.ingest import DocumentIngestor, chunk_document
+from core.context_compression import compress_context, severity_of, SEVERITY_RANK
+from utilz.rule_parser import RuleBasedParser
+from core.tokenizer import estimate_tokens
+from core.response_cache import ResponseCache, create_response_cache
+from core.orchestrator import IncidentOrchestrator
+from core.summary_stream import SummaryPointExtractor
+from models.context_data_models import Context
 from models.rag_response_data_models import SummaryResponse, SolutionQuery
 from langchain.schema import Document
 import ollama
 import json
+import time
 
 @pytest.fixture
 def mock_ollama():
@@ -13,7 +23,13 @@ def mock_ollama():
 
 @pytest.fixture
 def rag_engine(mock_ollama):
-    return RAG_Engine()
+    # Never wait on a live Chroma server or MongoDB
+    with patch('core.chroma_registry.get_client', return_value=MagicMock()), \
+            patch('core.rag.MongoDBHandler', MagicMock):
+        engine = RAG_Engine()
+    engine.mongo_db.get_doc_manifests.return_value = {}
+    engine.mongo_db.referenced_chunk_ids.return_value = set()
+    return engine
 
 @pytest.fixture
 def sample_docs():
@@ -23,7 +39,11 @@ class TestRAGEngine:
     def test_generate_summary_success(self, rag_engine, mock_ollama):
         # Mock Ollama response
         mock_response = {
-            'response': "Summary line 1\nSummary line 2",
+            'response': json.dumps({
+                "summary": ["Summary line 1", "Summary line 2"],
+                "root_cause_expln": "Connection pool exhausted",
+                "severity": "Critical"
+            }),
             'status_code': 200
         }
         rag_engine.ollama_client.generate = Mock(return_value=mock_response)
@@ -33,14 +53,39 @@ class TestRAGEngine:
         
         assert isinstance(result, SummaryResponse)
         assert len(result.summary) == 2
-        assert result.root_cause_expln == "Identified via log analysis"
-        assert result.severity == "High"
+        assert result.root_cause_expln == "Connection pool exhausted"
+        assert result.severity == "Critical"
         rag_engine.ollama_client.generate.assert_called_once_with(
             model="llama3.2:3b",
-            prompt=f"Summarize this log context and identify root cause:\n{'\n'.join(context)}",
+            prompt=SUMMARY_PROMPT.format(context="\n".join(context)),
+            format="json",
             options={"temperature": 0.2}
         )
 
+    def test_generate_summary_retries_only_invalid_json(self, rag_engine):
+        valid = json.dumps({"summary": ["Disk full"], "root_cause_expln": "Log volume filled /var", "severity": "High"})
+        rag_engine.ollama_client.generate = Mock(side_effect=[{'response': '{"summary": "not a list"}'}, {'response': valid}])
+
+        result = rag_engine.generate_summary(["disk full"])
+
+        assert result.root_cause_expln == "Log volume filled /var"
+        assert rag_engine.ollama_client.generate.call_count == 2
+
+        rag_engine.ollama_client.generate = Mock(return_value={'response': 'plain text'})
+        result = rag_engine.generate_summary(["disk full"])
+        assert result.summary == ["plain text"]
+        assert rag_engine.ollama_client.generate.call_count == 2
+
+    def test_generate_summary_retries_invalid_severity(self, rag_engine):
+        invalid = json.dumps({"summary": ["Disk full"], "root_cause_expln": "Log volume filled /var", "severity": "very bad"})
+        valid = json.dumps({"summary": ["Disk full"], "root_cause_expln": "Log volume filled /var", "severity": "Medium"})
+        rag_engine.ollama_client.generate = Mock(side_effect=[{'response': invalid}, {'response': valid}])
+
+        result = rag_engine.generate_summary(["disk full"])
+
+        assert result.severity == "Medium"
+        assert rag_engine.ollama_client.generate.call_count == 2
+
     def test_generate_solution_success(self, rag_engine):
         # Setup mocks
         mock_doc = Document(
@@ -87,12 +132,149 @@ class TestRAGEngine:
         # Mock dependencies
         rag_engine.embedder.create_batch_embeddings = Mock(return_value=[[0.1]*768]*3)
         rag_engine.vector_db.add_documents = Mock()
-        rag_engine.vector_db.get_collection = Mock(return_value=MagicMock(count=Mock(return_value=3)))
+        rag_engine.vector_db.existing_ids = Mock(return_value=set())
         
         rag_engine.store_documentation(sample_docs)
         
         rag_engine.vector_db.add_documents.assert_called_once()
         assert rag_engine.embedder.create_batch_embeddings.call_count == 1
+        rag_engine.mongo_db.get_doc_manifests.assert_called_once()
+        assert rag_engine.mongo_db.save_doc_manifest.call_count == 3
+
+    def test_store_documentation_reingest_is_incremental(self, rag_engine):
+        rag_engine.embedder.create_batch_embeddings = Mock(side_effect=lambda texts: [[0.1]*768]*len(texts))
+        rag_engine.vector_db.add_documents = Mock()
+        rag_engine.vector_db.delete_documents = Mock()
+        rag_engine.vector_db.existing_ids = Mock(return_value=set())
+        rag_engine.mongo_db.get_doc_manifests.return_value = {
+            "unchanged.md": {"doc_digest": content_digest("same text"), "chunk_ids": [content_digest("same text")]},
+            "edited.md": {"doc_digest": "old", "chunk_ids": [content_digest("old text")]},
+        }
+
+        stats = rag_engine.store_documentation(["same text", "new text"], sources=["unchanged.md", "edited.md"])
+
+        rag_engine.embedder.create_batch_embeddings.assert_called_once_with(["new text"])
+        rag_engine.vector_db.delete_documents.assert_called_once_with({content_digest("old text")})
+        assert stats["unchanged_documents"] == 1
+        assert stats["embedded"] == 1
+
+    def test_generate_solutions_single_search(self, rag_engine):
+        rag_engine.vector_db.search = Mock()
+        rag_engine.vector_db.search_many = Mock(return_value=[
+            [DBDocument(text="doc a", metadata={"source": "a.md"})],
+            [DBDocument(text="doc b", metadata={"source": "b.md"})],
+        ])
+        rag_engine.ollama_client.generate = Mock(return_value={'response': 'fix it'})
+
+        rag_engine.embedder.embed_queries = Mock(return_value=[[0.1], [0.2]])
+
+        solutions = rag_engine.generate_solutions([("ctx 1", "disk full"), (["ctx", "2"], "oom")])
+
+        rag_engine.embedder.embed_queries.assert_called_once()
+        assert rag_engine.vector_db.search_many.call_args.kwargs["query_embeddings"] == [[0.1], [0.2]]
+        rag_engine.vector_db.search_many.assert_called_once()
+        rag_engine.vector_db.search.assert_not_called()
+        assert [solution.sources for solution in solutions] == [["a.md"], ["b.md"]]
+        assert solutions[1].context == "ctx\n2"
+
+    def test_stream_summary_yields_tokens(self, rag_engine):
+        rag_engine.ollama_client.generate = Mock(return_value=iter([
+            {'response': '{"summary": ["Summary'}, {'response': ' line 1", '}, {'response': ''},
+            {'response': '"Summary line 2"], "root_cause_expln": "pool", "severity": "High"}'}
+        ]))
+
+        stream = rag_engine.stream_summary(["Error log 1", "Warning log 2"])
+        tokens = list(stream)
+
+        assert tokens == ['- Summary', ' line 1\n', '- Summary line 2\n']
+        assert rag_engine.ollama_client.generate.call_args.kwargs["stream"] is True
+        assert rag_engine.ollama_client.generate.call_args.kwargs["format"] == "json"
+        assert stream.summary.summary == ["Summary line 1", "Summary line 2"]
+        assert stream.summary.root_cause_expln == "pool"
+        assert stream.streamed == stream.markdown
+
+    def test_stream_summary_retry_differs_from_streamed(self, rag_engine):
+        rejected = {'response': json.dumps({"summary": ["Rejected"], "root_cause_expln": "pool", "severity": "very bad"})}
+        valid = {'response': json.dumps({"summary": ["Accepted"], "root_cause_expln": "pool", "severity": "Low"})}
+        rag_engine.ollama_client.generate = Mock(side_effect=[iter([rejected]), valid])
+
+        stream = rag_engine.stream_summary(["Error log 1"])
+        assert stream.markdown == ""
+        list(stream)
+
+        assert stream.streamed == "- Rejected\n"
+        assert stream.markdown == "- Accepted\n"
+        assert stream.summary.severity == "Low"
+
+    def test_stream_solution_cancel_closes_stream(self, rag_engine):
+        stream = MagicMock()
+        stream.__iter__.return_value = iter([{'response': 'Step 1'}, {'response': 'Step 2'}])
+        rag_engine.ollama_client.generate = Mock(return_value=stream)
+        rag_engine.vector_db.search = Mock()
+
+        solution = rag_engine.stream_solution("ctx", "disk full", results=[DBDocument(text="doc", metadata={})])
+        assert next(iter(solution)) == 'Step 1'
+        solution.close()
+
+        stream.close.assert_called_once()
+        rag_engine.vector_db.search.assert_not_called()
+
+    def test_stream_solution_reports_failure_separately(self, rag_engine):
+        def tokens():
+            yield {'response': "Check the log for 'Error: disk full'"}
+            raise ConnectionError("ollama went away")
+        rag_engine.ollama_client.generate = Mock(return_value=tokens())
+
+        solution = rag_engine.stream_solution("ctx", "disk full", results=[DBDocument(text="doc", metadata={})])
+
+        assert list(solution) == ["Check the log for 'Error: disk full'"]
+        assert "ollama went away" in solution.error
+        assert solution.response == "Check the log for 'Error: disk full'"
+
+        rag_engine.ollama_client.generate = Mock(return_value=iter([{'response': "Error: lines show the disk is full"}]))
+        solution = rag_engine.stream_solution("ctx", "disk full", results=[DBDocument(text="doc", metadata={})])
+        assert "".join(solution) == "Error: lines show the disk is full"
+        assert solution.error is None
+
+    def test_summary_served_from_response_cache(self, rag_engine):
+        rag_engine.response_cache = ResponseCache(InMemoryResponseStore())
+        rag_engine.ollama_client.generate = Mock(return_value={'response': json.dumps(
+            {"summary": ["Summary line 1"], "root_cause_expln": "pool", "severity": "High"})})
+
+        first = rag_engine.generate_summary(["Error log 1", "Warning log 2"])
+        second = rag_engine.generate_summary(["Error log 1", "Warning log 2"])
+
+        assert second == first
+        rag_engine.ollama_client.generate.assert_called_once()
+        assert rag_engine.response_cache.stats()["exact_hits"] == 1
+
+    def test_cached_stream_solution_keeps_cached_sources(self, rag_engine):
+        rag_engine.response_cache = ResponseCache(InMemoryResponseStore(), similarity_threshold=None)
+        rag_engine.ollama_client.generate = Mock(return_value=iter([{'response': 'raise pool size'}]))
+
+        first = rag_engine.stream_solution("ctx", "pool exhausted", results=[DBDocument(text="doc", metadata={"source": "db.md"})])
+        assert "".join(first) == "raise pool size"
+        second = rag_engine.stream_solution("ctx", "pool exhausted", results=[DBDocument(text="new", metadata={"source": "new.md"})])
+
+        assert "".join(second) == "raise pool size"
+        assert second.sources == ["db.md"]
+        assert second.additional_info == {"cache": "exact"}
+        rag_engine.ollama_client.generate.assert_called_once()
+
+    def test_solution_reused_for_similar_root_cause(self, rag_engine):
+        rag_engine.response_cache = ResponseCache(InMemoryResponseStore(), similarity_threshold=0.9)
+        rag_engine.embedder.create_embedding = Mock(side_effect=lambda text: [1.0, 0.0] if "pool" in text else [0.0, 1.0])
+        rag_engine.vector_db.search = Mock(return_value=[DBDocument(text="doc", metadata={"source": "db.md"})])
+        rag_engine.ollama_client.generate = Mock(return_value={'response': 'raise pool size'})
+
+        rag_engine.generate_solution("ctx monday", "DB pool exhausted")
+        reused = rag_engine.generate_solution("ctx next monday", "connection pool exhausted")
+        rag_engine.generate_solution("ctx", "disk full")
+
+        assert reused.response == 'raise pool size'
+        assert reused.sources == ["db.md"]
+        assert reused.additional_info["cache"] == "semantic"
+        assert rag_engine.ollama_client.generate.call_count == 2
 
     def test_store_documentation_empty_input(self, rag_engine):
         with pytest.raises(ValueError):
@@ -125,5 +307,223 @@ class TestRAGEngine:
 
     def test_store_documentation_chunk_validation(self, rag_engine):
         rag_engine.embedder.create_batch_embeddings = Mock(return_value=[])
+        rag_engine.vector_db.existing_ids = Mock(return_value=set())
         with pytest.raises(ValueError):
             rag_engine.store_documentation(["valid", "docs"])
+        # Manifests are read up front and only written after a successful ingest
+        rag_engine.mongo_db.get_doc_manifests.assert_called_once()
+        rag_engine.mongo_db.save_doc_manifest.assert_not_called()
+
+
+class InMemoryResponseStore:
+    """The MongoDBHandler response-cache methods over a dict"""
+    def __init__(self):
+        self.entries = {}
+
+    def ensure_response_cache_indexes(self):
+        pass
+
+    def get_cached_response(self, key):
+        return self.entries.get(key)
+
+    def save_cached_response(self, entry):
+        self.entries[entry["key"]] = entry
+
+    def cached_response_embeddings(self, kind):
+        return [entry for entry in self.entries.values() if entry["kind"] == kind and "embedding" in entry]
+
+    def evict_cached_responses(self, max_entries):
+        overflow = len(self.entries) - max_entries
+        for key in sorted(self.entries, key=lambda key: self.entries[key]["last_access"])[:max(0, overflow)]:
+            del self.entries[key]
+        return max(0, overflow)
+
+
+class TestResponseCache:
+    def test_exact_and_semantic_tiers(self):
+        cache = ResponseCache(InMemoryResponseStore(), similarity_threshold=0.9)
+        key = ResponseCache.prompt_key("solution", "llama3.2:3b", "pool exhausted")
+        assert cache.get(key) is None
+
+        cache.put("solution", key, {"response": "raise pool size"}, embedding=[1.0, 0.0, 0.0])
+
+        assert cache.get(key) == {"response": "raise pool size"}
+        assert cache.get("other") is None
+        assert cache.find_similar("solution", [0.99, 0.1, 0.0])["response"] == "raise pool size"
+        assert cache.get("unrelated") is None
+        assert cache.find_similar("solution", [0.0, 1.0, 0.0]) is None
+        assert cache.stats() == {"lookups": 4, "exact_hits": 1, "semantic_hits": 1, "misses": 2, "hit_rate": 0.5}
+
+    def test_unavailable_mongo_disables_cache(self, capsys):
+        store = Mock()
+        store.ensure_response_cache_indexes.side_effect = Exception("server selection timeout")
+
+        assert create_response_cache(store) is None
+        assert "response cache disabled" in capsys.readouterr().out
+        assert isinstance(create_response_cache(InMemoryResponseStore()), ResponseCache)
+
+    def test_semantic_tier_disabled_and_eviction(self):
+        store = InMemoryResponseStore()
+        cache = ResponseCache(store, max_entries=2, similarity_threshold=None)
+        for i in range(3):
+            cache.put("solution", f"k{i}", {"response": str(i)}, embedding=[1.0, float(i)])
+
+        assert cache.find_similar("solution", [1.0, 0.0]) is None
+        assert set(store.entries) == {"k1", "k2"}
+
+
+class TestSummaryPointExtractor:
+    def test_points_decoded_across_chunk_boundaries(self):
+        document = json.dumps({"summary": ["Pool \"db\" exhausted", "Timed out\nafter 30s"], "severity": "High"})
+        for size in (1, 3, len(document)):
+            extractor = SummaryPointExtractor()
+            text = "".join(extractor.feed(document[i:i + size]) for i in range(0, len(document), size))
+            assert text == '- Pool "db" exhausted\n- Timed out\nafter 30s\n'
+            assert extractor.state == "done"
+
+
+class TestDocumentIngestor:
+    def test_chunk_metadata(self):
+        text = "# Intro\n" + "word " * 300 + "\n## Setup\n" + "step " * 300
+        chunks = chunk_document("runbook.md", text)
+
+        assert all(chunk["metadata"]["source"] == "runbook.md" for chunk in chunks)
+        assert all(chunk["id"] == content_digest(chunk["text"]) for chunk in chunks)
+        for chunk in chunks:
+            offset = chunk["metadata"]["offset"]
+            assert text[offset:offset + len(chunk["text"])] == chunk["text"]
+        assert chunks[1]["metadata"]["heading"] == "Intro"
+        assert chunks[-1]["metadata"]["heading"] == "Setup"
+
+    def test_pipeline_with_process_pool(self):
+        embedder = Mock()
+        embedder.create_batch_embeddings = Mock(side_effect=lambda texts: [[0.1]] * len(texts))
+        vector_db = Mock()
+        vector_db.existing_ids = Mock(return_value=set())
+        documents = [f"# Doc {i}\n" + " ".join(f"line{j}-{i}" for j in range(500)) for i in range(6)]
+
+        ingestor = DocumentIngestor(embedder, vector_db, workers=2, embed_batch_size=4, queue_size=1,
+                                    parallel_min_chars=0)
+        try:
+            stats = ingestor.ingest(documents, sources=[f"{i}.md" for i in range(6)])
+            assert ingestor._executor is not None
+        finally:
+            ingestor.close()
+
+        stored = [chunk for call in vector_db.add_documents.call_args_list for chunk in call.kwargs["metadatas"]]
+        assert stats["embedded"] == stats["chunks"] == len(stored)
+        assert {meta["source"] for meta in stored} == {f"{i}.md" for i in range(6)}
+        assert all(len(call.kwargs["ids"]) <= 4 for call in vector_db.add_documents.call_args_list)
+
+    def test_small_corpus_chunked_in_process(self):
+        embedder = Mock()
+        embedder.create_batch_embeddings = Mock(side_effect=lambda texts: [[0.1]] * len(texts))
+        vector_db = Mock()
+        vector_db.existing_ids = Mock(return_value=set())
+
+        ingestor = DocumentIngestor(embedder, vector_db, workers=2)
+        documents = [f"# Doc {i}\n" + " ".join(f"line{j}-{i}" for j in range(500)) for i in range(2)]
+        stats = ingestor.ingest(documents)
+
+        assert stats["embedded"] == stats["chunks"] > 0
+        assert ingestor._executor is None
+
+    def test_embedding_error_propagates(self):
+        embedder = Mock()
+        embedder.create_batch_embeddings = Mock(side_effect=RuntimeError("ollama down"))
+        vector_db = Mock()
+        vector_db.existing_ids = Mock(return_value=set())
+
+        ingestor = DocumentIngestor(embedder, vector_db, workers=1, embed_batch_size=1, queue_size=1)
+        with pytest.raises(RuntimeError, match="ollama down"):
+            ingestor.ingest(["first " * 400, "second " * 400])
+        vector_db.add_documents.assert_not_called()
+
+
+class TestContextCompression:
+    def test_small_unique_chain_unchanged(self):
+        chain = ["Error log 1", "Warning log 2"]
+        assert compress_context(chain) == chain
+
+    def test_repeats_collapsed_by_template(self):
+        chain = ["pool exhausted", "retry 1 for conn 10.0.0.1", "retry 2 for conn 10.0.0.2", "retry 3 for conn 10.0.0.3", "done"]
+        assert compress_context(chain) == ["pool exhausted", "retry 1 for conn 10.0.0.1 (x3)", "done"]
+
+    def test_budget_keeps_root_cause_and_severe_entries(self):
+        words = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet"]
+        chain = ["disk full on /var"] + [f"served {words[i % 10]} {words[i // 10 % 10]} {words[i // 100]}" for i in range(200)]
+        chain[150] = "ERROR write failed: no space left on device"
+        levels = ["ERROR"] + ["INFO"] * 200
+        levels[150] = "ERROR"
+
+        compressed = compress_context(chain, levels, token_budget=60)
+
+        assert compressed[0] == "disk full on /var"
+        assert chain[150] in compressed
+        assert compressed[-1].endswith("lower-priority log entries omitted")
+        assert sum(estimate_tokens(line) + 1 for line in compressed) <= 60
+
+    def test_keyword_severity_matches_rule_parser(self):
+        parser = RuleBasedParser()
+        for message in ["upstream timed out", "permission denied", "Traceback (most recent call last)", "kernel panic"]:
+            entry = parser.parse(f"Mar 20 10:15:23 host app[1]: {message}")
+            assert severity_of(message) == SEVERITY_RANK[entry.level]
+
+
+class TestIncidentOrchestrator:
+    @staticmethod
+    def slow(result, seconds=0.3):
+        def call(*args, **kwargs):
+            time.sleep(seconds)
+            return result
+        return Mock(side_effect=call)
+
+    def test_stages_overlap(self):
+        rag = Mock()
+        docs = [DBDocument(text="doc", metadata={"source": "db.md"})]
+        rag.generate_summary = self.slow(SummaryResponse(summary=["s"], root_cause_expln="r", severity="High"))
+        rag.retrieve_documentation = self.slow(docs)
+        rag.generate_solution = self.slow(SolutionQuery(context="c", query="q", response="fix"), seconds=0.1)
+        mongo_db = Mock()
+        mongo_db.save_dag = self.slow(None)
+        dag = MagicMock()
+        context = Context(root_cause="pool exhausted", causal_chain=["pool exhausted", "timeout"], levels=["ERROR", "WARN"])
+
+        analysis = IncidentOrchestrator(rag, mongo_db).analyze_sync(dag, context)
+
+        rag.retrieve_documentation.assert_called_once_with(context.causal_chain, "pool exhausted")
+        assert rag.generate_solution.call_args.kwargs["results"] is docs
+        assert analysis.sources == ["db.md"]
+        assert analysis.solution.response == "fix"
+        assert set(analysis.timings) == {"summary", "retrieval", "solution", "persistence", "total"}
+        # Sequential execution would take about 1.0s
+        assert analysis.timings["total"] < 0.7
+
+    def test_skipped_stages_and_errors(self):
+        rag = Mock()
+        rag.retrieve_documentation = Mock(return_value=[])
+        context = Context(root_cause="disk full", causal_chain=["disk full"])
+
+        analysis = IncidentOrchestrator(rag, Mock()).start(MagicMock(), context, summary=False, solution=False, persist=False).result()
+
+        rag.generate_summary.assert_not_called()
+        rag.generate_solution.assert_not_called()
+        assert analysis.summary is None and set(analysis.timings) == {"retrieval", "total"}
+
+        rag.retrieve_documentation = Mock(side_effect=Exception("chroma down"))
+        with pytest.raises(RuntimeError, match="chroma down"):
+            IncidentOrchestrator(rag, Mock()).analyze_sync(MagicMock(), context)
+
+    def test_persistence_failure_keeps_retrieval(self):
+        rag = Mock()
+        rag.retrieve_documentation = Mock(return_value=[DBDocument(text="doc", metadata={"source": "db.md"})])
+        mongo = Mock()
+        mongo.save_dag = Mock(side_effect=Exception("mongo down"))
+        context = Context(root_cause="disk full", causal_chain=["disk full"])
+
+        analysis = IncidentOrchestrator(rag, mongo).start(MagicMock(), context, summary=False, solution=False).result()
+
+        assert analysis.sources == ["db.md"]
+        assert analysis.persist_error == "mongo down"
+        assert "persistence" in analysis.timings
+
@@ -2,15 +2,23 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import pytest
-from unittest.mock import Mock, patch
-from utilz.log_parser import LogParser
+from unittest.mock import Mock, MagicMock, patch
+from utilz.log_parser import LogParser, iter_log_records
+from utilz.rule_parser import RuleBasedParser, ParsingRule
+from utilz.template_miner import TemplateMiner
+from utilz.parse_cache import ParseCache
+from utilz.timestamp_normalizer import TimestampNormalizer, MISSING_NS
 from utilz.graph_generator import GraphGenerator
 from utilz.context_builder import ContextBuilder
 from utilz.database_healthcheck import ServerHealthCheck
 from utilz.database_healthcheck import check_services
+from core import chroma_registry
 from models.parsing_data_models import LogChain, LogEntry, SystemInfo, UserInfo, TraceInfo
 from pathlib import Path
+import io
 import json
+import time
+import threading
 
 
 
@@ -85,6 +93,278 @@ class TestLogParser:
         with pytest.raises(RuntimeError):
             parser.parse_log("")
 
+    def test_rule_fast_path_skips_llm(self, mock_ollama):
+        parser = LogParser()
+        result = parser.parse_log(
+            "[2024-03-20 10:15:23,456] INFO in app: Flask application starting up\n"
+            "[2024-03-20 10:16:23,123] ERROR in database_handlers: Database connection timeout after 30s"
+        )
+        assert len(result.log_chain) == 2
+        assert result.log_chain[1].component == "database_handlers"
+        assert result.log_chain[1].level == "ERROR"
+        mock_ollama.return_value.generate.assert_not_called()
+        assert parser.format_hit_rates()["flask"] == 1.0
+
+    def test_unmatched_line_falls_back_to_llm(self, mock_ollama):
+        mock_response = Mock()
+        mock_response.response = json.dumps({
+            "timestamp": "2023-01-01T00:00:00",
+            "message": "opaque vendor line",
+            "level": "INFO"
+        })
+        mock_ollama.return_value.generate.return_value = mock_response
+
+        parser = LogParser()
+        result = parser.parse_log("opaque vendor line")
+        assert result.log_chain[0].message == "opaque vendor line"
+        mock_ollama.return_value.generate.assert_called_once()
+        assert parser.format_hit_rates()["llm_fallback"] == 1.0
+
+    def test_template_learned_once_per_template(self, mock_ollama):
+        mock_response = Mock()
+        mock_response.response = json.dumps({
+            "timestamp": "2024-03-20T10:15:23",
+            "message": "pool exhausted for db-7 after 30s",
+            "level": "WARN",
+            "component": "db-7"
+        })
+        mock_ollama.return_value.generate.return_value = mock_response
+
+        parser = LogParser()
+        result = parser.parse_log(
+            "<2024-03-20 10:15:23> WARN pool exhausted for db-7 after 30s\n"
+            "<2024-03-21 11:00:01> WARN pool exhausted for db-9 after 45s\n"
+            "<2024-03-21 11:00:02> WARN pool exhausted for db-3 after 5s"
+        )
+        assert mock_ollama.return_value.generate.call_count == 1
+        assert len(result.log_chain) == 3
+        assert result.log_chain[1].timestamp == "2024-03-21 11:00:01"
+        assert result.log_chain[1].component == "db-9"
+        assert result.log_chain[2].message == "pool exhausted for db-3 after 5s"
+
+    def test_cache_reuses_parsed_lines(self, mock_ollama, tmp_path):
+        mock_response = Mock()
+        mock_response.response = json.dumps({
+            "timestamp": "2023-01-01T00:00:00",
+            "message": "opaque vendor line",
+            "level": "INFO"
+        })
+        mock_ollama.return_value.generate.return_value = mock_response
+        cache = ParseCache(str(tmp_path / "parse_cache.sqlite"))
+
+        LogParser(cache=cache).parse_log("opaque vendor line")
+        result = LogParser(cache=cache).parse_log("  opaque vendor line ")
+        assert result.log_chain[0].message == "opaque vendor line"
+        assert mock_ollama.return_value.generate.call_count == 1
+        assert cache.stats()["hits"] == 1
+
+        # A different model misses, and parsers of both models keep their own entries
+        LogParser(model="qwen2.5-coder:3b", cache=cache).parse_log("opaque vendor line")
+        assert mock_ollama.return_value.generate.call_count == 2
+        assert len(cache) == 2
+        LogParser(cache=cache).parse_log("opaque vendor line")
+        assert mock_ollama.return_value.generate.call_count == 2
+
+    def test_concurrent_parse_preserves_order(self, mock_ollama):
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def generate(prompt, **kwargs):
+            line = next(l for l in prompt.splitlines() if "opaque" in l).strip()
+            with lock:
+                in_flight.append(line)
+                peak.append(len(in_flight))
+            time.sleep(0.05 if line.endswith("0") else 0.01)
+            with lock:
+                in_flight.remove(line)
+            response = Mock()
+            response.response = json.dumps({"timestamp": "2023-01-01", "message": line, "level": "INFO"})
+            return response
+
+        mock_ollama.return_value.generate.side_effect = generate
+        lines = [f"opaque line {i}" for i in range(8)]
+        parser = LogParser(use_templates=False, max_in_flight=3)
+        result = parser.parse_log("\n".join(lines))
+        assert [entry.message for entry in result.log_chain] == lines
+        assert max(peak) <= 3
+
+    def test_batched_parse_falls_back_per_line(self, mock_ollama):
+        def generate(prompt, **kwargs):
+            response = Mock()
+            if "each of these" in prompt:
+                # Model returns the wrong number of entries for the batch
+                response.response = json.dumps({"entries": [{"timestamp": "t", "message": "x", "level": "INFO"}]})
+            else:
+                response.response = json.dumps({"timestamp": "t", "message": "single", "level": "INFO"})
+            return response
+
+        mock_ollama.return_value.generate.side_effect = generate
+        parser = LogParser(use_templates=False, batch_size=2, max_retries=0)
+        result = parser.parse_log("opaque one\nopaque two")
+        assert [entry.message for entry in result.log_chain] == ["single", "single"]
+        assert parser.llm_calls == 3
+
+    def test_batched_parse(self, mock_ollama):
+        response = Mock()
+        response.response = json.dumps({"entries": [
+            {"timestamp": "t1", "message": "first", "level": "INFO", "pid": 12},
+            {"timestamp": "t2", "message": "second", "level": "ERROR", "pid": None},
+        ]})
+        mock_ollama.return_value.generate.return_value = response
+        parser = LogParser(use_templates=False, batch_size=2)
+        result = parser.parse_log("opaque one\nopaque two")
+        assert [entry.message for entry in result.log_chain] == ["first", "second"]
+        assert result.log_chain[0].pid == "12"
+        assert parser.llm_calls == 1
+
+    def test_iter_log_file_folds_stack_traces(self, mock_ollama):
+        handle = io.StringIO(
+            "[2024-03-20 10:16:23,123] ERROR in app: Unhandled exception\n"
+            "Traceback (most recent call last):\n"
+            '  File "app.py", line 10, in handler\n'
+            "ValueError: bad payload\n"
+            "\n"
+            "[2024-03-20 10:16:24,000] INFO in app: Recovered\n"
+        )
+        parser = LogParser()
+        entries = parser.iter_log_file(handle, window_size=1)
+        first = next(entries)
+        assert first.message.startswith("Unhandled exception\nTraceback")
+        assert first.message.endswith("ValueError: bad payload")
+        assert [entry.message for entry in entries] == ["Recovered"]
+        mock_ollama.return_value.generate.assert_not_called()
+
+    def test_iter_log_file_empty(self, tmp_path):
+        empty = tmp_path / "empty.log"
+        empty.write_text("\n  \n")
+        with pytest.raises(ValueError, match="Empty log file"):
+            LogParser().parse_log_from_file(str(empty))
+
+class TestRuleBasedParser:
+    def test_json_application_log(self):
+        parser = RuleBasedParser()
+        entry = parser.parse(json.dumps({
+            "timestamp": "2025-01-22 20:27:47.599654",
+            "pid": 77593,
+            "level": "WARNING",
+            "component": "GarbageCollectionMonitor",
+            "message": "Increased memory usage",
+            "trace_id": "dbdbafa1",
+            "error_code": None
+        }))
+        assert entry.pid == "77593"
+        assert entry.trace_id == "dbdbafa1"
+        assert entry.error_code == ""
+
+    def test_syslog_infers_level(self):
+        parser = RuleBasedParser()
+        entry = parser.parse("Mar 20 10:15:23 web01 sshd[1234]: Failed password for root from 10.0.0.5")
+        assert entry.component == "sshd"
+        assert entry.pid == "1234"
+        assert entry.level == "ERROR"
+        assert entry.ip_address == "10.0.0.5"
+
+    def test_custom_rule_and_hit_rates(self):
+        parser = RuleBasedParser(rules=[])
+        parser.add_rule(ParsingRule(
+            name="pipe",
+            matcher=lambda line: dict(zip(("timestamp", "level", "message"), line.split("|"))) if line.count("|") == 2 else None
+        ))
+        assert parser.parse("t1|INFO|hello").message == "hello"
+        assert parser.parse("no match") is None
+        assert parser.hit_rates() == {"pipe": 0.5, "llm_fallback": 0.5}
+
+class TestTemplateMiner:
+    def test_lines_differing_in_variables_share_template(self):
+        miner = TemplateMiner()
+        first = miner.add_log_message("session 8812 opened for user alice from 10.0.0.4")
+        second = miner.add_log_message("session 9001 opened for user bob from 10.0.0.9")
+        other = miner.add_log_message("cache flushed")
+        assert first is second
+        assert other is not first
+        assert first.size == 2
+        assert first.template_str == "session <*> opened for user <*> from <*>"
+
+class TestParseCache:
+    def test_lru_eviction(self, tmp_path):
+        cache = ParseCache(str(tmp_path / "cache.sqlite"), max_entries=10)
+        entry = LogEntry(timestamp="2023-01-01", message="m", level="INFO")
+        for i in range(10):
+            cache.put(f"line {i}", "ns", entry)
+        assert cache.get("line 0", "ns") is not None  # refresh line 0
+        cache.put("line 10", "ns", entry)
+        assert len(cache) == 9
+        assert cache.get("line 0", "ns") is not None
+        assert cache.get("line 1", "ns") is None
+        assert cache.stats()["misses"] == 1
+
+def test_iter_log_records_groups_continuations():
+    records = list(iter_log_records([
+        "2024-01-01 ERROR in worker: crash",
+        "java.lang.IllegalStateException: boom",
+        "\tat com.acme.Worker.run(Worker.java:42)",
+        "... 3 more",
+        "",
+        "2024-01-01 INFO in worker: restarted",
+    ]))
+    assert [idx for idx, _ in records] == [0, 5]
+    assert records[0][1].count("\n") == 3
+
+def test_iter_log_records_keeps_indented_and_exception_lines():
+    records = list(iter_log_records([
+        "2024-01-01 INFO in worker: config loaded",
+        "    cache_size=10",
+        "ValueError: reported by upstream, not a trace",
+        "2024-01-01 ERROR in worker: crash",
+        "Traceback (most recent call last):",
+        '  File "worker.py", line 3, in run',
+        "    raise KeyError(job)",
+        "KeyError: 'job-1'",
+        "  next indented line",
+    ]))
+    assert [idx for idx, _ in records] == [0, 1, 2, 3, 8]
+    assert records[3][1].endswith("KeyError: 'job-1'")
+
+class TestTimestampNormalizer:
+    def test_mixed_formats_and_time_zones(self):
+        normalizer = TimestampNormalizer(default_year=2024)
+        values = normalizer.to_epoch_ns([
+            "2024-03-20 10:15:23,456",        # python logging / Flask
+            "[2024-03-20T10:15:23.456]",
+            "2024-03-20T12:15:23.456+02:00",  # same instant, different zone
+            "Mar 20 10:15:23",                # syslog, no year
+            "1710929723456",                  # epoch milliseconds
+            "not a timestamp",
+        ])
+        expected = 1710929723456000000
+        assert values[:3].tolist() == [expected] * 3
+        assert values[3] == 1710929723000000000
+        assert values[4] == expected
+        assert values[5] == MISSING_NS
+        assert normalizer.detected_format == "%b %d %H:%M:%S"
+
+    def test_invalid_iso_date_only_affects_its_entry(self):
+        values = TimestampNormalizer().to_epoch_ns([
+            "2024-03-20 10:15:23,456",
+            "2024-02-30 10:15:23",
+            "2024-03-20 25:00:00",
+            "2024-03-20T10:15:23.456",
+        ])
+        assert values.tolist() == [1710929723456000000, MISSING_NS, MISSING_NS, 1710929723456000000]
+
+    def test_graph_orders_across_formats(self):
+        log_chain = LogChain(log_chain=[
+            LogEntry(timestamp="2024-03-20T10:00:05+00:00", message="later", level="INFO"),
+            LogEntry(timestamp="garbage", message="after later", level="INFO"),
+            LogEntry(timestamp="2024-03-20 11:00:01+01:00", message="earlier", level="ERROR"),
+        ])
+        dag = GraphGenerator(log_chain, mode="chain").generate_dag()
+
+        assert dag.root_cause == "earlier"
+        assert [node.log_entry.message for node in dag.iter_descendants(dag.root_id)] == ["earlier", "later", "after later"]
+        assert log_chain.log_chain[2].timestamp_ns == 1710928801000000000
+
 # Test GraphGenerator
 class TestGraphGenerator:
     def test_dag_generation(self, sample_log_chain):
@@ -102,6 +382,81 @@ class TestGraphGenerator:
         parent = next(n for n in dag.nodes if n.id == dag.root_id)
         assert len(parent.children) == 1
 
+    def test_chain_mode_orders_by_timestamp(self):
+        log_chain = LogChain(log_chain=[
+            LogEntry(timestamp="2023-01-03", message="third", level="INFO"),
+            LogEntry(timestamp="2023-01-01", message="first", level="ERROR"),
+            LogEntry(timestamp="2023-01-02", message="second", level="WARNING"),
+        ])
+        dag = GraphGenerator(log_chain).generate_dag()
+
+        assert sum(len(node.children) for node in dag.nodes) == 2
+        assert dag.root_cause == "first"
+        assert [dag.get_node(leaf_id).log_entry.message for leaf_id in dag.leaf_ids] == ["third"]
+
+    def test_correlated_mode_groups_interleaved_requests(self):
+        log_chain = LogChain(log_chain=[
+            LogEntry(timestamp="2023-01-01T00:00:01", message="start A", level="INFO", request_id="A"),
+            LogEntry(timestamp="2023-01-01T00:00:02", message="start B", level="INFO", request_id="B"),
+            LogEntry(timestamp="2023-01-01T00:00:03", message="db timeout A", level="ERROR", request_id="A"),
+            LogEntry(timestamp="2023-01-01T00:00:04", message="done B", level="INFO", request_id="B"),
+        ])
+        generator = GraphGenerator(log_chain)
+        dag = generator.generate_dag()
+        by_message = {node.log_entry.message: node for node in dag.nodes}
+
+        assert by_message["db timeout A"].parent_id == by_message["start A"].id
+        assert by_message["done B"].parent_id == by_message["start B"].id
+        # First entry of request B has no correlated predecessor and follows time order
+        assert by_message["start B"].parent_id == by_message["start A"].id
+        assert sorted(dag.leaf_ids) == sorted([by_message["db timeout A"].id, by_message["done B"].id])
+        assert generator.correlation_index["request_id"]["A"] == [by_message["start A"].id, by_message["db timeout A"].id]
+
+    def test_correlated_mode_new_trace_ignores_weaker_fields(self):
+        log_chain = LogChain(log_chain=[
+            LogEntry(timestamp="2023-01-01T00:00:01", message="start T1", level="INFO", trace_id="T1", pid="7"),
+            LogEntry(timestamp="2023-01-01T00:00:02", message="cron tick", level="INFO"),
+            LogEntry(timestamp="2023-01-01T00:00:03", message="start T2", level="INFO", trace_id="T2", pid="7"),
+            LogEntry(timestamp="2023-01-01T00:00:04", message="worker idle", level="INFO", pid="7"),
+        ])
+        dag = GraphGenerator(log_chain).generate_dag()
+        by_message = {node.log_entry.message: node for node in dag.nodes}
+
+        # T2 shares a pid with T1 but starts a new trace, so it follows time order
+        assert by_message["start T2"].parent_id == by_message["cron tick"].id
+        # pid is the strongest populated field here, so it still correlates
+        assert by_message["worker idle"].parent_id == by_message["start T2"].id
+
+    def test_bursty_timestamps_get_unique_ids(self):
+        log_chain = LogChain(log_chain=[
+            LogEntry(timestamp="2023-01-01T00:00:00.001", message=f"burst {i}", level="INFO") for i in range(3)
+        ] + [LogEntry(timestamp="2023-01-01T00:00:00.001", message="burst 0", level="INFO")])
+        dag = GraphGenerator(log_chain).generate_dag()
+
+        assert len({node.id for node in dag.nodes}) == 4
+        assert [dag.node_index(node.id) for node in dag.nodes] == [0, 1, 2, 3]
+        assert len(dag.leaf_ids) == 1
+        assert [node.log_entry.message for node in dag.iter_descendants(dag.root_id)] == ["burst 0", "burst 1", "burst 2", "burst 0"]
+        # Ids are stable across rebuilds of the same chain
+        assert [node.id for node in GraphGenerator(log_chain).generate_dag().nodes] == [node.id for node in dag.nodes]
+
+    def test_dense_compatibility_mode(self):
+        log_chain = LogChain(log_chain=[
+            LogEntry(timestamp=f"2023-01-0{i}", message=f"m{i}", level="INFO") for i in range(1, 5)
+        ])
+        dag = GraphGenerator(log_chain, mode="dense").generate_dag()
+
+        assert sum(len(node.children) for node in dag.nodes) == 6
+        with pytest.raises(ValueError):
+            GraphGenerator(log_chain, mode="unknown")
+
+    def test_dag_from_entry_stream(self, sample_log_chain):
+        generator = GraphGenerator(entry for entry in sample_log_chain.log_chain)
+        dag = generator.generate_dag()
+
+        assert len(dag.nodes) == 2
+        assert dag.log_chain == sample_log_chain
+
     def test_single_node_graph(self):
         log_chain = LogChain(log_chain=[
             LogEntry(
@@ -129,6 +484,19 @@ class TestContextBuilder:
         
         assert len(context.causal_chain) == 2
         assert "Error occurred" in context.causal_chain
+        assert len(context.levels) == len(context.causal_chain)
+
+    def test_deep_chain_without_recursion_limit(self):
+        log_chain = LogChain(log_chain=[
+            LogEntry(timestamp=f"2023-01-01T00:00:{i // 1000:02d}.{i % 1000:03d}", message=f"step {i}", level="INFO")
+            for i in range(5000)
+        ])
+        dag = GraphGenerator(log_chain, mode="chain").generate_dag()
+        context = ContextBuilder().build_context(dag)
+
+        assert dag.root_cause == "step 0"
+        assert context.causal_chain[0] == "step 0"
+        assert len(context.causal_chain) == 5000
 
     def test_empty_dag_handling(self):
         builder = ContextBuilder()
@@ -138,10 +506,12 @@ class TestContextBuilder:
 # Test DatabaseHealthCheck
 @pytest.fixture
 def mock_chroma():
+    chroma_registry.clear()
     with patch('chromadb.HttpClient') as mock:
         instance = mock.return_value
         instance.heartbeat.return_value = True
         yield mock
+    chroma_registry.clear()
 
 @pytest.fixture
 def mock_pymongo():
@@ -202,6 +572,17 @@ class TestDatabaseHealthCheck:
         checker = ServerHealthCheck()
         assert checker.check_mongo() is False
 
+    def test_local_backend_skips_chroma(self, mock_chroma, mock_pymongo):
+        with patch.dict(os.environ, {"VECTOR_BACKEND": "local"}), patch('streamlit.info') as mock_info:
+            checker = ServerHealthCheck()
+            assert checker.check_chroma() is not True
+            with patch('streamlit.columns', return_value=[MagicMock(), MagicMock()]), \
+                    patch('streamlit.error') as mock_error:
+                check_services()
+        mock_chroma.assert_not_called()
+        mock_info.assert_called_once()
+        assert all("ChromaDB" not in call.args[0] for call in mock_error.call_args_list)
+
     def test_check_services_all_success(self, mock_chroma, mock_pymongo, mock_streamlit):
         check_services()
         
@@ -1,10 +1,15 @@
 from .log_parser import LogParser
+from .rule_parser import RuleBasedParser, ParsingRule
+from .template_miner import TemplateMiner
 from .graph_generator import GraphGenerator
 from .context_builder import ContextBuilder
 from .database_healthcheck import ServerHealthCheck
 
 __all__ = [
     'LogParser',
+    'RuleBasedParser',
+    'ParsingRule',
+    'TemplateMiner',
     'GraphGenerator', 
     'ContextBuilder',
     'ServerHealthCheck'
@@ -8,16 +8,19 @@ class ContextBuilder:
         self.dag = None
         self.root_cause = None
         self.causal_chain = []
+        self.levels = []
     
     def build_context(self,dag:DAG) -> Context:
         if not dag:
             raise RuntimeError("DAG is required to build context")
         self.dag = dag
+        self.causal_chain = []
+        self.levels = []
         
         try:
             self.root_cause = self.dag.root_cause
             self._find_causal_chain(self.dag.root_id)
-            return Context(root_cause=self.root_cause,causal_chain=self.causal_chain)
+            return Context(root_cause=self.root_cause,causal_chain=self.causal_chain,levels=self.levels)
         
         except Exception as e:
             raise RuntimeError(f"Failed to build context: {str(e)}")
@@ -28,20 +31,10 @@ class ContextBuilder:
             if not node_id:
                 return
             
-            node = next((node for node in self.dag.nodes if node.id == node_id),None)
-            if not node:
-                return
-            
-            # Add current node's message to the causal chain
-            self.causal_chain.append(node.log_entry.message)
-            
-            # Iterate through the children of the node
-            for child_id in node.children:
-                child_node = next((child_node for child_node in self.dag.nodes if child_node.id == child_id),None)
-                if child_node:
-                    self._find_causal_chain(child_node.id)
+            # Iterative pre-order walk: no recursion limit on deep chains, shared descendants visited once
+            for node in self.dag.iter_descendants(node_id):
+                self.causal_chain.append(node.log_entry.message)
+                self.levels.append(node.log_entry.level)
             
         except Exception as e:
             raise RuntimeError(f"Failed to find causal chain: {str(e)}")
-        
-        
\ No newline at end of file
@@ -1,12 +1,37 @@
+import hashlib
+import numpy as np
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Iterable, Optional, Union
 from models.graph_data_models import DAGNode,DAG
-from models.parsing_data_models import LogChain
+from models.parsing_data_models import LogChain, LogEntry
+from .timestamp_normalizer import TimestampNormalizer, MISSING_NS
+
+# Edge construction modes:
+# "correlated" links each node to the previous node sharing its strongest populated correlation field, or follows
+#   time order when that field has no earlier match (weaker fields never link across groups);
+# "chain" links each node to its predecessor in timestamp order (O(n log n), n-1 edges);
+# "dense" keeps the original semantics where every later entry is a child of every earlier one (O(n^2))
+DAG_MODES = ("correlated", "chain", "dense")
+
+# LogEntry fields used to correlate entries, strongest first
+CORRELATION_FIELDS = ("trace_id", "request_id", "pid", "component")
 
 class GraphGenerator:
-    def __init__(self,log_chain:LogChain) -> None:
+    def __init__(self,log_chain:Union[LogChain, Iterable[LogEntry]],mode:str="correlated",
+                 correlation_fields:tuple[str, ...]=CORRELATION_FIELDS) -> None:
+        if mode not in DAG_MODES:
+            raise ValueError(f"Unknown DAG mode '{mode}', expected one of {DAG_MODES}")
+        unknown = [field for field in correlation_fields if field not in LogEntry.model_fields]
+        if unknown:
+            raise ValueError(f"Unknown correlation fields: {unknown}")
+        # Either a parsed LogChain or a stream of entries (e.g. LogParser.iter_log_file), consumed as it is parsed
         self.log_chain = log_chain
+        self.mode = mode
+        self.correlation_fields = correlation_fields
+        # field -> value -> node ids in time order, filled in "correlated" mode
+        self.correlation_index: dict[str, dict[str, list[str]]] = {}
         self.dag_nodes = []
+        self.dag = None
         self.root_id = None
         self.leaf_ids = []
         
@@ -18,30 +43,112 @@ class GraphGenerator:
             self.leaf_ids = []
             self.root_cause = None
             
-            for log_entry in self.log_chain.log_chain:
-                node = DAGNode(id=str(log_entry.timestamp),parent_id=None,children=[],log_entry=log_entry)
+            entries = self.log_chain.log_chain if isinstance(self.log_chain, LogChain) else self.log_chain
+            for offset, log_entry in enumerate(entries):
+                node = DAGNode(id=self.make_node_id(offset, log_entry),parent_id=None,children=[],log_entry=log_entry)
                 self.dag_nodes.append(node)
+            if not isinstance(self.log_chain, LogChain):
+                self.log_chain = LogChain(log_chain=[node.log_entry for node in self.dag_nodes])
                 
             self._set_parent_child_relationships()
             self._find_root_and_leaf_nodes()
+            self.dag = DAG(nodes=self.dag_nodes,root_id=self.root_id,leaf_ids=self.leaf_ids,log_chain=self.log_chain,root_cause=None)
             self.root_cause = self.find_root_cause()
+            self.dag.root_cause = self.root_cause
             
-            return DAG(nodes=self.dag_nodes,root_id=self.root_id,leaf_ids=self.leaf_ids,log_chain=self.log_chain,root_cause=self.root_cause)
+            return self.dag
             
         except Exception as e:
             raise RuntimeError(f"Failed to generate DAG: {str(e)}")
         
+    @staticmethod
+    def make_node_id(offset: int, log_entry: LogEntry) -> str:
+        """Stable node id: entry offset in the chain plus a digest of its content, unique even for equal timestamps"""
+        digest = hashlib.sha1(log_entry.model_dump_json(exclude={"timestamp_ns"}).encode("utf-8")).hexdigest()[:12]
+        return f"{offset}-{digest}"
+
     def _set_parent_child_relationships(self) -> None:
         """Set parent-child relationships between nodes"""
         try:
-            for i in range(len(self.dag_nodes)):
-                for j in range(i+1,len(self.dag_nodes)):
-                    if self.dag_nodes[j].log_entry.timestamp > self.dag_nodes[i].log_entry.timestamp:
-                        self.dag_nodes[i].children.append(self.dag_nodes[j].id)
-                        self.dag_nodes[j].parent_id = self.dag_nodes[i].id
+            timestamps = self._timestamps_ns()
+            if self.mode == "dense":
+                self._set_dense_relationships(timestamps)
+                return
+
+            # Sort once on integer timestamps (stable, so equal timestamps keep line order)
+            order = np.argsort(timestamps, kind="stable").tolist()
+            if self.mode == "correlated":
+                self._set_correlated_relationships(order)
+                return
+
+            for parent_pos, child_pos in zip(order, order[1:]):
+                self._link(self.dag_nodes[parent_pos], self.dag_nodes[child_pos])
                         
         except Exception as e:
             raise RuntimeError(f"Failed to set parent-child relationships: {str(e)}")
+
+    def _set_correlated_relationships(self, order: list[int]) -> None:
+        """Link each node to the latest earlier node sharing its strongest populated correlation field.
+
+        Only that field decides the parent: the first entry of a new trace follows time order instead of
+        joining another trace through a shared pid or component.
+        """
+        self.correlation_index = {field: {} for field in self.correlation_fields}
+        last_seen = {field: {} for field in self.correlation_fields}
+        previous = None
+        for pos in order:
+            node = self.dag_nodes[pos]
+            parent = None
+            strongest = None
+            for field in self.correlation_fields:
+                value = getattr(node.log_entry, field)
+                if not value:
+                    continue
+                if strongest is None:
+                    strongest = field
+                    parent = last_seen[field].get(value)
+                last_seen[field][value] = node
+                self.correlation_index[field].setdefault(value, []).append(node.id)
+
+            # Uncorrelated entries (and the first entry of each group) follow plain time order
+            if parent is None:
+                parent = previous
+            if parent is not None:
+                self._link(parent, node)
+            previous = node
+
+    @staticmethod
+    def _link(parent: DAGNode, child: DAGNode) -> None:
+        parent.children.append(child.id)
+        child.parent_id = parent.id
+
+    def _timestamps_ns(self) -> np.ndarray:
+        """Epoch-nanosecond timestamps of all nodes; unparseable ones inherit their predecessor's time"""
+        entries = [node.log_entry for node in self.dag_nodes]
+        if any(entry.timestamp_ns is None for entry in entries):
+            TimestampNormalizer().normalize([entry for entry in entries if entry.timestamp_ns is None])
+        timestamps = np.array(
+            [MISSING_NS if entry.timestamp_ns is None else entry.timestamp_ns for entry in entries], dtype=np.int64
+        )
+
+        valid = timestamps != MISSING_NS
+        if not valid.any():
+            # Nothing parseable: fall back to line order
+            return np.arange(len(timestamps), dtype=np.int64)
+        # Forward-fill so unparseable lines stay right after the entry that preceded them
+        last_valid = np.maximum.accumulate(np.where(valid, np.arange(len(timestamps)), 0))
+        timestamps = timestamps[last_valid]
+        first_valid = int(np.argmax(valid))
+        timestamps[:first_valid] = timestamps[first_valid]
+        return timestamps
+
+    def _set_dense_relationships(self, timestamps: np.ndarray) -> None:
+        """Compatibility mode: every later entry becomes a child of every earlier one"""
+        for i in range(len(self.dag_nodes)):
+            for j in range(i+1,len(self.dag_nodes)):
+                if timestamps[j] > timestamps[i]:
+                    self.dag_nodes[i].children.append(self.dag_nodes[j].id)
+                    self.dag_nodes[j].parent_id = self.dag_nodes[i].id
         
     def _find_root_and_leaf_nodes(self) -> None:
         """Find the root and leaf nodes in the graph"""
@@ -53,13 +160,9 @@ class GraphGenerator:
             )
             
             # Find leaf nodes (no children)
-            nodes_with_children = set()
-            for node in self.dag_nodes:
-                nodes_with_children.update(node.children)
-                
             self.leaf_ids = [
                 node.id for node in self.dag_nodes
-                if node.id not in nodes_with_children
+                if not node.children
             ]
             
         except Exception as e:
@@ -75,12 +178,14 @@ class GraphGenerator:
             raise RuntimeError(f"Failed to find root cause: {str(e)}")
         
     def _find_root_cause_helper(self, node_id: str) -> str:
-        """Helper function to find the root cause recursively"""
+        """Helper function to find the root cause by walking up to the topmost ancestor"""
         try:
-            node = next(node for node in self.dag_nodes if node.id == node_id)
-            if not node.parent_id:
-                return node.log_entry.message
-            return self._find_root_cause_helper(node.parent_id)
+            node = None
+            for node in self.dag.iter_ancestors(node_id):
+                pass
+            if node is None:
+                raise ValueError(f"Unknown node id: {node_id}")
+            return node.log_entry.message
             
         except Exception as e:
             raise RuntimeError(f"Failed to find root cause helper: {str(e)}")
@@ -1,24 +1,24 @@
+import re
 import ollama
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Iterable, Iterator, Optional, TextIO, Union
 from models.parsing_data_models import LogEntry, LogChain
+from .rule_parser import RuleBasedParser
+from .template_miner import TemplateMiner
+from .parse_cache import ParseCache, make_namespace
+from .timestamp_normalizer import TimestampNormalizer
 
 LLAMA = "llama3.2:3b"
 QWEN = "qwen2.5-coder:3b"
 
-class LogParser:
-    def __init__(self,model:str="llama3.2:3b"):
-        try:
-            self.model = model
-            self.ollama_client = ollama.Client(host='http://localhost:11435')
-            self.ollama_options = ollama.Options(temperature=0.2)
-            self.system_prompt = f"You are an expert in log parsing. You are given a log entry and a pydantic model. Extract and fill the fields of the model with the information from the log entry."
-        except Exception as e:
-            raise RuntimeError(f"Failed to initialize LogParser: {str(e)}")
-        
-    def extract_log_info_by_llm(self, log_entry: str) -> LogEntry:
-        """Extract log information using the specified language model"""
-        try:
-            user_prompt = f"""Parse this log entry into JSON format:
+# Bump when the parsing prompt changes meaning without its text changing (e.g. schema tweaks)
+PROMPT_VERSION = "1"
+
+LOG_PARSE_PROMPT = """Parse this log entry into JSON format:
             {log_entry}
             
             Required fields:
@@ -38,7 +38,124 @@ class LogParser:
             
             Return empty strings for missing fields. Maintain original case for field values.
             """
+
+LOG_BATCH_PARSE_PROMPT = """Parse each of these {count} log entries into JSON format:
+            {log_entries}
+            
+            Return a JSON object {{"entries": [...]}} with exactly one object per log entry, in the same order.
+            Each object has the required fields timestamp (ISO 8601 format), message (original log message)
+            and level (log severity level), plus pid, component, error_code, username, ip_address, group,
+            trace_id and request_id as strings.
             
+            Return empty strings for missing fields. Maintain original case for field values.
+            """
+
+# Stack-trace lines that always belong to the previous record: trace headers and stack frames
+TRACE_HEADER_PATTERN = re.compile(
+    r"^(?:Traceback \(most recent call last\)|During handling of the above exception|"
+    r"The above exception was the direct cause|\s*Caused by:|\s*Suppressed:)"
+)
+FRAME_PATTERN = re.compile(
+    r'^(?:\s+File "[^"]*", line \d+|\s+at [\w$.<>/]+\(|\s*\.\.\. \d+ (?:more|common frames omitted))'
+)
+# Exception lines (Python's last traceback line, Java's first) are only folded next to a trace
+EXCEPTION_PATTERN = re.compile(r"^[\w$.]+(?:Exception|Error|Exit|Interrupt)\b(?::|$)")
+
+def iter_log_records(log_lines: Iterable[str]) -> Iterator[tuple[int, str]]:
+    """Group raw lines into (first line number, record text) pairs, folding stack traces into their record.
+
+    Only trace headers, stack frames, the indented source lines of a Python traceback and exception lines
+    next to a trace are folded; other indented or exception-like lines start records of their own.
+    """
+    record_idx, record = None, []
+    in_trace = False
+    # An exception line after a record, folded only if a stack frame follows (Java prints it before the frames)
+    pending = None
+    for idx, line in enumerate(log_lines):
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        if pending is not None:
+            if FRAME_PATTERN.match(line):
+                record.extend((pending[1], line))
+                pending, in_trace = None, True
+                continue
+            yield record_idx, "\n".join(record)
+            (record_idx, first), pending, in_trace = pending, None, False
+            record = [first]
+        if record and (TRACE_HEADER_PATTERN.match(line) or FRAME_PATTERN.match(line)):
+            record.append(line)
+            in_trace = True
+            continue
+        if record and in_trace and line[:1].isspace():
+            record.append(line)
+            continue
+        if record and EXCEPTION_PATTERN.match(line):
+            if in_trace:
+                # Python's closing exception line ends the traceback
+                record.append(line)
+                in_trace = False
+            else:
+                pending = (idx, line)
+            continue
+        if record:
+            yield record_idx, "\n".join(record)
+        record_idx, record = idx, [line]
+        in_trace = False
+    if pending is not None:
+        yield record_idx, "\n".join(record)
+        record_idx, record = pending[0], [pending[1]]
+    if record:
+        yield record_idx, "\n".join(record)
+
+class LogParser:
+    def __init__(self,model:str="llama3.2:3b",use_rules:bool=True,use_templates:bool=True,cache:Optional[ParseCache]=None,
+                 max_in_flight:int=4,request_timeout:float=120.0,max_retries:int=2,retry_backoff:float=1.0,batch_size:int=1):
+        try:
+            if max_in_flight < 1 or batch_size < 1:
+                raise ValueError("max_in_flight and batch_size must be at least 1")
+            self.model = model
+            # Concurrency and robustness of LLM calls; batch_size > 1 parses several lines per generation
+            self.max_in_flight = max_in_flight
+            self.max_retries = max_retries
+            self.retry_backoff = retry_backoff
+            self.batch_size = batch_size
+            self._stats_lock = threading.Lock()
+            # Deterministic fast path; only lines no rule matches are sent to the LLM
+            self.rule_parser = RuleBasedParser() if use_rules else None
+            # Remaining lines are clustered into templates; the LLM parses one line per template
+            self.template_miner = TemplateMiner() if use_templates else None
+            self.llm_calls = 0
+            # Optional on-disk cache of validated LLM results, keyed by line, model and prompt
+            self.cache = cache
+            # Converts parsed timestamps to epoch nanoseconds so ordering never compares strings
+            self.timestamp_normalizer = TimestampNormalizer()
+            self.ollama_client = ollama.Client(host='http://localhost:11435', timeout=request_timeout)
+            self.ollama_options = ollama.Options(temperature=0.2)
+            self.system_prompt = f"You are an expert in log parsing. You are given a log entry and a pydantic model. Extract and fill the fields of the model with the information from the log entry."
+        except Exception as e:
+            raise RuntimeError(f"Failed to initialize LogParser: {str(e)}")
+        
+    def cache_namespace(self) -> str:
+        """Cache namespace for the current model and prompt; changing either stops older parses from matching"""
+        return make_namespace(self.model, PROMPT_VERSION, self.system_prompt, LOG_PARSE_PROMPT, LOG_BATCH_PARSE_PROMPT)
+
+    def _count_llm_call(self) -> None:
+        with self._stats_lock:
+            self.llm_calls += 1
+
+    def extract_log_info_by_llm(self, log_entry: str) -> LogEntry:
+        """Extract log information using the specified language model"""
+        try:
+            namespace = self.cache_namespace()
+            if self.cache is not None:
+                cached = self.cache.get(log_entry, namespace)
+                if cached is not None:
+                    return cached
+
+            user_prompt = LOG_PARSE_PROMPT.format(log_entry=log_entry)
+            
+            self._count_llm_call()
             response = self.ollama_client.generate(
                 model=self.model,
                 prompt=user_prompt,
@@ -61,6 +178,8 @@ class LogParser:
                 if not all([parsed.timestamp, parsed.message, parsed.level]):
                     raise ValueError("Missing required fields in parsed entry")
                     
+                if self.cache is not None:
+                    self.cache.put(log_entry, namespace, parsed)
                 return parsed
                 
             except Exception as e:
@@ -71,55 +190,115 @@ class LogParser:
         except Exception as e:
             raise RuntimeError(f"Failed to extract log info: {str(e)}")
         
+    def extract_log_batch_by_llm(self, log_entries: list[str]) -> list[LogEntry]:
+        """Extract several log entries with a single generation; the result is aligned with the input"""
+        try:
+            namespace = self.cache_namespace()
+            results: list[Optional[LogEntry]] = [None] * len(log_entries)
+            if self.cache is not None:
+                results = [self.cache.get(log_entry, namespace) for log_entry in log_entries]
+            missing = [pos for pos, entry in enumerate(results) if entry is None]
+            if not missing:
+                return results
+
+            numbered = "\n".join(f"{num}. {log_entries[pos]}" for num, pos in enumerate(missing, start=1))
+            user_prompt = LOG_BATCH_PARSE_PROMPT.format(count=len(missing), log_entries=numbered)
+
+            self._count_llm_call()
+            response = self.ollama_client.generate(
+                model=self.model,
+                prompt=user_prompt,
+                system=self.system_prompt,
+                options=self.ollama_options,
+                format="json"
+            )
+            if not response or not response.response.strip():
+                raise ValueError("Empty response from language model")
+
+            payload = json.loads(response.response)
+            items = payload.get("entries", []) if isinstance(payload, dict) else payload
+            if not isinstance(items, list) or len(items) != len(missing):
+                raise ValueError(f"Expected {len(missing)} entries, got {len(items) if isinstance(items, list) else 0}")
+
+            for pos, item in zip(missing, items):
+                parsed = LogEntry.model_validate({key: str(value) for key, value in item.items()
+                                                  if value is not None and key != "timestamp_ns"})
+                if not all([parsed.timestamp, parsed.message, parsed.level]):
+                    raise ValueError("Missing required fields in parsed entry")
+                results[pos] = parsed
+
+            if self.cache is not None:
+                for pos in missing:
+                    self.cache.put(log_entries[pos], namespace, results[pos])
+            return results
+
+        except Exception as e:
+            raise RuntimeError(f"Failed to extract log batch: {str(e)}")
+
     def parse_log_from_file(self, log_file: str) -> LogChain:
         """Parse log entries from a log file."""
         try:
-            # Temporary extension check for testing
-            if not log_file.endswith((".txt", ".log", ".out", ".err")):
-                raise ValueError("Unsupported file type")
-            
-            with open(log_file, "r") as f:
-                log_data = f.read()
+            log_entries = list(self.iter_log_file(log_file))
             
-            if not log_data.strip():
-                raise ValueError("Empty log file")
+            if not log_entries:
+                raise RuntimeError("No valid log entries found after LLM processing")
             
-            return self.parse_log(log_data)
+            return LogChain(log_chain=log_entries)
             
         except ValueError as e:
             # Re-raise validation errors as-is
             raise e
         except Exception as e:
             raise RuntimeError(f"Failed to parse log file: {str(e)}")
+
+    def iter_log_file(self, log_file: Union[str, TextIO], window_size: int = 512) -> Iterator[LogEntry]:
+        """Stream LogEntry objects from a path or an open text handle without reading the whole file"""
+        if isinstance(log_file, str):
+            # Temporary extension check for testing
+            if not log_file.endswith((".txt", ".log", ".out", ".err")):
+                raise ValueError("Unsupported file type")
+            with open(log_file, "r", errors="replace") as f:
+                yield from self._iter_records(f, window_size, empty_error="Empty log file")
+        else:
+            yield from self._iter_records(log_file, window_size, empty_error="Empty log file")
+
+    def iter_parse_log(self, log_lines: Iterable[str], window_size: int = 512) -> Iterator[LogEntry]:
+        """Stream LogEntry objects from any iterable of lines, e.g. a socket or a decompressing reader"""
+        yield from self._iter_records(log_lines, window_size, empty_error="Empty log data provided")
+
+    def _iter_records(self, log_lines: Iterable[str], window_size: int, empty_error: str) -> Iterator[LogEntry]:
+        # Records are parsed in fixed-size windows: memory stays flat, while templates and the
+        # cache carry over between windows so LLM cost is still paid once per template
+        if window_size < 1:
+            raise ValueError("window_size must be at least 1")
+        window = []
+        seen = 0
+        for record in iter_log_records(log_lines):
+            seen += 1
+            window.append(record)
+            if len(window) >= window_size:
+                yield from (entry for entry in self._parse_lines(window) if entry)
+                window = []
+        if window:
+            yield from (entry for entry in self._parse_lines(window) if entry)
+        if not seen:
+            raise ValueError(empty_error)
+        self._report_stats()
     
     def parse_log(self, log_data: str) -> LogChain:
-        """Parse log entries from a string using LLM"""
+        """Parse log entries from a string, using rules and learned templates before the LLM"""
         try:
             if not log_data:
                 raise ValueError("Empty log data provided")
                 
             log_data_split = log_data.split("\n")
-            log_entries = []
             
             print(f"Processing {len(log_data_split)} log lines")
 
-            for idx, log in enumerate(log_data_split):
-                if not log.strip():
-                    print(f"Skipping empty line {idx+1}")
-                    continue
-                    
-                try:
-                    print(f"\n--- Processing line {idx+1} ---")
-                    #print(f"Original log: {log}")
-                    entry = self.extract_log_info_by_llm(log)
-                    print(f"Parsed entry: {entry.model_dump_json(indent=2)}")
-                    # Store even partial entries for analysis
-                    log_entries.append(entry)
-                    
-                except Exception as e:
-                    print(f"Error processing line {idx+1}: {str(e)}")
-                    continue
-            
+            records = list(iter_log_records(log_data_split))
+            log_entries = [entry for entry in self._parse_lines(records) if entry]
+            self._report_stats()
+
             if not log_entries:
                 raise ValueError("No valid log entries found after LLM processing")
                 
@@ -128,3 +307,114 @@ class LogParser:
         except Exception as e:
             raise RuntimeError(f"Failed to parse log data: {str(e)}")
 
+    def _report_stats(self) -> None:
+        if self.rule_parser:
+            print(f"Rule hit rates: {self.format_hit_rates()}")
+        if self.template_miner:
+            print(f"Templates learned: {len(self.template_miner.clusters)}, LLM calls so far: {self.llm_calls}")
+
+    def _parse_lines(self, records: list[tuple[int, str]]) -> list[Optional[LogEntry]]:
+        """Parse (line number, text) records; the result is aligned with the input and None marks failures"""
+        # Multi-line records (stack traces) are parsed on their first line; the rest joins the message
+        lines = [(idx, record.split("\n", 1)[0]) for idx, record in records]
+        entries: list[Optional[LogEntry]] = [None] * len(lines)
+        clusters = {}
+        llm_pending = []
+
+        # Deterministic rules first, then template assignment for everything they miss
+        for pos, (idx, log) in enumerate(lines):
+            if self.rule_parser:
+                entries[pos] = self.rule_parser.parse(log)
+                if entries[pos]:
+                    continue
+            if self.template_miner:
+                clusters[pos] = self.template_miner.add_log_message(log)
+            else:
+                llm_pending.append(pos)
+
+        # One LLM call per template that has no field mapping yet
+        representatives = {}
+        for pos, cluster in clusters.items():
+            if cluster.slots is None and not cluster.learn_failed and cluster.cluster_id not in representatives:
+                representatives[cluster.cluster_id] = pos
+        learned = self._run_llm_jobs([(pos, *lines[pos]) for pos in representatives.values()])
+        for pos, entry in learned.items():
+            entries[pos] = entry
+            if not entry or not clusters[pos].learn(entry, lines[pos][1]):
+                clusters[pos].learn_failed = True
+
+        # Every other member of a learned template is extracted locally
+        for pos, cluster in clusters.items():
+            if entries[pos]:
+                continue
+            entries[pos] = cluster.extract(lines[pos][1])
+            if not entries[pos]:
+                llm_pending.append(pos)
+
+        for pos, entry in self._run_llm_jobs([(pos, *lines[pos]) for pos in sorted(llm_pending)]).items():
+            entries[pos] = entry
+
+        for pos, (idx, record) in enumerate(records):
+            if entries[pos] and "\n" in record:
+                continuation = record.split("\n", 1)[1]
+                entries[pos].message = f"{entries[pos].message}\n{continuation}"
+
+        self.timestamp_normalizer.normalize([entry for entry in entries if entry])
+        return entries
+
+    def _run_llm_jobs(self, jobs: list[tuple[int, int, str]]) -> dict[int, Optional[LogEntry]]:
+        """Run (position, line number, text) jobs with at most max_in_flight concurrent LLM requests"""
+        if not jobs:
+            return {}
+        groups = [jobs[i:i + self.batch_size] for i in range(0, len(jobs), self.batch_size)]
+        results = {}
+        if self.max_in_flight == 1 or len(groups) == 1:
+            for group in groups:
+                results.update(self._parse_group(group))
+            return results
+
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(groups))) as executor:
+            # map yields in submission order, so results stay aligned with line order
+            for group_result in executor.map(self._parse_group, groups):
+                results.update(group_result)
+        return results
+
+    def _parse_group(self, group: list[tuple[int, int, str]]) -> dict[int, Optional[LogEntry]]:
+        if len(group) > 1:
+            try:
+                entries = self._with_retry(self.extract_log_batch_by_llm, [log for _, _, log in group])
+                return {pos: entry for (pos, _, _), entry in zip(group, entries)}
+            except Exception as e:
+                print(f"Batch of {len(group)} lines failed, parsing individually: {str(e)}")
+        return {pos: self._parse_line_by_llm(idx, log) for pos, idx, log in group}
+
+    def _with_retry(self, func, *args):
+        """Call func, retrying with exponential backoff on failure"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return func(*args)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_backoff * (2 ** attempt)
+                print(f"Retrying in {delay:.1f}s after error: {str(e)}")
+                time.sleep(delay)
+
+    def _parse_line_by_llm(self, idx: int, log: str) -> Optional[LogEntry]:
+        try:
+            print(f"\n--- Processing line {idx+1} ---")
+            #print(f"Original log: {log}")
+            entry = self._with_retry(self.extract_log_info_by_llm, log)
+            print(f"Parsed entry: {entry.model_dump_json(indent=2)}")
+            # Store even partial entries for analysis
+            return entry
+            
+        except Exception as e:
+            print(f"Error processing line {idx+1}: {str(e)}")
+            return None
+
+    def format_hit_rates(self) -> dict[str, float]:
+        """Per-format share of lines parsed without the LLM, plus the LLM fallback share"""
+        if not self.rule_parser:
+            return {}
+        return self.rule_parser.hit_rates()
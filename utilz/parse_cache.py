@@ -0,0 +1,110 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+from models.parsing_data_models import LogEntry
+
+"""Persistent, content-addressed cache of validated LLM parse results"""
+
+
+def normalize_line(log_line: str) -> str:
+    """Collapse whitespace so re-uploads with different line endings or indentation still hit"""
+    return " ".join(log_line.split())
+
+
+def make_namespace(*parts: str) -> str:
+    """Digest of everything that influences the LLM output (model name, prompt text, prompt version)"""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class ParseCache:
+    """SQLite-backed LRU cache mapping (normalized line, namespace) to a LogEntry.
+
+    Namespaces share the cache, so parsers with different models or prompts can use one instance;
+    entries of namespaces no longer in use age out through LRU eviction.
+    """
+
+    def __init__(self, path: str, max_entries: int = 200_000) -> None:
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.path = path
+            self.max_entries = max_entries
+            self.hits = 0
+            self.misses = 0
+            self._lock = threading.Lock()
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS parse_cache ("
+                "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, entry TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_parse_cache_access ON parse_cache(last_access)")
+            self._conn.commit()
+            self._size = self._conn.execute("SELECT COUNT(*) FROM parse_cache").fetchone()[0]
+        except Exception as e:
+            raise RuntimeError(f"Failed to open parse cache: {str(e)}")
+
+    @staticmethod
+    def make_key(log_line: str, namespace: str) -> str:
+        return hashlib.sha256(f"{namespace}\0{normalize_line(log_line)}".encode("utf-8")).hexdigest()
+
+    def get(self, log_line: str, namespace: str) -> Optional[LogEntry]:
+        key = self.make_key(log_line, namespace)
+        with self._lock:
+            row = self._conn.execute("SELECT entry FROM parse_cache WHERE key = ?", (key,)).fetchone()
+            if not row:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE parse_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        try:
+            return LogEntry.model_validate_json(row[0])
+        except Exception:
+            # A schema change made the stored entry invalid; treat it as a miss
+            self.hits -= 1
+            self.misses += 1
+            return None
+
+    def put(self, log_line: str, namespace: str, entry: LogEntry) -> None:
+        key = self.make_key(log_line, namespace)
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO parse_cache (key, namespace, entry, last_access) VALUES (?, ?, ?, ?)",
+                (key, namespace, entry.model_dump_json(), time.time())
+            ).rowcount
+            self._size += inserted
+            if self._size > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        # Evict down to 90% of capacity so eviction does not run on every insert
+        excess = self._size - int(self.max_entries * 0.9)
+        deleted = self._conn.execute(
+            "DELETE FROM parse_cache WHERE key IN "
+            "(SELECT key FROM parse_cache ORDER BY last_access ASC LIMIT ?)", (excess,)
+        ).rowcount
+        self._size -= deleted
+
+    def __len__(self) -> int:
+        return self._size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": self._size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
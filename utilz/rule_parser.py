@@ -0,0 +1,183 @@
+import re
+import json
+from dataclasses import dataclass
+from typing import Callable, Optional
+from models.parsing_data_models import LogEntry
+from core.templates import infer_level
+
+"""Deterministic, regex/grammar based log parsing used in front of the LLM parser"""
+
+LEVELS = r"TRACE|DEBUG|INFO|NOTICE|WARN|WARNING|ERROR|ERR|CRITICAL|CRIT|FATAL|SEVERE|ALERT|EMERG"
+
+# Keys recognised in JSON log lines, in priority order, for every LogEntry field
+JSON_FIELD_ALIASES = {
+    "timestamp": ["timestamp", "@timestamp", "time", "ts", "datetime", "asctime"],
+    "message": ["message", "msg", "@message", "text", "event"],
+    "level": ["level", "levelname", "severity", "log_level", "lvl"],
+    "pid": ["pid", "process", "process_id"],
+    "component": ["component", "logger", "logger_name", "name", "module", "service"],
+    "error_code": ["error_code", "errorCode", "code", "status"],
+    "username": ["username", "user", "user_name"],
+    "ip_address": ["ip_address", "ip", "client_ip", "remote_addr"],
+    "group": ["group"],
+    "trace_id": ["trace_id", "traceId", "trace"],
+    "request_id": ["request_id", "requestId", "req_id"],
+}
+
+IP_PATTERN = re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b")
+KEY_VALUE_PATTERN = re.compile(r"\b(trace_id|request_id|req_id|user|username|pid|error_code)[=:]\s*([\w.\-@]+)", re.IGNORECASE)
+KEY_VALUE_FIELDS = {
+    "trace_id": "trace_id",
+    "request_id": "request_id",
+    "req_id": "request_id",
+    "user": "username",
+    "username": "username",
+    "pid": "pid",
+    "error_code": "error_code",
+}
+
+
+@dataclass
+class ParsingRule:
+    """A named log format: a compiled pattern plus a builder that turns a match into a LogEntry"""
+    name: str
+    matcher: Callable[[str], Optional[dict]]
+
+
+def _regex_matcher(pattern: str) -> Callable[[str], Optional[dict]]:
+    compiled = re.compile(pattern)
+
+    def match(line: str) -> Optional[dict]:
+        found = compiled.match(line)
+        if not found:
+            return None
+        return {key: value for key, value in found.groupdict().items() if value is not None}
+
+    return match
+
+
+def _json_matcher(line: str) -> Optional[dict]:
+    stripped = line.strip()
+    if not stripped.startswith("{"):
+        return None
+    try:
+        data = json.loads(stripped)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    fields = {}
+    for field, aliases in JSON_FIELD_ALIASES.items():
+        for alias in aliases:
+            value = data.get(alias)
+            if value is not None and value != "":
+                fields[field] = value if isinstance(value, str) else json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+                break
+    return fields
+
+
+DEFAULT_RULES = [
+    # [2024-03-20 10:15:23,456] INFO in app: message  (Flask / werkzeug)
+    ParsingRule(
+        name="flask",
+        matcher=_regex_matcher(
+            rf"^\[(?P<timestamp>[^\]]+)\]\s+(?P<level>{LEVELS})\s+in\s+(?P<component>[\w.\-]+):\s*(?P<message>.*)$"
+        ),
+    ),
+    # JSON lines, including the ApplicationLog records emitted by data/log_gen.py
+    ParsingRule(name="json", matcher=_json_matcher),
+    # 2024-03-20 10:15:23,456 - component - LEVEL - message  (python logging)
+    ParsingRule(
+        name="python_logging",
+        matcher=_regex_matcher(
+            rf"^(?P<timestamp>\d{{4}}-\d{{2}}-\d{{2}}[T ]\d{{2}}:\d{{2}}:\d{{2}}(?:[.,]\d+)?)\s+-\s+"
+            rf"(?:(?P<component>[\w.\-]+)\s+-\s+)?(?P<level>{LEVELS})\s+-\s+(?P<message>.*)$"
+        ),
+    ),
+    # Mar 20 10:15:23 host sshd[1234]: message  (RFC 3164 syslog)
+    ParsingRule(
+        name="syslog",
+        matcher=_regex_matcher(
+            r"^(?P<timestamp>[A-Z][a-z]{2}\s+\d{1,2}\s\d{2}:\d{2}:\d{2})\s+(?P<host>[\w.\-]+)\s+"
+            r"(?P<component>[\w.\-/]+)(?:\[(?P<pid>\d+)\])?:\s*(?P<message>.*)$"
+        ),
+    ),
+    # 2024-03-20T10:15:23.456Z [ERROR] [component] message  (generic timestamp + level)
+    ParsingRule(
+        name="timestamp_level",
+        matcher=_regex_matcher(
+            rf"^(?P<timestamp>\d{{4}}-\d{{2}}-\d{{2}}(?:[T ]\d{{2}}:\d{{2}}:\d{{2}}(?:[.,]\d+)?(?:Z|[+-]\d{{2}}:?\d{{2}})?)?)\s+"
+            rf"\[?(?P<level>{LEVELS})\]?:?\s+(?:\[(?P<component>[\w.\-]+)\]:?\s+)?(?P<message>.*)$"
+        ),
+    ),
+]
+
+
+class RuleBasedParser:
+    """Parses log lines with compiled format rules and keeps per-format hit counters"""
+
+    def __init__(self, rules: Optional[list[ParsingRule]] = None) -> None:
+        self.rules = list(rules) if rules is not None else list(DEFAULT_RULES)
+        self.hits = {rule.name: 0 for rule in self.rules}
+        self.misses = 0
+
+    def add_rule(self, rule: ParsingRule, first: bool = True) -> None:
+        """Register an additional format, by default ahead of the built-in ones"""
+        if first:
+            self.rules.insert(0, rule)
+        else:
+            self.rules.append(rule)
+        self.hits.setdefault(rule.name, 0)
+
+    def parse(self, log_line: str) -> Optional[LogEntry]:
+        """Return a LogEntry if any rule matches the line, otherwise None"""
+        for idx, rule in enumerate(self.rules):
+            fields = rule.matcher(log_line)
+            if not fields:
+                continue
+            entry = self._build_entry(fields)
+            if entry is None:
+                continue
+            self.hits[rule.name] += 1
+            # Keep the most recently successful format first; logs are rarely mixed
+            if idx:
+                self.rules.insert(0, self.rules.pop(idx))
+            return entry
+
+        self.misses += 1
+        return None
+
+    def _build_entry(self, fields: dict) -> Optional[LogEntry]:
+        message = str(fields.get("message", "")).strip()
+        timestamp = str(fields.get("timestamp", "")).strip()
+        if not message or not timestamp:
+            return None
+
+        values = {field: str(fields[field]) for field in JSON_FIELD_ALIASES if fields.get(field)}
+        values["message"] = message
+        values["timestamp"] = timestamp
+        # Formats such as syslog carry no level
+        values["level"] = str(fields.get("level") or infer_level(message)).upper()
+
+        for key, value in KEY_VALUE_PATTERN.findall(message):
+            values.setdefault(KEY_VALUE_FIELDS[key.lower()], value)
+        if "ip_address" not in values:
+            ip_match = IP_PATTERN.search(message)
+            if ip_match:
+                values["ip_address"] = ip_match.group(0)
+
+        return LogEntry(**values)
+
+    def reset_stats(self) -> None:
+        self.hits = {rule.name: 0 for rule in self.rules}
+        self.misses = 0
+
+    def hit_rates(self) -> dict[str, float]:
+        """Fraction of lines handled by each format, plus the share that fell back to the LLM"""
+        total = sum(self.hits.values()) + self.misses
+        if not total:
+            return {}
+        rates = {name: count / total for name, count in self.hits.items()}
+        rates["llm_fallback"] = self.misses / total
+        return rates
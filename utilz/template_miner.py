@@ -0,0 +1,188 @@
+from dataclasses import dataclass, field
+from typing import Optional
+from models.parsing_data_models import LogEntry
+from core.templates import WILDCARD, mask_variables
+
+"""Online log template clustering (Drain) so the LLM only parses one representative line per template"""
+
+REQUIRED_FIELDS = ("timestamp", "message", "level")
+EDGE_PUNCTUATION = "[](){}<>,;\"'"
+
+
+def _digits(text: str) -> str:
+    return "".join(ch for ch in text if ch.isdigit())
+
+
+@dataclass
+class FieldSlot:
+    """Location of a LogEntry field inside a template: a token span plus constant prefix/suffix"""
+    start: int
+    end: int
+    prefix: str = ""
+    suffix: str = ""
+    strip_edges: bool = False
+
+    def extract(self, tokens: list[str]) -> Optional[str]:
+        text = " ".join(tokens[self.start:self.end + 1])
+        if self.strip_edges:
+            return text.strip(EDGE_PUNCTUATION) or None
+        if not text.startswith(self.prefix) or not text.endswith(self.suffix):
+            return None
+        value = text[len(self.prefix):len(text) - len(self.suffix)]
+        return value or None
+
+
+@dataclass
+class LogCluster:
+    """A log template and the field mapping learned from its representative line"""
+    cluster_id: int
+    template: list[str]
+    representative: str
+    size: int = 1
+    slots: Optional[dict[str, FieldSlot]] = None
+    learn_failed: bool = False
+
+    @property
+    def template_str(self) -> str:
+        return " ".join(self.template)
+
+    def learn(self, entry: LogEntry, log_line: Optional[str] = None) -> bool:
+        """Locate every field of an LLM-parsed representative entry in the representative's tokens"""
+        if log_line is not None:
+            self.representative = log_line
+        tokens = self.representative.split()
+        slots = {}
+        for name, value in entry.model_dump().items():
+            if not isinstance(value, str) or not value.strip():
+                continue
+            slot = self._locate(tokens, value.strip())
+            if slot is None:
+                if name in REQUIRED_FIELDS:
+                    self.learn_failed = True
+                    return False
+                continue
+            slots[name] = slot
+
+        self.slots = slots
+        self.learn_failed = False
+        return True
+
+    def extract(self, log_line: str) -> Optional[LogEntry]:
+        """Build a LogEntry for another member of this cluster without calling the LLM"""
+        if not self.slots:
+            return None
+        tokens = log_line.split()
+        if len(tokens) != len(self.template):
+            return None
+
+        values = {}
+        for name, slot in self.slots.items():
+            value = slot.extract(tokens)
+            if value is None:
+                if name in REQUIRED_FIELDS:
+                    return None
+                continue
+            values[name] = value
+        try:
+            return LogEntry(**values)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _locate(tokens: list[str], value: str) -> Optional[FieldSlot]:
+        # 1. A single token equal to the value once edge punctuation is removed
+        for idx, token in enumerate(tokens):
+            if token.strip(EDGE_PUNCTUATION) == value:
+                prefix_len = token.index(value)
+                return FieldSlot(idx, idx, token[:prefix_len], token[prefix_len + len(value):])
+
+        # 2. The shortest token span containing the value verbatim
+        best = None
+        for start in range(len(tokens)):
+            for end in range(start, len(tokens)):
+                text = " ".join(tokens[start:end + 1])
+                pos = text.find(value)
+                if pos == -1:
+                    continue
+                if best is None or end - start < best.end - best.start:
+                    best = FieldSlot(start, end, text[:pos], text[pos + len(value):])
+                break
+        if best is not None:
+            return best
+
+        # 3. Reformatted values (the LLM normalises timestamps to ISO 8601): same digits, same span
+        value_digits = _digits(value)
+        if len(value_digits) >= 4:
+            for start in range(len(tokens)):
+                text = ""
+                for end in range(start, len(tokens)):
+                    text = f"{text} {tokens[end]}" if text else tokens[end]
+                    text_digits = _digits(text)
+                    if text_digits == value_digits:
+                        return FieldSlot(start, end, strip_edges=True)
+                    if not value_digits.startswith(text_digits):
+                        break
+        return None
+
+
+@dataclass
+class _TreeNode:
+    children: dict = field(default_factory=dict)
+    clusters: list = field(default_factory=list)
+
+
+class TemplateMiner:
+    """Drain-style fixed-depth prefix tree that groups log lines into templates online"""
+
+    def __init__(self, depth: int = 4, similarity_threshold: float = 0.5, max_children: int = 100) -> None:
+        if depth < 1:
+            raise ValueError("Template tree depth must be at least 1")
+        self.depth = depth
+        self.similarity_threshold = similarity_threshold
+        self.max_children = max_children
+        self.root = _TreeNode()
+        self.clusters: list[LogCluster] = []
+
+    def add_log_message(self, log_line: str) -> LogCluster:
+        """Assign a line to the best matching template, creating or generalising templates as needed"""
+        tokens = mask_variables(log_line).split()
+        leaf = self._descend(tokens)
+
+        cluster = self._best_match(leaf.clusters, tokens)
+        if cluster is None:
+            cluster = LogCluster(cluster_id=len(self.clusters), template=tokens, representative=log_line)
+            leaf.clusters.append(cluster)
+            self.clusters.append(cluster)
+        else:
+            cluster.size += 1
+            cluster.template = [
+                template_token if template_token == token else WILDCARD
+                for template_token, token in zip(cluster.template, tokens)
+            ]
+        return cluster
+
+    def _descend(self, tokens: list[str]) -> _TreeNode:
+        # First level keys on token count, following levels on the leading tokens
+        node = self.root.children.setdefault(len(tokens), _TreeNode())
+        for token in tokens[:self.depth]:
+            key = WILDCARD if WILDCARD in token else token
+            if key not in node.children:
+                if len(node.children) >= self.max_children:
+                    key = WILDCARD
+                node = node.children.setdefault(key, _TreeNode())
+            else:
+                node = node.children[key]
+        return node
+
+    def _best_match(self, clusters: list[LogCluster], tokens: list[str]) -> Optional[LogCluster]:
+        best, best_similarity, best_wildcards = None, -1.0, -1
+        for cluster in clusters:
+            # Masked variables on both sides count as a match; a generalised position does not
+            same = sum(1 for template_token, token in zip(cluster.template, tokens) if template_token == token)
+            wildcards = cluster.template.count(WILDCARD)
+            similarity = same / len(tokens) if tokens else 1.0
+            if similarity > best_similarity or (similarity == best_similarity and wildcards > best_wildcards):
+                best, best_similarity, best_wildcards = cluster, similarity, wildcards
+        if best is not None and best_similarity >= self.similarity_threshold:
+            return best
+        return None
@@ -0,0 +1,127 @@
+import re
+import numpy as np
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+from models.parsing_data_models import LogEntry
+
+"""Bulk conversion of free-form log timestamps to UTC epoch nanoseconds"""
+
+# Sentinel for timestamps that could not be parsed (same value NumPy uses for NaT)
+MISSING_NS = np.iinfo(np.int64).min
+
+# Naive ISO-like strings NumPy's datetime64 parser handles directly, after canonicalization
+ISO_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,9})?)?)?$")
+FRACTION_COMMA = re.compile(r"(\d{2}:\d{2}:\d{2}),(\d+)")
+EPOCH_PATTERN = re.compile(r"^\d{10}(?:\d{3}|\d{6}|\d{9})?(?:\.\d+)?$")
+
+STRPTIME_FORMATS = [
+    "%Y-%m-%d %H:%M:%S.%f%z",
+    "%Y-%m-%d %H:%M:%S%z",
+    "%Y/%m/%d %H:%M:%S.%f",
+    "%Y/%m/%d %H:%M:%S",
+    "%d/%b/%Y:%H:%M:%S %z",   # Apache / nginx access logs
+    "%d/%b/%Y:%H:%M:%S",
+    "%b %d %H:%M:%S",         # syslog, no year
+    "%b %d %Y %H:%M:%S",
+    "%a %b %d %H:%M:%S %Y",   # ctime
+    "%d-%m-%Y %H:%M:%S",
+    "%m/%d/%Y %H:%M:%S",
+]
+
+
+def canonicalize(timestamp: str) -> str:
+    """Strip surrounding brackets and use '.' for fractional seconds"""
+    text = timestamp.strip().strip("[]()<>")
+    return FRACTION_COMMA.sub(r"\1.\2", text)
+
+
+class TimestampNormalizer:
+    """Vectorized timestamp parser with a cached strptime format detector for everything else"""
+
+    def __init__(self, default_year: Optional[int] = None) -> None:
+        # Year assumed for formats without one (syslog); naive timestamps are taken as UTC
+        self.default_year = default_year or datetime.now(timezone.utc).year
+        self.detected_format: Optional[str] = None
+
+    def to_epoch_ns(self, timestamps: Sequence[str]) -> np.ndarray:
+        """Convert timestamps to an int64 array of epoch nanoseconds; unparseable values become MISSING_NS"""
+        result = np.full(len(timestamps), MISSING_NS, dtype=np.int64)
+        canonical = [canonicalize(ts or "") for ts in timestamps]
+
+        iso_positions = [pos for pos, text in enumerate(canonical) if ISO_PATTERN.match(text)]
+        if iso_positions:
+            # One NumPy call for the common case instead of a strptime per entry
+            try:
+                values = np.array([canonical[pos] for pos in iso_positions], dtype="datetime64[ns]")
+                result[iso_positions] = values.astype(np.int64)
+            except ValueError:
+                # An ISO-shaped but invalid value (day or hour out of range) fails the whole batch;
+                # convert one at a time so only that entry stays MISSING_NS
+                iso_positions = []
+
+        if len(iso_positions) < len(canonical):
+            iso_set = set(iso_positions)
+            for pos, text in enumerate(canonical):
+                if pos not in iso_set:
+                    parsed = self._parse_one(text)
+                    if parsed is not None:
+                        result[pos] = parsed
+        return result
+
+    def normalize(self, entries: Sequence[LogEntry]) -> np.ndarray:
+        """Fill LogEntry.timestamp_ns for every entry and return the values as an array"""
+        values = self.to_epoch_ns([entry.timestamp for entry in entries])
+        for entry, value in zip(entries, values.tolist()):
+            entry.timestamp_ns = value if value != MISSING_NS else None
+        return values
+
+    def _parse_one(self, text: str) -> Optional[int]:
+        if not text:
+            return None
+        if EPOCH_PATTERN.match(text):
+            return self._epoch_to_ns(text)
+
+        if self.detected_format:
+            parsed = self._strptime(text, self.detected_format)
+            if parsed is not None:
+                return parsed
+
+        try:
+            return self._datetime_to_ns(datetime.fromisoformat(text.replace("Z", "+00:00")))
+        except ValueError:
+            pass
+
+        for fmt in STRPTIME_FORMATS:
+            parsed = self._strptime(text, fmt)
+            if parsed is not None:
+                # Logs rarely mix formats; try this one first from now on
+                self.detected_format = fmt
+                return parsed
+        return None
+
+    def _strptime(self, text: str, fmt: str) -> Optional[int]:
+        try:
+            if "%Y" not in fmt:
+                parsed = datetime.strptime(f"{self.default_year} {text}", f"%Y {fmt}")
+            else:
+                parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            return None
+        return self._datetime_to_ns(parsed)
+
+    @staticmethod
+    def _datetime_to_ns(value: datetime) -> int:
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        delta = value - datetime(1970, 1, 1, tzinfo=timezone.utc)
+        return (delta.days * 86_400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1_000
+
+    @staticmethod
+    def _epoch_to_ns(text: str) -> int:
+        whole, _, fraction = text.partition(".")
+        # 10 digits are seconds, 13 milliseconds, 16 microseconds, 19 nanoseconds
+        scale = 10 ** (19 - len(whole))
+        value = int(whole) * scale
+        if fraction and scale > 1:
+            value += int(float(f"0.{fraction}") * scale)
+        return value